@@ -1,11 +1,29 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+import orjson
 import os
-import pandas as pd
+import psycopg2
+import pyarrow as pa
+import time
 
-from rag_model import RAGModel  
-
-app = FastAPI()
+from db_pool import DBPool, PoolTimeout
+from fast_path import FastPath
+from metrics import REGISTRY, REQUEST_SECONDS, RESPONSE_BYTES, stage
+from profile_store import ARROW_STREAM, PROFILE_COLUMNS, ProfileNotFound, ProfileStore, encode_batch
+from pagination import (
+    SECRET_CONFIGURED, InvalidPageToken, next_state, page_query, plan_paging, probe_query, read_token, sign_token,
+)
+from rag_model import LLMTimeout, RAGModel
+from result_cache import DataVersion, ResultCache, sql_fingerprint
+from singleflight import SingleFlight
+from sql_cache import SentenceEmbedder, SQLCache, normalize_question
+from sql_guard import RejectedQuery, SQLGuard
+from stats import LatencyWindow
 
 # -------------------------
 # Database connection parameters
@@ -18,64 +36,305 @@ db_params = {
     'port': '5432'
 }
 
+# Shared, bounded connection pool (sizes and timeouts overridable via env); the
+# API only reads, so every transaction is READ ONLY
+db_pool = DBPool(
+    db_params,
+    minconn=int(os.getenv("DB_POOL_MIN", 1)),
+    maxconn=int(os.getenv("DB_POOL_MAX", 10)),
+    acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", 5.0)),
+    statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 15_000)),
+    read_only=True,
+)
+
+# Question -> SQL cache, persisted across restarts; SQL_CACHE_SEMANTIC=0 keeps it exact-only
+sql_cache = SQLCache(
+    path=os.getenv("SQL_CACHE_PATH", "sql_cache.json"),
+    ttl=float(os.getenv("SQL_CACHE_TTL", 24 * 3600)),
+    embed=SentenceEmbedder() if os.getenv("SQL_CACHE_SEMANTIC", "1") != "0" else None,
+)
+
+# Query results, dropped whenever the loader bumps data_version
+data_version = DataVersion(db_pool, max_age=float(os.getenv("DATA_VERSION_MAX_AGE", 5.0)))
+result_cache = ResultCache(budget_bytes=int(os.getenv("RESULT_CACHE_MB", 256)) << 20)
+
+# Memory-mapped per-profile depth series with an LRU of open tables
+profile_store = ProfileStore(
+    os.getenv("PROFILES_DATA_DIR", "./profiles_data"),
+    max_entries=int(os.getenv("PROFILE_CACHE_ENTRIES", 256)),
+    workers=int(os.getenv("PROFILE_BATCH_WORKERS", 8)),
+)
+
+# Structured questions are answered by the rule-based fast path; FAST_PATH=0 sends everything to the LLM
+fast_path = FastPath() if os.getenv("FAST_PATH", "1") != "0" else None
+
+# Static checks, LIMIT and EXPLAIN thresholds applied to all SQL before it runs
+sql_guard = SQLGuard(
+    db_pool,
+    max_rows=int(os.getenv("SQL_MAX_ROWS", 100)),
+    max_cost=float(os.getenv("SQL_MAX_COST", 500_000)),
+    max_plan_rows=int(os.getenv("SQL_MAX_PLAN_ROWS", 5_000_000)),
+)
+
 # Initialize RAG Model
-rag_model = RAGModel(db_params)
+rag_model = RAGModel(db_params, pool=db_pool, sql_cache=sql_cache, result_cache=result_cache,
+                     data_version=data_version, fast_path=fast_path, guard=sql_guard,
+                     llm_timeout=float(os.getenv("LLM_TIMEOUT", 20.0)))
+
+# Concurrent /chat requests for the same question (or the same SQL) share one computation
+coalesce = os.getenv("SINGLEFLIGHT", "1") != "0"
+generate_flight = SingleFlight(enabled=coalesce)
+query_flight = SingleFlight(enabled=coalesce)
+
+# End-to-end /chat latency by where the SQL came from
+chat_latency = {source: LatencyWindow() for source in ("fast_path", "sql_cache", "llm")}
+
+# Point-in-time values read when /metrics is scraped
+REGISTRY.gauge("argo_db_pool_in_use", "Database connections checked out", lambda: db_pool.in_use)
+REGISTRY.gauge("argo_db_pool_wait_timeouts", "Pool checkouts that timed out since start", lambda: db_pool.timeouts)
+REGISTRY.gauge("argo_singleflight_in_flight", "Distinct /chat computations running",
+               lambda: generate_flight.stats()["in_flight"] + query_flight.stats()["in_flight"])
+REGISTRY.gauge("argo_data_version", "Current data version of the result cache", data_version.current)
+
+@asynccontextmanager
+async def lifespan(app):
+    if not SECRET_CONFIGURED:
+        # uvicorn/gunicorn read WEB_CONCURRENCY as the worker count
+        if int(os.getenv("WEB_CONCURRENCY", 1)) > 1:
+            raise RuntimeError("PAGE_TOKEN_SECRET must be set when running more than one worker")
+        print("⚠️ PAGE_TOKEN_SECRET not set; page tokens are only valid in this process")
+    try:
+        db_pool.open()
+    except psycopg2.OperationalError as e:
+        # Keep serving; the pool retries on first use
+        print(f"⚠️ Database not reachable at startup: {e}")
+    data_version.start()
+    yield
+    data_version.stop()
+    sql_cache.save()
+    db_pool.close()
+
+app = FastAPI(lifespan=lifespan)
+
+MAX_PAGE_SIZE = 10_000
+STREAM_BATCH_ROWS = 1_000
+MAX_BATCH_PROFILES = 1_000
 
 # -------------------------
 # Request Model
 # -------------------------
 class Query(BaseModel):
     question: str
+    # Paging and streaming cover the guarded SQL, whose LIMIT is capped at SQL_MAX_ROWS
+    # (default 100); raise SQL_MAX_ROWS to page or stream through larger results
+    # Return the first page_size rows and a next_page token instead of everything
+    page_size: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE)
+    # Stream NDJSON from a server-side cursor: a header line, then one JSON array per row
+    stream: bool = False
+
+class ProfileBatch(BaseModel):
+    profile_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_PROFILES)
+    # PRES is always included
+    variables: List[Literal["PRES", "TEMP", "PSAL"]] = PROFILE_COLUMNS
+    pressure_min: Optional[float] = None
+    pressure_max: Optional[float] = None
+    # Downsample each profile to at most max_levels levels
+    max_levels: Optional[int] = Field(None, ge=2)
+    method: Literal["decimate", "bin"] = "decimate"
+
+# -------------------------
+# Serialization
+# -------------------------
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+def _dumps(content):
+    return orjson.dumps(content, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def json_response(content, status_code=200, endpoint="chat"):
+    with stage("json_encode"):
+        body = _dumps(content)
+    RESPONSE_BYTES.observe(len(body), endpoint=endpoint)
+    return Response(body, status_code=status_code, media_type="application/json")
+
+def _error_response(question, error):
+    if question is not None:
+        # Don't keep serving SQL that fails
+        sql_cache.discard(question)
+    return json_response({
+        "response": f"I'm sorry, I couldn't process that query. Database error: {error}"
+    })
 
 # -------------------------
 # Chat Endpoint
 # -------------------------
 @app.post("/chat")
-def chat(q: Query):
+async def chat(q: Query):
     """Translates user query into SQL and returns results from PostgreSQL."""
-    sql_query = rag_model.generate_sql(q.question)
+    start = time.perf_counter()
+    try:
+        sql_query, source = await generate_flight.do(
+            normalize_question(q.question), lambda: rag_model.agenerate(q.question)
+        )
+    except RejectedQuery as e:
+        return json_response({
+            "response": f"I'm sorry, I couldn't build a safe query for that question: {e}"
+        })
+    except LLMTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
 
     if not sql_query:
         raise HTTPException(status_code=500, detail="Failed to generate SQL query.")
 
-    print(f"Generated SQL: {sql_query}")
+    print(f"Generated SQL ({source}): {sql_query}")
 
-    results = rag_model.execute_sql(sql_query)
-    if "error" in results:
-        return {
-            "response": f"I'm sorry, I couldn't process that query. Database error: {results['error']}"
-        }
+    if q.stream:
+        # Time to the start of the stream
+        response = StreamingResponse(_stream_results(q.question, sql_query), media_type="application/x-ndjson")
+    elif q.page_size:
+        response = await run_in_threadpool(_page, {"sql": sql_query}, q.page_size, q.question)
+    else:
+        results = await query_flight.do(
+            sql_fingerprint(sql_query), lambda: run_in_threadpool(rag_model.execute_sql, sql_query)
+        )
+        if "error" in results:
+            response = _error_response(q.question, results["error"])
+        else:
+            response = json_response({
+                "response": "Here are the profiles that match your request:",
+                "results": results
+            })
+    elapsed = time.perf_counter() - start
+    chat_latency[source].record(elapsed * 1000)
+    REQUEST_SECONDS.observe(elapsed, endpoint="chat", source=source)
+    return response
 
-    return {
+@app.get("/chat/page")
+def chat_page(token: str, page_size: Optional[int] = None):
+    """Next page of a paginated /chat answer; reruns only the SQL, never the LLM."""
+    try:
+        state = read_token(token)
+    except InvalidPageToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page_size = min(max(page_size or state["page_size"], 1), MAX_PAGE_SIZE)
+    return _page(state, page_size)
+
+def _page(state, page_size, question=None):
+    """One page via keyset (or offset) pagination plus the token for the next."""
+    try:
+        if "key" not in state:
+            columns, _ = db_pool.fetch(*probe_query(state["sql"]))
+            sql, key = plan_paging(state["sql"], columns)
+            state = {**state, "sql": sql, "key": key}
+        columns, rows = db_pool.fetch(*page_query(state, page_size))
+    except (psycopg2.Error, PoolTimeout) as e:
+        return _error_response(question, e)
+
+    following = next_state(state, columns, rows, page_size)
+    return json_response({
         "response": "Here are the profiles that match your request:",
-        "results": results
-    }
+        "results": [dict(zip(columns, row)) for row in rows[:page_size]],
+        "next_page": sign_token({**following, "page_size": page_size}) if following else None,
+    }, endpoint="chat_page")
+
+def _stream_results(question, sql_query):
+    batches = rag_model.stream_sql(sql_query, batch_size=STREAM_BATCH_ROWS)
+    try:
+        columns, rows = next(batches, ([], []))
+        yield _dumps({"response": "Here are the profiles that match your request:", "columns": columns}) + b"\n"
+        while rows:
+            yield b"".join(_dumps(row) + b"\n" for row in rows)
+            columns, rows = next(batches, (columns, []))
+    except (psycopg2.Error, PoolTimeout) as e:
+        sql_cache.discard(question)
+        yield _dumps({"error": str(e)}) + b"\n"
+    finally:
+        batches.close()
 
 # -------------------------
 # Profiles Endpoint
 # -------------------------
 @app.get("/profiles/{profile_id}")
-def get_profile_data(profile_id: str):
+def get_profile_data(profile_id: str, request: Request, orient: str = "columns"):
     """
     Fetches full depth-series (PRES, TEMP, PSAL) for a given profile from Parquet file.
     Assumes parquet files are saved in ./profiles_data/{profile_id}.parquet
+
+    Returns column arrays as JSON ({"PRES": [...], ...}), or an Arrow IPC
+    stream when the client sends Accept: application/vnd.apache.arrow.stream.
+    orient=records gives the older list-of-rows JSON.
     """
+    start = time.perf_counter()
+    arrow = ARROW_STREAM in request.headers.get("accept", "")
+    representation = "arrow" if arrow else ("records" if orient == "records" else "json")
     try:
-        parquet_dir = "./profiles_data"
-        parquet_file = os.path.join(parquet_dir, f"{profile_id}.parquet")
+        with stage("profile_read"):
+            entry = profile_store.get(profile_id)
+    except ProfileNotFound:
+        raise HTTPException(status_code=404, detail=f"Profile data not found for ID {profile_id}")
+    except (OSError, pa.ArrowException) as e:
+        raise HTTPException(status_code=500, detail=f"Error reading profile data: {str(e)}")
 
-        if not os.path.exists(parquet_file):
-            raise HTTPException(status_code=404, detail=f"Profile data not found for ID {profile_id}")
+    etag = entry.etag(representation)
+    headers = {"ETag": etag, "Vary": "Accept"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
 
-        df = pd.read_parquet(parquet_file)
+    with stage("profile_encode"):
+        body = profile_store.encode(entry, profile_id, representation)
+    RESPONSE_BYTES.observe(len(body), endpoint="profiles")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="profiles", source=representation)
+    return Response(body, media_type=ARROW_STREAM if arrow else "application/json", headers=headers)
 
-        # Select only depth-series columns if present
-        depth_series = df[["PRES", "TEMP", "PSAL"]].to_dict(orient="records")
+@app.post("/profiles/batch")
+def get_profiles_batch(batch: ProfileBatch, request: Request):
+    """
+    Depth series for many profiles in one columnar payload, restricted to
+    the requested variables and pressure range and optionally downsampled.
+    JSON maps profile_id to column arrays; with Accept:
+    application/vnd.apache.arrow.stream it is one Arrow table with a
+    profile_id column. Unknown ids are listed under "missing".
+    """
+    start = time.perf_counter()
+    arrow = ARROW_STREAM in request.headers.get("accept", "")
+    try:
+        with stage("profile_batch_read"):
+            tables, missing = profile_store.select_many(
+                list(dict.fromkeys(batch.profile_ids)),
+                variables=batch.variables,
+                pressure_range=(batch.pressure_min, batch.pressure_max),
+                max_levels=batch.max_levels,
+                method=batch.method,
+            )
+    except (OSError, pa.ArrowException) as e:
+        raise HTTPException(status_code=500, detail=f"Error reading profile data: {str(e)}")
+    with stage("profile_encode"):
+        body = encode_batch(tables, missing, "arrow" if arrow else "json")
+    RESPONSE_BYTES.observe(len(body), endpoint="profiles_batch")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="profiles_batch", source="arrow" if arrow else "json")
+    return Response(body, media_type=ARROW_STREAM if arrow else "application/json")
 
-        return {
-            "profile_id": profile_id,
-            "depth_series": depth_series
-        }
+# -------------------------
+# Stats & Metrics Endpoints
+# -------------------------
+@app.get("/metrics")
+def metrics():
+    """Stage histograms, cache and LLM counters in Prometheus text format."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error reading profile data: {str(e)}")
+@app.get("/stats")
+def stats():
+    """/chat, SQL generation and connection-pool latencies (rolling p50/p99) and hit rates."""
+    return {
+        "chat": {source: window.summary() for source, window in chat_latency.items()},
+        "sql_generation": rag_model.stats(),
+        "singleflight": {"generate": generate_flight.stats(), "query": query_flight.stats()},
+        "db_pool": db_pool.stats(),
+        "sql_cache": sql_cache.stats(),
+        "result_cache": {**result_cache.stats(), "data_version": data_version.current()},
+        "profile_store": profile_store.stats(),
+    }
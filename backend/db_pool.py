@@ -0,0 +1,172 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from metrics import ROWS_RETURNED, STAGE_SECONDS, stage
+from stats import LatencyWindow
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within acquire_timeout."""
+
+
+class DBPool:
+    """
+    Bounded, thread-safe PostgreSQL connection pool.
+
+    Callers block (up to acquire_timeout) when all maxconn connections are
+    in use instead of opening more. Connections idle for longer than
+    health_check_after seconds are pinged before being handed out, and
+    broken ones are replaced. Every query runs with a statement_timeout.
+    With read_only, connections run every transaction READ ONLY, so even a
+    function call inside a SELECT cannot write.
+    """
+
+    def __init__(self, db_params, minconn=1, maxconn=10, acquire_timeout=5.0,
+                 statement_timeout_ms=15_000, health_check_after=30.0, read_only=False):
+        self.db_params = db_params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_after = health_check_after
+        self.read_only = read_only
+
+        self._pool = None
+        self._open_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._count_lock = threading.Lock()
+        self.in_use = 0
+        self.timeouts = 0
+        self.replaced = 0
+        self.wait = LatencyWindow()
+        self.query = LatencyWindow()
+
+    def open(self):
+        with self._open_lock:
+            if self._pool is None:
+                self._pool = pg_pool.ThreadedConnectionPool(self.minconn, self.maxconn, **self.db_params)
+
+    def close(self):
+        with self._open_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    @contextmanager
+    def connection(self):
+        """Check out a healthy connection; it is rolled back and returned on exit."""
+        self.open()
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._count_lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No database connection free after {self.acquire_timeout}s")
+        try:
+            conn = self._pool.getconn()
+            while not self._healthy(conn):
+                self._discard(conn)
+                self.replaced += 1
+                conn = self._pool.getconn()
+            if self.read_only and not conn.readonly:
+                # Sent as BEGIN READ ONLY from the next transaction on
+                conn.readonly = True
+        except Exception:
+            self._slots.release()
+            raise
+        waited = time.perf_counter() - start
+        self.wait.record(waited * 1000)
+        STAGE_SECONDS.observe(waited, stage="pool_wait")
+
+        with self._count_lock:
+            self.in_use += 1
+        try:
+            yield conn
+        finally:
+            with self._count_lock:
+                self.in_use -= 1
+            try:
+                if not conn.closed:
+                    conn.rollback()
+            except psycopg2.Error:
+                pass
+            if conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+            self._slots.release()
+
+    def _set_timeout(self, cur, timeout_ms):
+        cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms or self.statement_timeout_ms),))
+
+    def fetch(self, sql, params=None, timeout_ms=None):
+        """Run a query and return (columns, rows)."""
+        with self.connection() as conn, conn.cursor() as cur:
+            self._set_timeout(cur, timeout_ms)
+            with stage("query") as timer:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+            self.query.record((time.perf_counter() - timer.start) * 1000)
+            ROWS_RETURNED.observe(len(rows))
+            return [desc[0] for desc in cur.description], rows
+
+    def stream(self, sql, params=None, batch_size=1000, timeout_ms=None):
+        """
+        Run a query through a named server-side cursor and yield
+        (columns, rows) batches of up to batch_size rows. The connection
+        stays checked out until the generator is exhausted or closed.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self._set_timeout(cur, timeout_ms)
+            start, total = time.perf_counter(), 0
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                cur.itersize = batch_size
+                cur.execute(sql, params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    total += len(rows)
+                    yield [desc[0] for desc in cur.description], rows
+            elapsed = time.perf_counter() - start
+            self.query.record(elapsed * 1000)
+            STAGE_SECONDS.observe(elapsed, stage="query_stream")
+            ROWS_RETURNED.observe(total)
+
+    def stats(self):
+        return {
+            "open": self._pool is not None,
+            "read_only": self.read_only,
+            "maxconn": self.maxconn,
+            "in_use": self.in_use,
+            "timeouts": self.timeouts,
+            "replaced": self.replaced,
+            "wait": self.wait.summary(),
+            "query": self.query.summary(),
+        }
@@ -0,0 +1,322 @@
+import math
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from psycopg2.extensions import adapt
+
+from sql_cache import normalize_question
+from stats import LatencyWindow
+
+# Recognized phrases are cut out of the question; whatever is left must
+# consist of these words, otherwise the question goes to the LLM
+FILLER_WORDS = {
+    "show", "me", "list", "find", "get", "give", "display", "return", "fetch", "search", "look",
+    "all", "any", "every", "the", "a", "an", "some", "please", "can", "could", "you", "i", "want",
+    "profiles", "profile", "floats", "float", "argo", "data", "records", "observations",
+    "in", "inside", "within", "from", "of", "during", "for", "on", "at", "by",
+    "which", "what", "where", "were", "are", "was", "is", "there", "that", "and", "with",
+    "ocean", "oceans", "sea", "region", "area", "basin",
+    "recorded", "collected", "taken", "made", "measured", "observed", "available",
+}
+
+_NUM = r"[-+]?\d+(?:\.\d+)?"
+_COORD = rf"({_NUM})\s*(?:°|º|deg(?:rees?)?)?\s*([nsew])\b"
+_DATE = r"\d{4}-\d{2}-\d{2}"
+_YEAR = r"(?:199\d|20\d\d)"
+_UNIT = r"(?:m|meters?|metres?|dbar|db|decibars?)"
+_MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+           "august", "september", "october", "november", "december"]
+# Ocean names as the loader stores them (values of db/load_to_postgres.py OCEAN_MAP)
+OCEAN_NAMES = ("Atlantic", "Indian", "Pacific", "Southern", "Arctic")
+_OCEANS = {name.lower(): name for name in OCEAN_NAMES}
+_FLAGS = {
+    "oxygen": "has_doxy", "dissolved oxygen": "has_doxy", "doxy": "has_doxy",
+    "chlorophyll": "has_chla", "chla": "has_chla", "nitrate": "has_nitrate",
+    "turbidity": "has_turbidity", "salinity": "has_psal", "psal": "has_psal",
+}
+_KM_PER_DEGREE = 111.32
+# Radius unit (by first letter: km/kilometres, nm/nautical miles, mi/miles) -> km
+_RADIUS_UNITS = {"k": 1.0, "n": 1.852, "m": 1.609344}
+
+_RADIUS = re.compile(
+    rf"\bwithin\s+({_NUM})\s*(km|kilomet(?:er|re)s?|nm|nautical miles?|mi|miles?)\b"
+)
+_NEAR = re.compile(rf"\b(?:near|around|close to|of|at)\s+{_COORD}\s*(?:,|and|/)?\s*{_COORD}")
+_COORD_RANGE = re.compile(rf"\b(?:between|from)\s+{_COORD}\s*(?:and|to|-)\s*{_COORD}")
+_AXIS_RANGE = re.compile(
+    rf"\b(lat|latitudes?|lon|long|longitudes?)\s+(?:between|from)?\s*({_NUM})\s*(?:and|to)\s*({_NUM})\b"
+)
+# Strict wording gives strict operators; "below", "under" and "above" can mean either
+# direction for depths, so those questions are left to the LLM
+_DEPTH_WORDS = {
+    "deeper than": ">", "more than": ">", "greater than": ">", "exceeding": ">", "beyond": ">",
+    "over": ">", ">": ">",
+    "at least": ">=", "reaching": ">=", "down to": ">=", ">=": ">=",
+    "shallower than": "<", "less than": "<", "<": "<",
+    "at most": "<=", "no deeper than": "<=", "<=": "<=",
+}
+_DEPTH = re.compile(
+    r"\b(?:(?:max(?:imum)?\s+)?(?:depth|pressure)s?\s*)?("
+    + "|".join(re.escape(w) for w in sorted(_DEPTH_WORDS, key=len, reverse=True)) + ")"
+    + rf"\s*({_NUM})\s*{_UNIT}\b(?:\s+deep)?"
+)
+_DATE_RANGE = re.compile(rf"\b(?:between|from)\s+({_DATE}|{_YEAR})\s+(?:and|to|until)\s+({_DATE}|{_YEAR})\b")
+_YEAR_SPAN = re.compile(rf"\b({_YEAR})\s*(?:-|–|to)\s*({_YEAR})\b")
+_DATE_BOUND = re.compile(rf"\b(since|after|from|before|until|till|up to)\s+({_DATE}|{_YEAR})\b")
+_MONTH = re.compile(rf"\b({'|'.join(_MONTHS)})\s+({_YEAR})\b")
+_DAY = re.compile(rf"\b({_DATE})\b")
+_SINGLE_YEAR = re.compile(rf"\b({_YEAR})\b")
+_OCEAN = re.compile(rf"\b({'|'.join(_OCEANS)})\b")
+_FLAG = re.compile(
+    rf"\b(?:with|having|that have|containing|measuring)\s+({'|'.join(sorted(_FLAGS, key=len, reverse=True))})"
+    r"(?:\s+(?:data|measurements|sensors?|values|observations))?\b"
+)
+_COUNT = re.compile(r"\b(?:how many|count(?: of)?|number of)\b")
+
+
+# Both bounds of a west > east longitude range must be at least this far from
+# Greenwich for it to count as crossing the antimeridian
+ANTIMERIDIAN_MIN_LON = 90.0
+
+
+class _Unsure(Exception):
+    """Raised while parsing when a phrase is recognized but doesn't make sense."""
+
+
+def _signed(value, hemisphere):
+    value = float(value)
+    return -abs(value) if hemisphere in "sw" else value
+
+
+def _axis(hemisphere):
+    return "lat" if hemisphere in "ns" else "lon"
+
+
+def _day(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise _Unsure(text)
+
+
+def _year(text):
+    return datetime(int(text), 1, 1, tzinfo=timezone.utc)
+
+
+def _period(text):
+    """[start, end) covered by a YYYY or YYYY-MM-DD literal."""
+    if len(text) == 4:
+        return _year(text), _year(int(text) + 1)
+    start = _day(text)
+    return start, start + timedelta(days=1)
+
+
+def _month(name, year):
+    month = _MONTHS.index(name) + 1
+    start = datetime(int(year), month, 1, tzinfo=timezone.utc)
+    end = datetime(int(year) + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+class _Question:
+    """The question text with recognized phrases blanked out as they are consumed."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def take(self, pattern):
+        matches = list(pattern.finditer(self.text))
+        for m in reversed(matches):
+            self.text = self.text[:m.start()] + " " + self.text[m.end():]
+        return matches
+
+    def leftover(self):
+        return re.findall(r"[a-z]+|\d+(?:\.\d+)?|[^\sa-z\d,.;:]", self.text)
+
+
+def parse_question(question):
+    """
+    Constraints recognized in question as a dict (oceans, start, end, lat,
+    lon, near, depth, flags, count), or None if anything in it is not
+    understood with confidence.
+    """
+    q = _Question(normalize_question(question).replace("’", "'"))
+    parsed = {}
+    try:
+        radius = q.take(_RADIUS)
+        for m in q.take(_NEAR):
+            (a, ha, b, hb) = m.groups()
+            if {_axis(ha), _axis(hb)} != {"lat", "lon"} or "near" in parsed:
+                raise _Unsure(m.group(0))
+            coords = {_axis(ha): _signed(a, ha), _axis(hb): _signed(b, hb)}
+            parsed["near"] = (coords["lat"], coords["lon"])
+        if radius:
+            if len(radius) > 1 or "near" not in parsed:
+                raise _Unsure("radius")
+            value, unit = radius[0].groups()
+            parsed["radius_km"] = float(value) * _RADIUS_UNITS[unit[0]]
+
+        for m in q.take(_COORD_RANGE):
+            (a, ha, b, hb) = m.groups()
+            if _axis(ha) != _axis(hb) or _axis(ha) in parsed:
+                raise _Unsure(m.group(0))
+            parsed[_axis(ha)] = (_signed(a, ha), _signed(b, hb))
+        for m in q.take(_AXIS_RANGE):
+            axis = "lat" if m.group(1).startswith("lat") else "lon"
+            if axis in parsed:
+                raise _Unsure(m.group(0))
+            parsed[axis] = (float(m.group(2)), float(m.group(3)))
+        if "lat" in parsed:
+            parsed["lat"] = tuple(sorted(parsed["lat"]))
+
+        for m in q.take(_DEPTH):
+            op = _DEPTH_WORDS[m.group(1)]
+            parsed.setdefault("depth", []).append((op, float(m.group(2))))
+
+        periods = []
+        for m in q.take(_DATE_RANGE) + q.take(_YEAR_SPAN):
+            start, end = _period(m.group(1))[0], _period(m.group(2))[1]
+            periods.append((start, end))
+        for m in q.take(_DATE_BOUND):
+            word, (start, end) = m.group(1), _period(m.group(2))
+            if word in ("since", "from"):
+                periods.append((start, None))
+            elif word == "after":
+                periods.append((end, None))
+            elif word == "before":
+                periods.append((None, start))
+            else:
+                periods.append((None, end))
+        for m in q.take(_MONTH):
+            periods.append(_month(*m.groups()))
+        for m in q.take(_DAY) + q.take(_SINGLE_YEAR):
+            periods.append(_period(m.group(1)))
+        if periods:
+            starts = [s for s, _ in periods if s is not None]
+            ends = [e for _, e in periods if e is not None]
+            parsed["start"] = max(starts) if starts else None
+            parsed["end"] = min(ends) if ends else None
+            if parsed["start"] and parsed["end"] and parsed["start"] >= parsed["end"]:
+                raise _Unsure("empty date range")
+
+        oceans = [_OCEANS[m.group(1)] for m in q.take(_OCEAN)]
+        if oceans:
+            parsed["oceans"] = list(dict.fromkeys(oceans))
+        flags = [_FLAGS[m.group(1)] for m in q.take(_FLAG)]
+        if flags:
+            parsed["flags"] = list(dict.fromkeys(flags))
+        parsed["count"] = bool(q.take(_COUNT))
+    except _Unsure:
+        return None
+
+    lat, lon = parsed.get("lat"), parsed.get("lon")
+    near = parsed.get("near")
+    if (lat and not all(-90 <= v <= 90 for v in lat)) or (lon and not all(-180 <= v <= 180 for v in lon)):
+        return None
+    if near and not (-90 <= near[0] <= 90 and -180 <= near[1] <= 180):
+        return None
+    if lon and lon[0] > lon[1] and not (lon[0] >= ANTIMERIDIAN_MIN_LON and lon[1] <= -ANTIMERIDIAN_MIN_LON):
+        # A reversed range is only read as a box across ±180 (170°E to 170°W);
+        # "lon between 80 and 60" is ambiguous and goes to the LLM
+        return None
+    if any(word not in FILLER_WORDS for word in q.leftover()):
+        return None
+    if len(parsed) == 1 and not parsed["count"]:
+        return None
+    return parsed
+
+
+def build_query(parsed, max_rows=100, default_radius_km=100.0):
+    """(sql, params) for parsed constraints, with %s placeholders."""
+    where, params = [], []
+    stats = bool(parsed.get("depth") or parsed.get("flags"))
+
+    if parsed.get("oceans"):
+        where.append(f"p.ocean IN ({', '.join(['%s'] * len(parsed['oceans']))})")
+        params += parsed["oceans"]
+    if parsed.get("start"):
+        where.append("p.date_time >= %s")
+        params.append(parsed["start"])
+    if parsed.get("end"):
+        where.append("p.date_time < %s")
+        params.append(parsed["end"])
+    if parsed.get("lat"):
+        where.append("p.latitude BETWEEN %s AND %s")
+        params += parsed["lat"]
+    if parsed.get("lon"):
+        west, east = parsed["lon"]
+        if west <= east:
+            where.append("p.longitude BETWEEN %s AND %s")
+        else:
+            # Box across the antimeridian, e.g. 170°E to 170°W
+            where.append("(p.longitude >= %s OR p.longitude <= %s)")
+        params += [west, east]
+    if parsed.get("near"):
+        lat, lon = parsed["near"]
+        km = parsed.get("radius_km", default_radius_km)
+        dy = km / _KM_PER_DEGREE
+        dx = min(180.0, dy / max(math.cos(math.radians(lat)), 0.01))
+        # Bounding box first so the GiST index on geom is used, then the exact distance
+        where.append(
+            "p.geom && ST_Expand(ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s)"
+            " AND ST_DWithin(p.geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)"
+        )
+        params += [lon, lat, dx, dy, lon, lat, km * 1000.0]
+    for op, value in parsed.get("depth", []):
+        # Metres and dbar are treated alike (1 dbar ~ 1 m)
+        where.append(f"s.max_pressure {op} %s")
+        params.append(value)
+    for flag in parsed.get("flags", []):
+        where.append(f"s.{flag}")
+
+    source = "profiles p" + (" JOIN profile_stats s ON s.profile_id = p.profile_id" if stats else "")
+    condition = f" WHERE {' AND '.join(where)}" if where else ""
+    if parsed.get("count"):
+        return f"SELECT count(*) AS profiles FROM {source}{condition}", params
+    columns = "p.profile_id, p.date_time, p.latitude, p.longitude, p.ocean, p.institution, p.profiler_type"
+    if stats:
+        columns += ", s.max_pressure"
+    return f"SELECT {columns} FROM {source}{condition} ORDER BY p.date_time DESC LIMIT {int(max_rows)}", params
+
+
+def render(sql, params):
+    """Bind params into sql with psycopg2's literal adaptation."""
+    return sql % tuple(adapt(p).getquoted().decode() for p in params)
+
+
+class FastPath:
+    """
+    Answers structured questions (oceans, years and dates, lat/lon boxes,
+    "near X°N, Y°E" with a radius, depth thresholds via profile_stats)
+    without the LLM. translate() returns SQL, or None to fall back.
+    """
+
+    def __init__(self, max_rows=100, default_radius_km=100.0):
+        self.max_rows = max_rows
+        self.default_radius_km = default_radius_km
+        self.hits = 0
+        self.misses = 0
+        self.latency = LatencyWindow()
+
+    def translate(self, question):
+        start = time.perf_counter()
+        parsed = parse_question(question)
+        sql = None
+        if parsed is not None:
+            sql = render(*build_query(parsed, self.max_rows, self.default_radius_km))
+        self.latency.record((time.perf_counter() - start) * 1000)
+        if sql is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return sql
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "parse": self.latency.summary(),
+        }
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from sql_cache import normalize_question
+
+# RAGModel's prompt carries the question on this line
+_QUESTION = re.compile(r'^User Query: "(.*)"$', re.M)
+DEFAULT_STUB_SQL = (
+    "SELECT profile_id, date_time, latitude, longitude, ocean FROM profiles "
+    "ORDER BY date_time DESC LIMIT 100"
+)
+
+
+class LLMResponse:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class LLMClient(ABC):
+    """
+    What RAGModel needs from an LLM: generate_content(prompt) and
+    generate_content_async(prompt), both returning an object with .text.
+    The async default runs the blocking call in a thread.
+    """
+
+    @abstractmethod
+    def generate_content(self, prompt):
+        ...
+
+    async def generate_content_async(self, prompt):
+        return await asyncio.to_thread(self.generate_content, prompt)
+
+
+class GeminiClient(LLMClient):
+    """Google Gemini through google.generativeai (imported on first use)."""
+
+    def __init__(self, model="gemini-2.0-flash", api_key=None):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY", "API KEY"))
+        self.model = genai.GenerativeModel(model)
+
+    def generate_content(self, prompt):
+        return self.model.generate_content(prompt)
+
+    async def generate_content_async(self, prompt):
+        return await self.model.generate_content_async(prompt)
+
+
+def latency_sampler(spec, seed=0):
+    """
+    Callable returning latencies in ms drawn from spec:
+    "fixed:MS", "uniform:LO,HI", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA"
+    (a bare number is fixed). Seeded, so runs are repeatable.
+    """
+    kind, _, args = str(spec).partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    values = [float(v) for v in args.split(",")]
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    draw = {
+        "fixed": lambda: values[0],
+        "uniform": lambda: rng.uniform(values[0], values[1]),
+        "normal": lambda: rng.gauss(values[0], values[1]),
+        "lognormal": lambda: values[0] * rng.lognormvariate(0.0, values[1]),
+    }.get(kind)
+    if draw is None:
+        raise ValueError(f"Unknown latency distribution {spec!r}")
+
+    def sample():
+        with lock:
+            return max(0.0, draw())
+    return sample
+
+
+class StubLLM(LLMClient):
+    """
+    Deterministic local stand-in for Gemini: answers with canned SQL for the
+    question in the prompt (default_sql for unknown questions) after a
+    latency drawn from `latency`. failure_rate of the calls raise instead.
+    """
+
+    def __init__(self, canned=None, latency="fixed:0", default_sql=DEFAULT_STUB_SQL,
+                 failure_rate=0.0, seed=0):
+        self.canned = {normalize_question(q): sql for q, sql in (canned or {}).items()}
+        self.default_sql = default_sql
+        self.failure_rate = failure_rate
+        self._latency = latency_sampler(latency, seed)
+        self._failures = random.Random(seed + 1)
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Canned SQL from a JSON list of {"question", "sql"} (entries without sql are skipped)."""
+        with open(path) as f:
+            corpus = json.load(f)
+        return cls({item["question"]: item["sql"] for item in corpus if item.get("sql")}, **kwargs)
+
+    def _answer(self, prompt):
+        self.calls += 1
+        if self.failure_rate and self._failures.random() < self.failure_rate:
+            raise RuntimeError("Stub LLM failure")
+        m = _QUESTION.search(prompt)
+        question = normalize_question(m.group(1)) if m else ""
+        return LLMResponse(self.canned.get(question, self.default_sql))
+
+    def generate_content(self, prompt):
+        time.sleep(self._latency() / 1000)
+        return self._answer(prompt)
+
+    async def generate_content_async(self, prompt):
+        await asyncio.sleep(self._latency() / 1000)
+        return self._answer(prompt)
+
+
+def make_client(backend=None):
+    """
+    LLM client selected by LLM_BACKEND: "gemini" (default) or "stub". The
+    stub reads canned SQL from STUB_LLM_SQL (a question corpus file) and
+    its latency distribution from STUB_LLM_LATENCY.
+    """
+    backend = backend or os.getenv("LLM_BACKEND", "gemini")
+    if backend == "stub":
+        options = {
+            "latency": os.getenv("STUB_LLM_LATENCY", "lognormal:800,0.4"),
+            "failure_rate": float(os.getenv("STUB_LLM_FAILURE_RATE", 0.0)),
+        }
+        path = os.getenv("STUB_LLM_SQL")
+        return StubLLM.from_file(path, **options) if path else StubLLM(**options)
+    if backend == "gemini":
+        return GeminiClient(os.getenv("GEMINI_MODEL", "gemini-2.0-flash"))
+    raise ValueError(f"Unknown LLM_BACKEND {backend!r}")
@@ -0,0 +1,208 @@
+import bisect
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the latency buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds for row counts and payload sizes
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._lines(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _lines(self, key, value):
+        return [f"{self.name}{_labels(self.label_names, key)} {value}"]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observe() is a lock plus a bisect."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _lines(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            labels = _labels(self.label_names, key, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        super().__init__(name, help)
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            value = None
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read):
+        return self._add(Gauge(name, help, read))
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "argo_stage_duration_seconds", "Time spent per request stage", labels=("stage",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "argo_request_duration_seconds", "End-to-end handler time", labels=("endpoint", "source")
+)
+LLM_REQUESTS = REGISTRY.counter("argo_llm_requests_total", "LLM calls by outcome", labels=("outcome",))
+SQL_SOURCE = REGISTRY.counter("argo_sql_generated_total", "Generated SQL by where it came from", labels=("source",))
+SQL_REJECTED = REGISTRY.counter("argo_sql_rejected_total", "SQL rejected by the guard", labels=("kind",))
+CACHE_LOOKUPS = REGISTRY.counter("argo_cache_lookups_total", "Cache lookups by outcome", labels=("cache", "result"))
+ROWS_RETURNED = REGISTRY.histogram("argo_query_rows", "Rows returned per query", buckets=SIZE_BUCKETS)
+RESPONSE_BYTES = REGISTRY.histogram(
+    "argo_response_bytes", "Encoded response body size", labels=("endpoint",), buckets=SIZE_BUCKETS
+)
+
+
+def _tracer():
+    """
+    OpenTelemetry tracer when OTEL_ENABLED=1, else None. With the SDK and
+    exporter installed and OTEL_EXPORTER_OTLP_ENDPOINT set, spans are
+    batched to that collector (sampling via the standard OTEL_TRACES_SAMPLER
+    variables); with only the API installed they are no-ops.
+    """
+    if os.getenv("OTEL_ENABLED", "0") != "1":
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        print("⚠️ OTEL_ENABLED=1 but opentelemetry-api is not installed; tracing disabled")
+        return None
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        try:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "argo-backend")})
+            provider = TracerProvider(resource=resource)
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+        except ImportError as e:
+            print(f"⚠️ OpenTelemetry SDK/exporter unavailable, spans are not exported: {e}")
+    return trace.get_tracer("argo.backend")
+
+
+TRACER = _tracer()
+
+
+class stage:
+    """
+    Times a block into argo_stage_duration_seconds{stage=name} and, when
+    tracing is on, wraps it in a span of the same name. Works around awaits.
+    """
+
+    __slots__ = ("name", "start", "span")
+
+    def __init__(self, name):
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        if TRACER is not None:
+            self.span = TRACER.start_as_current_span(self.name)
+            self.span.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, stage=self.name)
+        if self.span is not None:
+            self.span.__exit__(*exc)
+        return False
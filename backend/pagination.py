@@ -0,0 +1,188 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+import orjson
+
+from sql_guard import tokenize
+
+# Keyset columns and how they are ordered
+KEY_EXPRESSIONS = {"profile_id": 'q."profile_id"'}
+# Tables with one row per profile_id; only single-table queries over these page by keyset
+KEYED_TABLES = {"profiles", "profile_stats"}
+TOKEN_TTL = 3600
+
+# Tokens carry the SQL, so they are signed; without PAGE_TOKEN_SECRET they
+# only stay valid for the lifetime of the process
+SECRET_CONFIGURED = bool(os.getenv("PAGE_TOKEN_SECRET"))
+_SECRET = os.getenv("PAGE_TOKEN_SECRET", "").encode() or os.urandom(32)
+# Words that make profile_id repeat (or stop being a column of one table)
+_NOT_KEYED = {"join", "group", "having", "union", "intersect", "except", "distinct", "with"}
+_TAIL = ("limit", "offset", "fetch")
+
+
+class InvalidPageToken(ValueError):
+    pass
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign_token(state, ttl=TOKEN_TTL):
+    payload = orjson.dumps({**state, "exp": int(time.time() + ttl)})
+    mac = hmac.new(_SECRET, payload, hashlib.sha256).digest()
+    return f"{_b64(payload)}.{_b64(mac)}"
+
+
+def read_token(token):
+    """Verify a page token and return its state; raises InvalidPageToken."""
+    try:
+        payload_text, mac_text = token.split(".")
+        payload, mac = _unb64(payload_text), _unb64(mac_text)
+    except ValueError:
+        raise InvalidPageToken("Malformed page token")
+    if not hmac.compare_digest(mac, hmac.new(_SECRET, payload, hashlib.sha256).digest()):
+        raise InvalidPageToken("Page token signature mismatch")
+    state = orjson.loads(payload)
+    if state.get("exp", 0) < time.time():
+        raise InvalidPageToken("Page token expired")
+    return state
+
+
+def _top_level(tokens):
+    """Indexes of the tokens outside any parentheses."""
+    top, depth = [], 0
+    for i, t in enumerate(tokens):
+        if t.text == ")":
+            depth -= 1
+        if depth == 0:
+            top.append(i)
+        if t.text == "(":
+            depth += 1
+    return top
+
+
+def _unique_profile_id(tokens, top, columns):
+    """True if profile_id is provably unique in the result: a plain column of one KEYED_TABLES table."""
+    if columns.count("profile_id") != 1 or tokens[0].value != "select":
+        return False
+    words = [tokens[i].value for i in top if tokens[i].kind == "word"]
+    if _NOT_KEYED.intersection(words) or words.count("from") != 1:
+        return False
+    start = next(i for i in top if tokens[i].value == "from")
+    # FROM [public.]table [[AS] alias], then the end or a clause keyword
+    j = start + 1
+    if j + 2 < len(tokens) and tokens[j].value == "public" and tokens[j + 1].text == ".":
+        j += 2
+    if j >= len(tokens) or tokens[j].value not in KEYED_TABLES:
+        return False
+    j += 1
+    if j < len(tokens) and tokens[j].value == "as":
+        j += 1
+    if j < len(tokens) and tokens[j].kind == "word" and tokens[j].value not in ("where", "order") + _TAIL:
+        j += 1
+    if j < len(tokens) and tokens[j].value not in ("where", "order") + _TAIL:
+        return False
+    # The profile_id column must come from the table, not be an alias for something else
+    items, item = [], []
+    for i in top[1:]:
+        if i >= start:
+            break
+        if tokens[i].text == ",":
+            items.append(item)
+            item = []
+        else:
+            item.append(tokens[i].text.lower())
+    items.append(item)
+    plain = (["*"], ["profile_id"])
+    return any(it in plain or (len(it) == 3 and it[1] == "." and it[2] in ("*", "profile_id")) for it in items)
+
+
+def plan_paging(sql, columns):
+    """
+    (sql, key) for paging the result of sql.
+
+    The returned SQL always has a deterministic top-level ORDER BY, so a
+    LIMIT picks the same rows on every rerun. key is ["profile_id"] for
+    keyset paging when profile_id is provably unique (see
+    _unique_profile_id) and the query is unordered or ordered by it;
+    otherwise it is None and pages use OFFSET over the query's own order,
+    with profile_id appended as a tiebreaker when it is unique.
+    """
+    body = sql.strip().rstrip(";").strip()
+    tokens = tokenize(body)
+    top = _top_level(tokens)
+    order = next((i for i in top[:-1] if tokens[i].value == "order" and tokens[i + 1].value == "by"), None)
+    tail = next((i for i in top if tokens[i].value in _TAIL and (order is None or i > order)), None)
+    insert_at = tokens[tail].start if tail is not None else len(body)
+    unique = _unique_profile_id(tokens, top, columns)
+
+    if order is None:
+        if unique:
+            by = "profile_id"
+        else:
+            # No usable key: order by every output column so reruns agree
+            by = ", ".join(str(n) for n in range(1, len(columns) + 1))
+        ordered = f"{body[:insert_at].rstrip()} ORDER BY {by} {body[insert_at:]}".strip()
+        return ordered, (["profile_id"] if unique else None)
+
+    if not unique:
+        return body, None
+    items = [t.value for t in tokens[order + 2:tail if tail is not None else len(tokens)]]
+    if items[-1:] == ["asc"]:
+        items.pop()
+    if items[1:2] == ["."]:
+        items = items[2:]
+    if items == ["profile_id"]:
+        return body, ["profile_id"]
+    # Ordered by something else: keep that order, break ties on the key and page by OFFSET
+    return f"{body[:insert_at].rstrip()}, profile_id {body[insert_at:]}".strip(), None
+
+
+def probe_query(sql):
+    """(sql, params) for a zero-row query that reveals the result columns."""
+    return f"SELECT * FROM ({_inner(sql)}) AS q LIMIT 0", []
+
+
+def _inner(sql):
+    # The generated SQL is embedded in a parameterized query, so literal % must be doubled
+    return sql.strip().rstrip(";").replace("%", "%%")
+
+
+def page_query(state, page_size):
+    """
+    (sql, params) for the page after state["after"] (keyset) or at
+    state["offset"]. One extra row is requested to detect a following page.
+    """
+    inner = _inner(state["sql"])
+    key = state.get("key")
+    if key:
+        cols = ", ".join(KEY_EXPRESSIONS[c] for c in key)
+        after = state.get("after")
+        where = f"WHERE ({cols}) > ({', '.join(['%s'] * len(key))})" if after else ""
+        return (
+            f"SELECT * FROM ({inner}) AS q {where} ORDER BY {cols} LIMIT %s",
+            [*(after or []), page_size + 1],
+        )
+    # No usable key: page by offset; plan_paging gave the query a deterministic ORDER BY,
+    # which a plain SELECT * over it keeps
+    return f"SELECT * FROM ({inner}) AS q OFFSET %s LIMIT %s", [state.get("offset", 0), page_size + 1]
+
+
+def next_state(state, columns, rows, page_size):
+    """State for the following page, or None if rows was the last page."""
+    if len(rows) <= page_size:
+        return None
+    last = rows[page_size - 1]
+    key = state.get("key")
+    if key:
+        after = [last[columns.index(c)] for c in key]
+        return {**state, "after": ["-Infinity" if v is None else v for v in after]}
+    return {**state, "offset": state.get("offset", 0) + page_size}
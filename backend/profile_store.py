@@ -0,0 +1,251 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from metrics import CACHE_LOOKUPS
+
+# Depth-series columns served for a profile (whichever of these the file has)
+PROFILE_COLUMNS = ["PRES", "TEMP", "PSAL"]
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+_PROFILE_ID = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class ProfileNotFound(KeyError):
+    pass
+
+
+def downsample(table, max_levels, method="decimate"):
+    """
+    Reduce table to at most max_levels rows: "decimate" keeps evenly spaced
+    levels (first and last included), "bin" averages every column over
+    equal-width pressure bins, skipping NaNs and empty bins.
+    """
+    if max_levels is None or table.num_rows <= max_levels:
+        return table
+    if method == "decimate":
+        keep = np.unique(np.linspace(0, table.num_rows - 1, max_levels).round().astype(np.int64))
+        return table.take(keep)
+
+    pres = table.column("PRES").to_numpy(zero_copy_only=False).astype(np.float64)
+    valid = ~np.isnan(pres)
+    if not valid.any():
+        return table.slice(0, 0)
+    edges = np.linspace(pres[valid].min(), pres[valid].max(), max_levels + 1)
+    bins = np.clip(np.searchsorted(edges, pres, side="right") - 1, 0, max_levels - 1)
+    bins, rows = bins[valid], np.flatnonzero(valid)
+    occupied = np.bincount(bins, minlength=max_levels) > 0
+    columns = {}
+    for name in table.column_names:
+        values = table.column(name).to_numpy(zero_copy_only=False).astype(np.float64)[rows]
+        ok = ~np.isnan(values)
+        sums = np.bincount(bins[ok], weights=values[ok], minlength=max_levels)
+        counts = np.bincount(bins[ok], minlength=max_levels)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        columns[name] = pa.array(means[occupied].astype(np.float32), from_pandas=True)
+    return pa.table(columns)
+
+
+def encode_batch(tables, missing, representation):
+    """
+    One body for a batch of profiles. "arrow" is a single IPC stream with a
+    profile_id column (missing ids in the schema metadata); "json" maps each
+    profile_id to its column arrays.
+    """
+    if representation == "arrow":
+        parts = [
+            table.add_column(0, "profile_id", pa.array([profile_id] * table.num_rows, pa.string()))
+            for profile_id, table in tables.items()
+        ]
+        if parts:
+            table = pa.concat_tables(parts, promote_options="permissive")
+        else:
+            table = pa.table({"profile_id": pa.array([], pa.string())})
+        table = table.replace_schema_metadata({"missing": orjson.dumps(missing)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    profiles = {
+        profile_id: {
+            name: table.column(name).to_numpy(zero_copy_only=False)
+            for name in table.column_names
+        }
+        for profile_id, table in tables.items()
+    }
+    return orjson.dumps(
+        {"profiles": profiles, "missing": missing},
+        option=orjson.OPT_SERIALIZE_NUMPY,
+    )
+
+
+class _Entry:
+    __slots__ = ("version", "table", "payloads")
+
+    def __init__(self, version, table):
+        self.version = version
+        self.table = table
+        self.payloads = {}  # encoded bodies per representation
+
+    def etag(self, representation):
+        mtime_ns, size = self.version
+        return f'"{mtime_ns:x}-{size:x}-{representation}"'
+
+
+class ProfileStore:
+    """
+    Per-profile depth series from {root}/{profile_id}.parquet.
+
+    Files are read memory-mapped and kept as Arrow tables in an LRU of
+    max_entries, together with their encoded response bodies. An entry is
+    reused while the file's mtime and size are unchanged; the same pair is
+    the basis of the ETag.
+    """
+
+    def __init__(self, root="./profiles_data", max_entries=256, workers=8):
+        self.root = root
+        self.max_entries = max_entries
+        self.workers = workers
+        self._executor = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, profile_id):
+        if not _PROFILE_ID.match(profile_id) or ".." in profile_id:
+            raise ProfileNotFound(profile_id)
+        return os.path.join(self.root, f"{profile_id}.parquet")
+
+    def _cached(self, profile_id):
+        """(path, version, fresh cached entry or None); raises ProfileNotFound."""
+        path = self._path(profile_id)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise ProfileNotFound(profile_id)
+        version = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache="profile", result="hit")
+                return path, version, entry
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="profile", result="miss")
+        return path, version, None
+
+    def get(self, profile_id):
+        path, version, entry = self._cached(profile_id)
+        if entry is not None:
+            return entry
+
+        parquet = pq.ParquetFile(path, memory_map=True)
+        columns = [c for c in PROFILE_COLUMNS if c in parquet.schema_arrow.names]
+        entry = _Entry(version, parquet.read(columns=columns).combine_chunks())
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def select(self, profile_id, variables=PROFILE_COLUMNS, pressure_range=None,
+               max_levels=None, method="decimate"):
+        """
+        PRES plus the requested variables for one profile, restricted to
+        pressure_range=(min, max) (either bound may be None) and downsampled
+        to max_levels. Uses the cached table when there is one; otherwise
+        reads just those columns without filling the cache, so large batches
+        don't evict the profiles being plotted.
+        """
+        path, _, entry = self._cached(profile_id)
+        wanted = list(dict.fromkeys(["PRES", *variables]))
+        if entry is not None:
+            table = entry.table
+        else:
+            parquet = pq.ParquetFile(path, memory_map=True)
+            table = parquet.read(columns=[c for c in wanted if c in parquet.schema_arrow.names])
+        table = table.select([c for c in wanted if c in table.column_names])
+
+        low, high = pressure_range if pressure_range is not None else (None, None)
+        if (low is not None or high is not None) and "PRES" in table.column_names:
+            mask = pc.is_valid(table.column("PRES"))
+            if low is not None:
+                mask = pc.and_(mask, pc.greater_equal(table.column("PRES"), low))
+            if high is not None:
+                mask = pc.and_(mask, pc.less_equal(table.column("PRES"), high))
+            table = table.filter(mask)
+        return downsample(table, max_levels, method)
+
+    def select_many(self, profile_ids, **options):
+        """
+        select() for many profiles on a bounded thread pool. Returns
+        ({profile_id: table}, [missing ids]) in request order.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="profile-read")
+
+        def read(profile_id):
+            try:
+                return self.select(profile_id, **options)
+            except ProfileNotFound:
+                return None
+
+        tables, missing = {}, []
+        for profile_id, table in zip(profile_ids, self._executor.map(read, profile_ids)):
+            if table is None:
+                missing.append(profile_id)
+            else:
+                tables[profile_id] = table
+        return tables, missing
+
+    def encode(self, entry, profile_id, representation):
+        """
+        Response body for "arrow" (IPC stream), "json" (column arrays) or
+        "records" (the original list-of-rows JSON), built once per entry.
+        """
+        body = entry.payloads.get(representation)
+        if body is not None:
+            return body
+        table = entry.table
+        if representation == "arrow":
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            body = sink.getvalue().to_pybytes()
+        elif representation == "records":
+            body = orjson.dumps({"profile_id": profile_id, "depth_series": table.to_pylist()})
+        else:
+            # Float columns go to orjson as numpy arrays (NaN/null -> null)
+            series = {
+                name: table.column(name).to_numpy(zero_copy_only=False)
+                for name in table.column_names
+            }
+            body = orjson.dumps(
+                {"profile_id": profile_id, "depth_series": series},
+                option=orjson.OPT_SERIALIZE_NUMPY,
+            )
+        entry.payloads[representation] = body
+        return body
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "workers": self.workers,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -1,23 +1,70 @@
+import asyncio
 import os
-import google.generativeai as genai
+import time
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 from dotenv import load_dotenv
 
+from db_pool import DBPool, PoolTimeout
+from llm_client import make_client
+from metrics import LLM_REQUESTS, SQL_SOURCE, stage
+from result_cache import is_volatile
+from sql_cache import SQLCache
+from sql_guard import RejectedQuery
+from stats import LatencyWindow
+
 load_dotenv()
 
+SYSTEM_PROMPT = """You are an SQL generator for the Argo float database.
+Only generate SELECT queries.
+Never include DROP, DELETE, UPDATE, or other destructive commands.
+Limit results to 100 rows.
+All semantic matching should be done on the 'summary' field.
+Optional filters: latitude, longitude, date_time, and ocean.
+Depth and value filters use profile_stats; individual levels use the per-level table. Join on profile_id."""
+
+
+class LLMTimeout(TimeoutError):
+    """The LLM did not answer within llm_timeout seconds."""
+
+
 class RAGModel:
-    def __init__(self, db_params):
+    def __init__(self, db_params, measurement_layout="rows", pool=None, client=None, sql_cache=None,
+                 result_cache=None, data_version=None, fast_path=None,
+                 guard=None, llm_timeout=None):
         self.db_params = db_params
-        # Configure Gemini API
-        genai.configure(api_key="API KEY")
-        self.client = genai.GenerativeModel('gemini-2.0-flash')
+        # Shared connection pool; created lazily if the app doesn't provide one
+        self.pool = pool or DBPool(db_params, read_only=True)
+        # Which per-level table the loader filled: "rows" (measurements) or "arrays" (profile_measurements)
+        self.measurement_layout = measurement_layout
+        # An llm_client.LLMClient, or anything with generate_content(prompt) -> object with .text;
+        # generate_content_async is used if present. Default: chosen by LLM_BACKEND (Gemini)
+        self.client = client if client is not None else make_client()
+        # Seconds to wait for the LLM before giving up (and cancelling the call when it is async)
+        self.llm_timeout = llm_timeout
+        self.llm_timeouts = 0
+        # Optional question -> SQL cache, invalidated whenever the schema or prompt changes
+        self.sql_cache = sql_cache
+        if sql_cache is not None:
+            sql_cache.set_schema(SQLCache.fingerprint(self._get_db_schema(), SYSTEM_PROMPT))
+        # Optional SQL -> rows cache, valid only while data_version.current() is unchanged
+        self.result_cache = result_cache
+        self.data_version = data_version
+        # Optional rule-based translator tried before the cache and the LLM
+        self.fast_path = fast_path
+        # Optional SQLGuard run on all SQL before it is returned for execution
+        self.guard = guard
+        self.regenerated = 0
+        # SQL generation time by where the SQL came from
+        self.latency = {source: LatencyWindow() for source in ("fast_path", "sql_cache", "llm")}
 
     def _get_db_schema(self):
         """
         Provide a simple database schema for the LLM to understand.
-        All semantic matching is done via the 'summary' field.
+        All semantic matching is done via the 'summary' field; depth and value
+        questions go to the per-level table, joined on profile_id.
         """
-        return {
+        profiles = {
             "table": "profiles",
             "columns": [
                 "profile_id", "date_time", "latitude", "longitude",
@@ -29,18 +76,154 @@ class RAGModel:
                 "Optional filters: latitude, longitude, date_time, and ocean."
             )
         }
+        if self.measurement_layout == "arrays":
+            levels = {
+                "table": "profile_measurements",
+                "columns": [
+                    "profile_id", "date_time", "n_levels", "max_pressure",
+                    "pressure", "temperature", "salinity",
+                    "doxy", "chla", "nitrate", "turbidity"
+                ],
+                "description": (
+                    "One row per profile; pressure (dbar), temperature (°C), salinity (PSU) "
+                    "and the BGC variables are REAL[] arrays in level order, NULL when absent. "
+                    "Use max_pressure for depth filters (e.g. max_pressure > 2000) and "
+                    "unnest() only when individual levels are needed."
+                )
+            }
+        else:
+            levels = {
+                "table": "measurements",
+                "columns": [
+                    "profile_id", "date_time", "pressure", "temperature", "salinity",
+                    "doxy", "chla", "nitrate", "turbidity"
+                ],
+                "description": (
+                    "One row per depth level: pressure (dbar), temperature (°C), salinity (PSU); "
+                    "BGC columns are NULL for core profiles. Partitioned by date_time, so always "
+                    "add a date_time range when possible. For per-profile questions aggregate "
+                    "with GROUP BY profile_id (e.g. HAVING max(pressure) > 2000) or use "
+                    "EXISTS against profiles rather than returning raw levels."
+                )
+            }
+        stats = {
+            "table": "profile_stats",
+            "columns": [
+                "profile_id", "n_levels", "max_pressure",
+                "surface_pressure", "surface_temperature", "surface_salinity",
+                "min_temperature", "max_temperature", "min_salinity", "max_salinity",
+                "has_psal", "has_doxy", "has_chla", "has_nitrate", "has_turbidity"
+            ],
+            "description": (
+                "One indexed row per profile with precomputed aggregates; surface_* is the "
+                "shallowest level. Prefer this table over the per-level table for depth and "
+                "value filters (e.g. max_pressure > 2000, surface_temperature > 28, has_doxy)."
+            )
+        }
+        return {"tables": [profiles, stats, levels], "join": "profile_id"}
 
     def generate_sql(self, user_query: str):
         """
-        Generate a SQL query from natural language using Gemini API.
+        Generate a SQL query from natural language using Gemini API,
+        reusing cached SQL for repeated or paraphrased questions.
+        """
+        return self.generate(user_query)[0]
+
+    def generate(self, user_query: str):
+        """
+        agenerate() for synchronous callers (scripts, notebooks). Inside a
+        running event loop it runs on a worker thread and blocks that loop
+        until done; async code should await agenerate() instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.agenerate(user_query))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.agenerate(user_query)).result()
+
+    async def agenerate(self, user_query: str):
+        """
+        (sql, source) for a question, where source is "fast_path",
+        "sql_cache" or "llm"; sql is None if generation failed.
+
+        With a guard, fast-path and cached SQL that fails the checks is
+        skipped, and LLM SQL that fails gets one retry with the reason as
+        feedback; RejectedQuery is raised if the retry fails too, LLMTimeout
+        if the LLM is slower than llm_timeout. Blocking work (plan checks,
+        embeddings) runs in worker threads.
         """
+        start = time.perf_counter()
+        source, sql_query = "fast_path", None
+        try:
+            if self.fast_path is not None:
+                with stage("fast_path"):
+                    translated = self.fast_path.translate(user_query)
+                sql_query = await asyncio.to_thread(self._checked, translated)
+            if sql_query is None and self.sql_cache is not None:
+                with stage("sql_cache_lookup"):
+                    source, cached = "sql_cache", await asyncio.to_thread(self.sql_cache.get, user_query)
+                sql_query = await asyncio.to_thread(self._checked, cached)
+                if cached is not None and sql_query is None:
+                    self.sql_cache.discard(user_query)
+            if sql_query is None:
+                source, sql_query = "llm", await self._ask_llm(user_query)
+                if sql_query and self.guard is not None:
+                    try:
+                        sql_query = await asyncio.to_thread(self.guard.check, sql_query)
+                    except RejectedQuery as e:
+                        print(f"⚠️ Generated SQL rejected ({e.kind}): {e}")
+                        self.regenerated += 1
+                        sql_query = await self._ask_llm(user_query, feedback=(sql_query, str(e)))
+                        if sql_query:
+                            sql_query = await asyncio.to_thread(self.guard.check, sql_query)
+                if self.sql_cache is not None and sql_query:
+                    await asyncio.to_thread(self.sql_cache.put, user_query, sql_query)
+            SQL_SOURCE.inc(source=source if sql_query else "failed")
+            return sql_query, source
+        finally:
+            self.latency[source].record((time.perf_counter() - start) * 1000)
+
+    def _checked(self, sql_query):
+        """sql_query after the guard, or None if it is missing or rejected."""
+        if sql_query is None or self.guard is None:
+            return sql_query
+        try:
+            return self.guard.check(sql_query)
+        except RejectedQuery as e:
+            print(f"⚠️ SQL rejected ({e.kind}): {e}")
+            return None
+
+    async def _ask_llm(self, user_query, feedback=None):
+        with stage("prompt_build"):
+            prompt = self._build_prompt(user_query, feedback)
+
+        if hasattr(self.client, "generate_content_async"):
+            call = self.client.generate_content_async(prompt)
+        else:
+            # A blocking client keeps its thread until it returns; only the wait is abandoned
+            call = asyncio.to_thread(self.client.generate_content, prompt)
+        try:
+            with stage("llm"):
+                response = await asyncio.wait_for(call, self.llm_timeout)
+            LLM_REQUESTS.inc(outcome="ok")
+            sql_query = response.text.strip()
+
+            # Remove any Markdown code fences
+            return sql_query.replace("```sql", "").replace("```python", "").replace("```", "").strip()
+
+        except asyncio.TimeoutError:
+            self.llm_timeouts += 1
+            LLM_REQUESTS.inc(outcome="timeout")
+            raise LLMTimeout(f"The LLM did not answer within {self.llm_timeout}s")
+        except Exception as e:
+            LLM_REQUESTS.inc(outcome="error")
+            print(f"❌ Error with Gemini API: {e}")
+            return None
+
+    def _build_prompt(self, user_query, feedback=None):
         context_payload = {
-            "system_prompt": """You are an SQL generator for the Argo float database.
-Only generate SELECT queries.
-Never include DROP, DELETE, UPDATE, or other destructive commands.
-Limit results to 100 rows.
-All semantic matching should be done on the 'summary' field.
-Optional filters: latitude, longitude, date_time, and ocean.""",
+            "system_prompt": SYSTEM_PROMPT,
             "db_schema": self._get_db_schema(),
             "user_query": user_query
         }
@@ -55,39 +238,56 @@ User Query: "{context_payload['user_query']}"
 ---
 Generate ONLY the PostgreSQL query, without markdown, explanation, or extra text.
         """
+        if feedback is not None:
+            rejected_sql, reason = feedback
+            prompt += f"""
+---
+Your previous query was rejected: {reason}
+Previous query: {rejected_sql}
+Write a corrected query that avoids this problem.
+        """
+        return prompt
 
-        try:
-            response = self.client.generate_content(prompt)
-            sql_query = response.text.strip()
-
-            # Remove any Markdown code fences
-            sql_query = sql_query.replace("```sql", "").replace("```python", "").replace("```", "").strip()
-            return sql_query
-
-        except Exception as e:
-            print(f"❌ Error with Gemini API: {e}")
-            return None
+    def stats(self):
+        """Generation latency per source, fast-path hit rate and parse time, guard outcomes."""
+        stats = {source: window.summary() for source, window in self.latency.items()}
+        stats["llm_timeouts"] = self.llm_timeouts
+        if self.fast_path is not None:
+            stats["fast_path_parser"] = self.fast_path.stats()
+        if self.guard is not None:
+            stats["guard"] = {**self.guard.stats(), "regenerated": self.regenerated}
+        return stats
 
     def execute_sql(self, sql_query: str):
         """
-        Execute the generated SQL query on the PostgreSQL database.
+        Execute the generated SQL query on a pooled PostgreSQL connection.
         """
         if not sql_query:
             return {"error": "No SQL query provided."}
 
+        version = None
+        # Volatile SQL (now(), current_date, random()) changes without a data load, so it is never cached
+        if self.result_cache is not None and self.data_version is not None and not is_volatile(sql_query):
+            # Read the version before the query so a concurrent load can only make the entry stale
+            version = self.data_version.current()
+            cached = self.result_cache.get(sql_query, version)
+            if cached is not None:
+                return cached[1]
+
         try:
-            conn = psycopg2.connect(**self.db_params)
-            cur = conn.cursor()
-            cur.execute(sql_query)
-            results = cur.fetchall()
-            columns = [desc[0] for desc in cur.description]
-            return [dict(zip(columns, row)) for row in results]
-
-        except (psycopg2.Error, ValueError) as e:
+            columns, results = self.pool.fetch(sql_query)
+            if self.result_cache is not None:
+                self.result_cache.put(sql_query, version, columns, results)
+            with stage("rows_to_dicts"):
+                return [dict(zip(columns, row)) for row in results]
+
+        except (psycopg2.Error, PoolTimeout, ValueError) as e:
             print(f"❌ SQL execution failed: {e}")
             return {"error": str(e)}
 
-        finally:
-            if conn:
-                cur.close()
-                conn.close()
+    def stream_sql(self, sql_query: str, batch_size=1000):
+        """
+        Stream results of the generated SQL query as (columns, rows) batches
+        through a server-side cursor.
+        """
+        yield from self.pool.stream(sql_query, batch_size=batch_size)
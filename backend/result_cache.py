@@ -0,0 +1,232 @@
+import hashlib
+import re
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+import pyarrow as pa
+
+from metrics import CACHE_LOOKUPS
+
+# String literals and quoted identifiers are kept verbatim when canonicalizing
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+def canonical_sql(sql):
+    """Comment-, case- and whitespace-insensitive form of a query (outside quotes)."""
+    parts = _QUOTED.split(sql)
+    for i in range(0, len(parts), 2):
+        text = re.sub(r"--[^\n]*", " ", parts[i])
+        text = re.sub(r"/\*.*?\*/", " ", text, flags=re.S)
+        text = re.sub(r"\s+", " ", text).lower()
+        parts[i] = re.sub(r"\s*([,()=<>])\s*", r"\1", text)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+# Results that depend on when (or how often) the query runs, not just on the data
+_VOLATILE = re.compile(
+    r"\b(?:now|current_date|current_time|current_timestamp|localtime|localtimestamp|clock_timestamp|"
+    r"statement_timestamp|transaction_timestamp|timeofday|random|setseed|gen_random_uuid|age(?=\())\b"
+)
+_VOLATILE_LITERALS = {"'now'", "'today'", "'yesterday'", "'tomorrow'"}
+
+
+def is_volatile(sql):
+    """True if sql reads the clock or a random generator, e.g. "the last 7 days"."""
+    parts = _QUOTED.split(canonical_sql(sql))
+    return any(_VOLATILE.search(p) for p in parts[0::2]) or any(
+        p.lower() in _VOLATILE_LITERALS for p in parts[1::2]
+    )
+
+
+def sql_fingerprint(sql):
+    return hashlib.sha256(canonical_sql(sql).encode()).hexdigest()
+
+
+class DataVersion:
+    """
+    The data_version counter bumped by db/load_to_postgres.py in every load
+    transaction.
+
+    A background LISTEN on the data_version channel picks up bumps as soon
+    as the load commits; the table is also re-read at most every max_age
+    seconds in case a notification is missed. current() returns None when
+    the version is unknown (table missing, database down), which disables
+    result caching rather than risking stale rows.
+    """
+
+    CHANNEL = "data_version"
+
+    def __init__(self, pool, max_age=5.0, listen=True):
+        self.pool = pool
+        self.max_age = max_age
+        self.listen = listen
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._stop = threading.Event()
+
+    def _read(self):
+        try:
+            _, rows = self.pool.fetch("SELECT version FROM data_version")
+            return rows[0][0] if rows else None
+        except Exception as e:
+            print(f"⚠️ Could not read data_version: {e}")
+            return None
+
+    def current(self):
+        self.start()
+        with self._lock:
+            if self._version is not None and time.monotonic() - self._checked < self.max_age:
+                return self._version
+        version = self._read()
+        with self._lock:
+            self._version, self._checked = version, time.monotonic()
+        return version
+
+    def _set(self, version):
+        with self._lock:
+            self._version, self._checked = version, time.monotonic()
+
+    def start(self):
+        if not self.listen or self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, name="data-version-listener", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                conn = psycopg2.connect(**self.pool.db_params)
+            except psycopg2.Error:
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+            backoff = 1.0
+            try:
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.CHANNEL}")
+                # Anything committed before LISTEN took effect must not be missed
+                self._set(self._read())
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        self._set(int(payload) if payload.isdigit() else self._read())
+            except psycopg2.Error:
+                # Drop back to polling until the listener reconnects
+                self._set(None)
+            finally:
+                conn.close()
+
+
+class _Result:
+    __slots__ = ("version", "table", "nbytes")
+
+    def __init__(self, version, table):
+        self.version = version
+        self.table = table
+        self.nbytes = table.nbytes
+
+
+class ResultCache:
+    """
+    SQL fingerprint -> query result, held as Arrow tables within a memory
+    budget (LRU eviction by bytes). Entries are tagged with the data version
+    they were read under and are never returned once the version moved on.
+    Results of volatile SQL (now(), current_date, random(), ...) are not
+    cached, since they change without a data load.
+    """
+
+    def __init__(self, budget_bytes=256 << 20, max_entry_bytes=None):
+        self.budget_bytes = budget_bytes
+        self.max_entry_bytes = max_entry_bytes or budget_bytes // 8
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.uncacheable = 0
+        self.volatile = 0
+
+    def _drop(self, key):
+        self.nbytes -= self._entries.pop(key).nbytes
+
+    def get(self, sql, version):
+        """Return (columns, rows as dicts) for sql at version, or None."""
+        if version is None:
+            return None
+        key = sql_fingerprint(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="result", result="miss")
+                return None
+            if entry.version != version:
+                self._drop(key)
+                self.stale += 1
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="result", result="stale")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="result", result="hit")
+            table = entry.table
+        return table.column_names, table.to_pylist()
+
+    def put(self, sql, version, columns, rows):
+        """Store rows read while the data was at version (read *before* the query ran)."""
+        if version is None or len(set(columns)) != len(columns):
+            return
+        if is_volatile(sql):
+            self.volatile += 1
+            return
+        try:
+            table = pa.table({c: pa.array([row[i] for row in rows]) for i, c in enumerate(columns)})
+        except (pa.ArrowException, TypeError, ValueError):
+            # Mixed or exotic column types; just don't cache
+            self.uncacheable += 1
+            return
+        entry = _Result(version, table)
+        if entry.nbytes > self.max_entry_bytes:
+            self.uncacheable += 1
+            return
+        key = sql_fingerprint(sql)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.budget_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "uncacheable": self.uncacheable,
+            "volatile": self.volatile,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
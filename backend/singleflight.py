@@ -0,0 +1,56 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight task.
+
+    The first caller for a key starts the computation; callers arriving
+    while it runs await the same result (or exception). Once it finishes
+    the key is forgotten, so later calls compute afresh. A caller that is
+    cancelled stops waiting without cancelling the shared task, unless it
+    was the last one waiting. Use from a single event loop.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._calls = {}  # key -> [task, waiters]
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        """Result of fn() (a coroutine function), shared with concurrent callers of key."""
+        if not self.enabled:
+            self.leaders += 1
+            return await fn()
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(fn())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            if call[1] == 1:
+                call[0].cancel()
+            raise
+        finally:
+            call[1] -= 1
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self):
+        calls = self.leaders + self.shared
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "shared_rate": round(self.shared / calls, 4) if calls else None,
+        }
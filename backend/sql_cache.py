@@ -0,0 +1,324 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import CACHE_LOOKUPS
+
+# Words and literals that must match exactly before a semantically similar
+# question may reuse cached SQL ("Pacific in 2023" is not "Pacific in 2024")
+_LITERAL = re.compile(r"-?\d+(?:\.\d+)?(?:\s*°?\s*[nsew]\b)?")
+_ENTITY_WORDS = {
+    "atlantic", "pacific", "indian", "southern", "arctic",
+    "north", "south", "east", "west", "northern", "eastern", "western",
+    "temperature", "salinity", "pressure", "oxygen", "doxy", "chlorophyll", "chla",
+    "nitrate", "turbidity", "deeper", "shallower", "before", "after",
+}
+# Comparison, negation and aggregation phrases, normalized so that synonyms
+# ("over", "more than") agree while "greater" vs "less" or a bare listing vs
+# "how many" do not
+_OPERATORS = {
+    ">": ("greater than", "more than", "higher than", "larger than", "warmer than", "exceeding",
+          "over", "above", "beyond", ">"),
+    "<": ("less than", "fewer than", "lower than", "smaller than", "colder than", "under", "below", "<"),
+    ">=": ("at least", "no less than", ">="),
+    "<=": ("at most", "no more than", "<="),
+    "not": ("not", "without", "no", "excluding", "except", "never"),
+    "count": ("how many", "count", "number of"),
+    "avg": ("average", "mean", "avg"),
+    "min": ("min", "minimum", "lowest", "smallest"),
+    "max": ("max", "maximum", "highest", "largest"),
+    "sum": ("sum", "total"),
+    "top": ("top",),
+}
+_OPERATOR_TOKENS = {phrase: token for token, phrases in _OPERATORS.items() for phrase in phrases}
+_OPERATOR = re.compile(
+    r"(?<![a-z])("
+    + "|".join(re.escape(p) for p in sorted(_OPERATOR_TOKENS, key=len, reverse=True))
+    + r")(?![a-z])"
+)
+
+
+def normalize_question(question):
+    """Case-, width- and whitespace-insensitive form used as the exact-cache key."""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?.!")
+
+
+def _literals(normalized):
+    words = set(re.findall(r"[a-z]+", normalized))
+    operators = {_OPERATOR_TOKENS[m] for m in _OPERATOR.findall(normalized)}
+    return frozenset(_LITERAL.findall(normalized)) | frozenset(words & _ENTITY_WORDS) | frozenset(operators)
+
+
+class SentenceEmbedder:
+    """
+    Lazily loads a sentence-transformers model; returns unit-length float32
+    vectors. If the package or model is unavailable, `available` turns
+    False and the semantic tier is skipped.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        self.model_name = model_name
+        self._model = None
+        self.available = True
+
+    def __call__(self, texts):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            except Exception as e:
+                print(f"⚠️ Semantic SQL cache disabled: {e}")
+                self.available = False
+                return None
+        return self._model.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+
+class _Entry:
+    __slots__ = ("sql", "created", "embedding", "literals")
+
+    def __init__(self, sql, created, embedding, literals):
+        self.sql = sql
+        self.created = created
+        self.embedding = embedding
+        self.literals = literals
+
+
+class SQLCache:
+    """
+    Two-tier question -> SQL cache.
+
+    Tier 1 is an exact lookup on the normalized question. Tier 2 embeds the
+    question and reuses the SQL of the most similar cached question when the
+    cosine similarity is at least `threshold` and both questions mention
+    the same numbers, oceans, directions, variables, comparisons, negations
+    and aggregates. Entries expire after `ttl` seconds and the least
+    recently used are evicted beyond `max_entries`. The cache is tied to a
+    schema fingerprint: set_schema() with a different fingerprint clears
+    it, and entries persisted under an old fingerprint are ignored on load.
+    """
+
+    def __init__(self, path=None, max_entries=10_000, ttl=24 * 3600, embed=None,
+                 threshold=0.92, autosave_every=50):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.threshold = threshold
+        self.autosave_every = autosave_every
+        self.schema = None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Embedding rows updated in place by put/evict; _stale forces a full
+        # rebuild on the next semantic lookup (after load, clear, set_schema)
+        self._matrix = None
+        self._keys = []  # row -> key, None for a free row
+        self._rows = {}  # key -> row
+        self._free = []
+        self._stale = True
+        self._unsaved = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def fingerprint(*parts):
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def set_schema(self, schema):
+        """Bind the cache to a schema fingerprint, dropping entries built for another."""
+        with self._lock:
+            if schema != self.schema:
+                self._entries.clear()
+                self._stale = True
+                self.schema = schema
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry.created > self.ttl
+
+    def _semantic_embedding(self, normalized):
+        if self.embed is None or not getattr(self.embed, "available", True):
+            return None
+        vectors = self.embed([normalized])
+        return None if vectors is None else vectors[0]
+
+    def _rebuild(self):
+        self._keys = [k for k, e in self._entries.items() if e.embedding is not None]
+        self._rows = {k: i for i, k in enumerate(self._keys)}
+        self._free = []
+        self._matrix = (
+            np.stack([self._entries[k].embedding for k in self._keys]) if self._keys else None
+        )
+        self._stale = False
+
+    def _set_row(self, key, embedding):
+        if self._stale:
+            return
+        if embedding is None:
+            self._drop_row(key)
+            return
+        row = self._rows.get(key)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._keys)
+                self._keys.append(None)
+                if self._matrix is None:
+                    self._matrix = np.zeros((16, len(embedding)), dtype=np.float32)
+                elif row >= len(self._matrix):
+                    # Grow by doubling so appends stay amortized O(1)
+                    grown = np.zeros((2 * len(self._matrix), self._matrix.shape[1]), dtype=np.float32)
+                    grown[:row] = self._matrix[:row]
+                    self._matrix = grown
+            self._keys[row] = key
+            self._rows[key] = row
+        self._matrix[row] = embedding
+
+    def _drop_row(self, key):
+        if self._stale:
+            return
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._keys[row] = None
+            self._matrix[row] = 0
+            self._free.append(row)
+
+    def _similar(self, embedding, literals, now):
+        if self._stale:
+            self._rebuild()
+        if not self._keys:
+            return None
+        scores = self._matrix[:len(self._keys)] @ embedding
+        for i in np.argsort(scores)[::-1]:
+            if scores[i] < self.threshold:
+                return None
+            if self._keys[i] is None:
+                continue
+            entry = self._entries.get(self._keys[i])
+            if entry is not None and entry.literals == literals and not self._expired(entry, now):
+                return self._keys[i]
+        return None
+
+    def get(self, question):
+        """Return cached SQL for question, or None."""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    self._drop_row(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    CACHE_LOOKUPS.inc(cache="sql", result="exact")
+                    return entry.sql
+
+        embedding = self._semantic_embedding(key)
+        with self._lock:
+            match = None if embedding is None else self._similar(embedding, _literals(key), now)
+            if match is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="sql", result="miss")
+                return None
+            self._entries.move_to_end(match)
+            self.semantic_hits += 1
+            CACHE_LOOKUPS.inc(cache="sql", result="semantic")
+            sql, created = self._entries[match].sql, self._entries[match].created
+        # Remember the paraphrase too (same expiry) so its next occurrence is an exact hit
+        self.put(question, sql, embedding, created)
+        return sql
+
+    def put(self, question, sql, embedding=None, created=None):
+        key = normalize_question(question)
+        if embedding is None:
+            embedding = self._semantic_embedding(key)
+        with self._lock:
+            self._entries[key] = _Entry(sql, created or time.time(), embedding, _literals(key))
+            self._entries.move_to_end(key)
+            self._set_row(key, embedding)
+            while len(self._entries) > self.max_entries:
+                self._drop_row(self._entries.popitem(last=False)[0])
+            self._unsaved += 1
+            autosave = self.path and self._unsaved >= self.autosave_every
+        if autosave:
+            self.save()
+
+    def discard(self, question):
+        """Forget the SQL for question, e.g. after it failed to execute."""
+        with self._lock:
+            key = normalize_question(question)
+            if self._entries.pop(key, None) is not None:
+                self._drop_row(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stale = True
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            entries = [
+                {
+                    "question": key,
+                    "sql": e.sql,
+                    "created": e.created,
+                    "embedding": None if e.embedding is None
+                    else base64.b64encode(e.embedding.astype(np.float32).tobytes()).decode(),
+                }
+                for key, e in self._entries.items()
+            ]
+            self._unsaved = 0
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"schema": self.schema, "entries": entries}, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read SQL cache {path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            self.schema = data.get("schema")
+            for item in data.get("entries", []):
+                embedding = item.get("embedding")
+                if embedding is not None:
+                    embedding = np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+                entry = _Entry(item["sql"], item["created"], embedding, _literals(item["question"]))
+                if not self._expired(entry, now):
+                    self._entries[item["question"]] = entry
+            self._stale = True
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else None,
+        }
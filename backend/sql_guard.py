@@ -0,0 +1,348 @@
+import json
+import re
+import threading
+from collections import Counter, namedtuple
+
+import psycopg2
+
+from db_pool import PoolTimeout
+from metrics import SQL_REJECTED, stage
+
+# Tables generated SQL may read (besides its own CTEs)
+ALLOWED_TABLES = {"profiles", "profile_stats", "measurements", "profile_measurements"}
+# Set-returning functions allowed as FROM items
+ALLOWED_FROM_FUNCTIONS = {"unnest"}
+# Words that never belong in a read-only query, wherever they appear
+FORBIDDEN_KEYWORDS = {
+    "insert", "update", "delete", "merge", "upsert", "drop", "alter", "create", "truncate",
+    "grant", "revoke", "copy", "call", "do", "execute", "prepare", "deallocate", "lock",
+    "vacuum", "analyze", "cluster", "reindex", "refresh", "comment", "security", "set", "reset",
+    "listen", "notify", "unlisten", "load", "discard", "checkpoint", "into", "recursive",
+    "current_user", "session_user", "current_role", "current_catalog", "current_schema",
+}
+# Functions generated SQL may call; anything else (lo_*, current_setting, set_config,
+# dblink, ...) is rejected, and schema-qualified calls are never allowed
+ALLOWED_FUNCTIONS = {
+    # aggregates and window functions
+    "count", "sum", "avg", "min", "max", "stddev", "stddev_pop", "stddev_samp", "variance",
+    "var_pop", "var_samp", "percentile_cont", "percentile_disc", "mode", "array_agg", "string_agg",
+    "bool_and", "bool_or", "every", "corr", "covar_pop", "covar_samp", "regr_slope",
+    "regr_intercept", "regr_r2", "regr_count", "row_number", "rank", "dense_rank", "percent_rank",
+    "cume_dist", "ntile", "lag", "lead", "first_value", "last_value", "nth_value",
+    # math
+    "abs", "ceil", "ceiling", "floor", "round", "trunc", "sqrt", "cbrt", "power", "exp", "ln", "log",
+    "log10", "mod", "sign", "pi", "degrees", "radians", "sin", "cos", "tan", "asin", "acos", "atan",
+    "atan2", "sind", "cosd", "tand", "asind", "acosd", "atand", "atan2d", "width_bucket", "random",
+    # conditional
+    "coalesce", "nullif", "greatest", "least",
+    # date and time
+    "now", "date_trunc", "date_part", "date_bin", "extract", "age", "make_date", "make_timestamp",
+    "make_interval", "to_char", "to_date", "to_timestamp", "justify_days", "justify_interval",
+    # strings and arrays
+    "lower", "upper", "length", "char_length", "substring", "substr", "trim", "btrim", "ltrim",
+    "rtrim", "concat", "concat_ws", "replace", "position", "strpos", "left", "right", "split_part",
+    "initcap", "starts_with", "regexp_replace", "regexp_match", "unnest", "array_length",
+    "cardinality", "array_position", "array_to_string",
+    # PostGIS
+    "st_makepoint", "st_point", "st_setsrid", "st_expand", "st_makeenvelope", "st_dwithin",
+    "st_distance", "st_distancesphere", "st_contains", "st_within", "st_intersects", "st_x", "st_y",
+    "st_astext", "st_geomfromtext", "st_geogfromtext", "st_buffer",
+}
+# Keywords and type names that may be followed by "(" without being a function call
+_PAREN_KEYWORDS = {
+    "in", "exists", "any", "all", "some", "as", "over", "filter", "within", "values", "cast", "and",
+    "or", "not", "select", "from", "join", "on", "where", "using", "lateral", "then", "else", "when",
+    "case", "between", "is", "like", "ilike", "by", "distinct", "row", "array", "union", "intersect",
+    "except", "with", "materialized", "sets", "cube", "rollup",
+    "numeric", "decimal", "varchar", "char", "character", "varying", "timestamp", "time", "interval",
+}
+# Functions whose argument lists contain FROM (EXTRACT(year FROM ...), ...)
+_FROM_ARGUMENT_FUNCTIONS = {"extract", "substring", "trim", "overlay", "position"}
+# Keywords that end a FROM list
+_CLAUSE_KEYWORDS = {
+    "where", "group", "having", "order", "limit", "offset", "fetch", "window", "union",
+    "intersect", "except", "join", "inner", "left", "right", "full", "cross", "natural", "on", "using",
+}
+_JOIN_NODES = {"Nested Loop", "Hash Join", "Merge Join"}
+
+Token = namedtuple("Token", "kind text value start end")
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>[eE]'(?:[^'\\]|\\.|'')*'|[bBxXnN]?'(?:[^']|'')*')
+  | (?P<dollar>\$(?P<tag>[A-Za-z_]\w*|)\$.*?\$(?P=tag)\$)
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<param>\$\d+|%s|%\(\w+\)s)
+  | (?P<word>[A-Za-z_][A-Za-z_0-9$]*)
+  | (?P<op>::|<=|>=|<>|!=|\|\||->>|->|\#>>|\#>|@>|<@|&&|[-+*/%^<>=~!@\#&|`?])
+  | (?P<punct>[(),;.\[\]:])
+""", re.S | re.X)
+
+
+class RejectedQuery(ValueError):
+    """Generated SQL that must not run; kind says which check failed."""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+def tokenize(sql):
+    """Tokens of sql, skipping whitespace and comments; raises RejectedQuery on unterminated text."""
+    tokens, pos = [], 0
+    while pos < len(sql):
+        m = _TOKEN.match(sql, pos)
+        if m is None:
+            raise RejectedQuery("parse", f"Could not parse SQL near: {sql[pos:pos + 30]!r}")
+        kind = m.lastgroup if m.lastgroup != "tag" else "dollar"
+        if kind not in ("space", "comment"):
+            text = m.group(0)
+            if kind == "word":
+                value = text.lower()
+            elif kind == "quoted":
+                value = text[1:-1].replace('""', '"')
+            else:
+                value = text
+            tokens.append(Token(kind, text, value, m.start(), m.end()))
+        pos = m.end()
+    return tokens
+
+
+def _depths_and_openers(tokens):
+    """Paren depth of every token and the word (if any) before the paren enclosing it."""
+    depths, openers, stack = [], [], []
+    for i, t in enumerate(tokens):
+        if t.text == ")":
+            if not stack:
+                raise RejectedQuery("parse", "Unbalanced parentheses")
+            stack.pop()
+        depths.append(len(stack))
+        openers.append(stack[-1] if stack else None)
+        if t.text == "(":
+            prev = tokens[i - 1] if i else None
+            stack.append(prev.value if prev is not None and prev.kind == "word" else None)
+    if stack:
+        raise RejectedQuery("parse", "Unbalanced parentheses")
+    return depths, openers
+
+
+def _cte_names(tokens, depths):
+    names = set()
+    for i in range(1, len(tokens) - 2):
+        t = tokens[i]
+        if depths[i] == 0 and t.kind in ("word", "quoted") and tokens[i - 1].value in ("with", ","):
+            j = i + 1
+            if tokens[j].value != "as":
+                continue
+            j += 1
+            while j < len(tokens) and tokens[j].value in ("not", "materialized"):
+                j += 1
+            if j < len(tokens) and tokens[j].text == "(":
+                names.add(t.value)
+    return names
+
+
+def _from_items(tokens, depths, openers):
+    """(kind, schema, name) for every relation or function read in a FROM/JOIN clause."""
+    n = len(tokens)
+    for i, t in enumerate(tokens):
+        if t.kind != "word" or t.value not in ("from", "join"):
+            continue
+        if t.value == "from":
+            if openers[i] in _FROM_ARGUMENT_FUNCTIONS:
+                continue
+            if i >= 2 and tokens[i - 1].value == "distinct" and tokens[i - 2].value in ("is", "not"):
+                continue
+        j, depth = i + 1, depths[i]
+        while j < n:
+            while j < n and tokens[j].value in ("lateral", "only"):
+                j += 1
+            if j >= n:
+                raise RejectedQuery("parse", f"Missing relation after {t.value.upper()}")
+            if tokens[j].text == "(":
+                # Subquery or parenthesized join; its own FROM/JOIN is visited separately
+                pass
+            elif tokens[j].kind in ("word", "quoted"):
+                parts = [tokens[j]]
+                while j + 2 < n and tokens[j + 1].text == "." and tokens[j + 2].kind in ("word", "quoted"):
+                    parts.append(tokens[j + 2])
+                    j += 2
+                schema = parts[-2].value if len(parts) > 1 else None
+                if len(parts) > 2:
+                    raise RejectedQuery("table", "Cross-database references are not allowed")
+                is_call = j + 1 < n and tokens[j + 1].text == "("
+                yield ("function" if is_call else "table"), schema, parts[-1].value
+            else:
+                raise RejectedQuery("parse", f"Unexpected {tokens[j].text!r} after {t.value.upper()}")
+            if t.value == "join":
+                break
+            # Continue at the next comma of this FROM list, stopping at the clause that ends it
+            j += 1
+            while j < n and depths[j] >= depth:
+                if depths[j] == depth and (tokens[j].text == "," or tokens[j].value in _CLAUSE_KEYWORDS):
+                    break
+                j += 1
+            if j >= n or depths[j] < depth or tokens[j].text != ",":
+                break
+            j += 1
+
+
+class SQLGuard:
+    """
+    Checks generated SQL before it runs.
+
+    validate() parses the statement with a small tokenizer and requires a
+    single read-only SELECT (or WITH ... SELECT) over ALLOWED_TABLES that
+    calls only ALLOWED_FUNCTIONS; the top-level LIMIT is injected, or clamped to max_rows. check() then runs
+    EXPLAIN (FORMAT JSON) and rejects plans whose estimated total cost
+    exceeds max_cost, or whose result or any join is estimated above
+    max_plan_rows rows. If the database can't be reached the plan check is
+    skipped; execution will report the error.
+    """
+
+    def __init__(self, pool=None, allowed_tables=ALLOWED_TABLES, max_rows=100,
+                 max_cost=500_000.0, max_plan_rows=5_000_000, explain_timeout_ms=2_000):
+        self.pool = pool
+        self.allowed_tables = set(allowed_tables)
+        self.max_rows = max_rows
+        self.max_cost = max_cost
+        self.max_plan_rows = max_plan_rows
+        self.explain_timeout_ms = explain_timeout_ms
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def validate(self, sql):
+        """Statically checked SQL with its LIMIT enforced; raises RejectedQuery."""
+        tokens = tokenize(sql or "")
+        while tokens and tokens[-1].text == ";":
+            tokens.pop()
+        if not tokens:
+            raise RejectedQuery("statement", "Empty query")
+        if any(t.text == ";" for t in tokens):
+            raise RejectedQuery("statement", "Only a single statement is allowed")
+        if tokens[0].value not in ("select", "with"):
+            raise RejectedQuery("statement", f"Only SELECT queries are allowed, not {tokens[0].text.upper()}")
+
+        for i, t in enumerate(tokens):
+            if t.kind != "word":
+                continue
+            if t.value in FORBIDDEN_KEYWORDS:
+                raise RejectedQuery("statement", f"{t.text.upper()} is not allowed in a read-only query")
+            if t.value == "for" and i + 1 < len(tokens) and tokens[i + 1].value in ("share", "no", "key"):
+                raise RejectedQuery("statement", "Row locking clauses are not allowed")
+            if t.value.startswith("pg_") or t.value in ("information_schema",):
+                raise RejectedQuery("function", f"{t.text} is not allowed")
+        for i, t in enumerate(tokens[:-1]):
+            if t.kind in ("word", "quoted") and tokens[i + 1].text == "(":
+                self._check_call(tokens, i)
+
+        depths, openers = _depths_and_openers(tokens)
+        ctes = _cte_names(tokens, depths)
+        for kind, schema, name in _from_items(tokens, depths, openers):
+            if kind == "function":
+                if schema is not None or name not in ALLOWED_FROM_FUNCTIONS:
+                    raise RejectedQuery("function", f"{name}() is not allowed in FROM")
+            elif schema not in (None, "public") or (name not in self.allowed_tables and name not in ctes):
+                table = f"{schema}.{name}" if schema else name
+                raise RejectedQuery(
+                    "table", f"Table {table} is not allowed; use {', '.join(sorted(self.allowed_tables))}"
+                )
+
+        return self._limited(sql, tokens, depths)
+
+    def _check_call(self, tokens, i):
+        t, prev = tokens[i], tokens[i - 1] if i else None
+        if t.kind == "word" and t.value in _PAREN_KEYWORDS:
+            return
+        if prev is not None and prev.value == "as":
+            # Column list of an alias: unnest(...) AS u(x)
+            return
+        if prev is not None and prev.text == ".":
+            raise RejectedQuery("function", f"Schema-qualified call {t.text}() is not allowed")
+        if t.value not in ALLOWED_FUNCTIONS:
+            raise RejectedQuery("function", f"{t.text}() is not an allowed function")
+
+    def _limited(self, sql, tokens, depths):
+        body = sql[tokens[0].start:tokens[-1].end]
+        top = [i for i, d in enumerate(depths) if d == 0]
+        limit = [i for i in top if tokens[i].value == "limit"]
+        fetch = [i for i in top if tokens[i].value == "fetch"]
+        if not limit and not fetch:
+            self._count("limit_injected")
+            return f"{body} LIMIT {self.max_rows}"
+        if limit and not fetch and limit[-1] + 1 < len(tokens):
+            value = tokens[limit[-1] + 1]
+            if value.kind == "number" and value.text.isdigit():
+                if int(value.text) <= self.max_rows:
+                    return body
+                self._count("limit_clamped")
+                start, end = value.start - tokens[0].start, value.end - tokens[0].start
+                return f"{body[:start]}{self.max_rows}{body[end:]}"
+        # LIMIT ALL, a parameter or an expression, or FETCH FIRST: cap from outside
+        self._count("limit_clamped")
+        return f"SELECT * FROM ({body}) AS guarded LIMIT {self.max_rows}"
+
+    def explain(self, sql):
+        """(total cost, largest row estimate of the result or any join) for sql."""
+        _, rows = self.pool.fetch(f"EXPLAIN (FORMAT JSON) {sql}", timeout_ms=self.explain_timeout_ms)
+        plan = rows[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]["Plan"]
+        estimate, nodes = root["Plan Rows"], [root]
+        while nodes:
+            node = nodes.pop()
+            if node.get("Node Type") in _JOIN_NODES:
+                estimate = max(estimate, node["Plan Rows"])
+            nodes.extend(node.get("Plans", []))
+        return root["Total Cost"], estimate
+
+    def check(self, sql):
+        """validate() plus the plan check; returns the SQL to run or raises RejectedQuery."""
+        self._count("checked")
+        try:
+            with stage("sql_validate"):
+                sql = self.validate(sql)
+            if self.pool is not None:
+                with stage("sql_explain"):
+                    self._check_plan(sql)
+        except RejectedQuery as e:
+            self._count(f"rejected_{e.kind}")
+            SQL_REJECTED.inc(kind=e.kind)
+            raise
+        return sql
+
+    def _check_plan(self, sql):
+        try:
+            cost, rows = self.explain(sql)
+        except psycopg2.Error as e:
+            if e.pgcode is None:
+                self._count("plan_skipped")
+                return
+            # Reported by the server: syntax errors, unknown columns, planning timeouts
+            raise RejectedQuery("plan", (e.pgerror or str(e)).strip())
+        except PoolTimeout:
+            self._count("plan_skipped")
+            return
+        if cost > self.max_cost:
+            raise RejectedQuery(
+                "cost", f"Estimated cost {cost:,.0f} exceeds {self.max_cost:,.0f}; "
+                "add selective filters (date_time, ocean, latitude/longitude) or use profile_stats"
+            )
+        if rows > self.max_plan_rows:
+            raise RejectedQuery(
+                "rows", f"Estimated {rows:,.0f} intermediate rows exceed {self.max_plan_rows:,}; "
+                "avoid cross joins and join on profile_id"
+            )
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        rejected = sum(v for k, v in counts.items() if k.startswith("rejected_"))
+        return {**counts, "rejected": rejected}
@@ -0,0 +1,41 @@
+import threading
+from collections import deque
+
+
+def _pick(samples, q):
+    return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+class LatencyWindow:
+    """Rolling window of recent durations (ms) with percentile summaries (p50/p95/p99)."""
+
+    def __init__(self, size=2048):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+            self.count += 1
+            self.total_ms += ms
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        return _pick(samples, q) if samples else None
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3),
+            "p50_ms": round(_pick(samples, 50), 3),
+            "p95_ms": round(_pick(samples, 95), 3),
+            "p99_ms": round(_pick(samples, 99), 3),
+            "max_ms": round(samples[-1], 3),
+        }
@@ -0,0 +1,123 @@
+"""
+Before/after benchmark for flattening parsed profiles into the long table.
+
+The bundled data/raw/profiles set is parsed once and then replicated
+`--scale` times under synthetic file names, so only the flatten + frame
+construction (and optionally CSV write) is timed.
+
+    cd benchmarks && python bench_build_clean.py --scale 200
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from fetch_profiles import parse_profile  # noqa: E402
+from load_index import load_argo_index  # noqa: E402
+from preprocess import flatten_profiles, profile_arrays  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def legacy_flatten(df_meta, profiles):
+    """The original per-level dict records path, kept as the baseline."""
+    # The original loader read coordinates as float64; widen the float32 index
+    # columns through their repr as flatten_profiles does so the CSVs compare
+    df_meta = df_meta.assign(**{
+        c: pd.to_numeric(df_meta[c].astype(str), errors="coerce") for c in ("latitude", "longitude")
+    })
+    records = []
+    for (_, row), profile in zip(df_meta.iterrows(), profiles):
+        pres = profile.get("PRES", [])
+        temp = profile.get("TEMP", [])
+        psal = profile.get("PSAL")
+        psal = [None] * len(pres) if psal is None else psal
+        for p, t, s in zip(pres, temp, psal):
+            records.append({
+                "float_file": row["file"],
+                "date": row["date"],
+                "lat": row["latitude"],
+                "lon": row["longitude"],
+                "ocean": row["ocean"],
+                "profiler_type": row["profiler_type"],
+                "pressure": p,
+                "temperature": t,
+                "salinity": s
+            })
+    return pd.DataFrame(records)
+
+
+def columnar_flatten(df_meta, profiles):
+    return flatten_profiles(df_meta, [profile_arrays(p) for p in profiles])
+
+
+def load_bundled():
+    df_index = load_argo_index(os.path.join(ROOT, "data/raw/ArgoFloats-index.csv"))
+    df_index = df_index.dropna(subset=["file"]).set_index(
+        df_index["file"].dropna().map(os.path.basename)
+    )
+    metas, profiles = [], []
+    for path in sorted(glob.glob(os.path.join(ROOT, "data/raw/profiles/*.nc"))):
+        name = os.path.basename(path)
+        if name not in df_index.index:
+            continue
+        try:
+            profiles.append(parse_profile(path))
+        except Exception:
+            continue
+        metas.append(df_index.loc[name])
+    return pd.DataFrame(metas).reset_index(drop=True), profiles
+
+
+def scale_up(df_meta, profiles, scale):
+    frames = []
+    for k in range(scale):
+        df = df_meta.copy()
+        df["file"] = df["file"].str.replace(".nc", f"_s{k:05d}.nc", regex=False)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True), profiles * scale
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=100, help="Replicas of the bundled profiles")
+    parser.add_argument("--csv", action="store_true", help="Also time to_csv and compare the output")
+    args = parser.parse_args()
+
+    df_meta, profiles = load_bundled()
+    df_meta, profiles = scale_up(df_meta, profiles, args.scale)
+    print(f"📦 {len(profiles)} profiles ({args.scale}x bundled set)")
+
+    results = {}
+    for name, fn in (("legacy", legacy_flatten), ("columnar", columnar_flatten)):
+        df, elapsed, peak = measure(fn, df_meta, profiles)
+        results[name] = df
+        print(f"  {name:<9} {len(df):>10} rows  {elapsed:8.3f}s  peak {peak / 1e6:8.1f} MB  "
+              f"frame {df.memory_usage(deep=True).sum() / 1e6:8.1f} MB")
+
+    if args.csv:
+        out = {}
+        for name, df in results.items():
+            start = time.perf_counter()
+            out[name] = df.to_csv(index=False)
+            print(f"  {name:<9} to_csv {time.perf_counter() - start:8.3f}s")
+        print("✅ CSV output identical" if out["legacy"] == out["columnar"] else "❌ CSV output differs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+/chat under concurrent load with a stubbed LLM and database: --clients
+clients fire at once, asking --questions distinct (previously unseen)
+questions between them, for --rounds rounds. Runs with single-flight
+coalescing on and off and reports throughput, latency and how many LLM
+calls and queries were made.
+
+    cd benchmarks && python bench_chat_concurrency.py --clients 128 --questions 8
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from offline_app import StubDatabase, load_app
+from llm_client import StubLLM  # noqa: E402  (backend/ is put on sys.path by offline_app)
+
+
+def question(tag, r, i):
+    return f"floats {tag} {r} {i}"
+
+
+async def run(app, clients, questions, rounds, tag):
+    transport = httpx.ASGITransport(app=app.app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def ask(question):
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"question": question})
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for r in range(rounds):
+            await asyncio.gather(*(ask(question(tag, r, i % questions)) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+    return elapsed, np.array(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent /chat load test with a stubbed LLM")
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--questions", type=int, default=8, help="distinct questions per burst")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--llm-ms", type=float, default=400.0)
+    parser.add_argument("--query-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = load_app(tmp_dir, FAST_PATH=0)
+        canned = {
+            question(tag, r, i): f"SELECT profile_id, date_time FROM profiles WHERE summary ILIKE '%{tag} {r} {i}%'"
+            for tag in ("on", "off") for r in range(args.rounds) for i in range(args.questions)
+        }
+        llm = app.rag_model.client = StubLLM(canned, latency=f"fixed:{args.llm_ms}")
+        db = StubDatabase(latency=f"fixed:{args.query_ms}").install(app)
+        app.data_version.current = lambda: None  # no result cache: every miss goes to the database
+        print(f"{args.clients} concurrent clients, {args.questions} questions per burst, {args.rounds} rounds, "
+              f"LLM {args.llm_ms:.0f} ms, query {args.query_ms:.0f} ms")
+        for coalesce in (False, True):
+            app.generate_flight.enabled = app.query_flight.enabled = coalesce
+            llm.calls, db.queries = 0, 0
+            elapsed, latencies = asyncio.run(
+                run(app, args.clients, args.questions, args.rounds, "on" if coalesce else "off")
+            )
+            print(f"single-flight {'on ' if coalesce else 'off'}  {len(latencies) / elapsed:8.1f} req/s  "
+                  f"p50 {np.percentile(latencies, 50):7.1f} ms  p99 {np.percentile(latencies, 99):7.1f} ms  "
+                  f"LLM calls {llm.calls:5d}  queries {db.queries:5d}")
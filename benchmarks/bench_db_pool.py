@@ -0,0 +1,73 @@
+"""
+Per-request psycopg2.connect vs the shared DBPool under concurrent load.
+
+Needs a reachable Postgres (a throwaway one is fine):
+
+    cd benchmarks
+    python bench_db_pool.py --dsn "dbname=argo_db user=postgres host=localhost" --clients 32
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from db_pool import DBPool  # noqa: E402
+from stats import LatencyWindow  # noqa: E402
+
+
+def per_request(dsn, sql):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            cur.fetchall()
+    finally:
+        conn.close()
+
+
+def run(name, call, clients, requests_per_client):
+    latency = LatencyWindow(size=clients * requests_per_client)
+    errors = []
+
+    def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                call()
+            except Exception as e:  # keep going; report the count
+                errors.append(e)
+                continue
+            latency.record((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    summary = latency.summary()
+    print(f"{name:<12} {summary.get('p50_ms', 0):9.2f} {summary.get('p99_ms', 0):9.2f} "
+          f"{latency.count / elapsed:10.1f} {len(errors):7d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-request connections with the pool")
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--sql", default="SELECT profile_id, date_time FROM profiles LIMIT 100")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per client")
+    parser.add_argument("--maxconn", type=int, default=10)
+    args = parser.parse_args()
+
+    pool = DBPool(psycopg2.extensions.parse_dsn(args.dsn), maxconn=args.maxconn, acquire_timeout=30)
+    pool.open()
+    print(f"{'mode':<12} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>10} {'errors':>7}")
+    run("connect", lambda: per_request(args.dsn, args.sql), args.clients, args.requests)
+    run("pool", lambda: pool.fetch(args.sql), args.clients, args.requests)
+    print(f"pool wait: {pool.wait.summary()}")
+    pool.close()
@@ -0,0 +1,75 @@
+"""
+Per-file decode latency: xarray path vs the netCDF4 fast path, on the
+bundled data/raw/profiles/R13857_*.nc files.
+
+    cd benchmarks && python bench_decode.py --repeat 20
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from fetch_profiles import _parse_profile_xarray, decode_profile  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def time_per_file(fn, paths, repeat, **kwargs):
+    """Median seconds per call for each file that decodes."""
+    timings = []
+    for path in paths:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(path, **kwargs)
+            samples.append(time.perf_counter() - start)
+        timings.append(statistics.median(samples))
+    return timings
+
+
+def same(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    if a.dtype.kind == "f":
+        return np.array_equal(a, b, equal_nan=True)
+    # xarray masks blank QC flags to NaN; the fast path keeps the raw b" "
+    normalize = lambda x: np.array([b" " if v is np.nan or v != v else v for v in x], dtype="S1")
+    return np.array_equal(normalize(a), normalize(b))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--counterparts", action="store_true",
+                        help="Also read the _QC / _ADJUSTED variables")
+    args = parser.parse_args()
+
+    paths = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "data/raw/profiles/R13857_*.nc"))):
+        try:
+            fast = decode_profile(path, counterparts=args.counterparts)
+            slow = _parse_profile_xarray(path, counterparts=args.counterparts)
+        except Exception:
+            continue  # truncated downloads in the bundle
+        mismatched = [k for k in fast if not same(fast[k], slow[k])]
+        if mismatched:
+            print(f"❌ {os.path.basename(path)} differs in {mismatched}")
+        paths.append(path)
+    print(f"📦 {len(paths)} decodable files, {args.repeat} repeats each")
+
+    results = {}
+    for name, fn in (("xarray", _parse_profile_xarray), ("netCDF4", decode_profile)):
+        timings = time_per_file(fn, paths, args.repeat, counterparts=args.counterparts)
+        results[name] = statistics.median(timings)
+        print(f"  {name:<8} median {results[name] * 1e3:7.3f} ms/file  "
+              f"p90 {statistics.quantiles(timings, n=10)[-1] * 1e3:7.3f} ms/file")
+    print(f"⚡ speedup {results['xarray'] / results['netCDF4']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+/profiles/{profile_id} body construction: per-request pandas read +
+to_dict(records) vs the memory-mapped, cached ProfileStore. Also times
+/profiles/batch bodies (projection, pressure range, downsampling) read
+sequentially vs on the store's worker pool.
+
+    cd benchmarks && python bench_profile_endpoint.py --profiles 200 --levels 2000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from profile_store import ProfileStore, encode_batch  # noqa: E402
+
+
+def legacy_body(root, profile_id):
+    """What the endpoint used to do on every request."""
+    df = pd.read_parquet(os.path.join(root, f"{profile_id}.parquet"))
+    depth_series = df[["PRES", "TEMP", "PSAL"]].to_dict(orient="records")
+    return json.dumps({"profile_id": profile_id, "depth_series": depth_series}).encode()
+
+
+def store_body(store, profile_id, representation):
+    return store.encode(store.get(profile_id), profile_id, representation)
+
+
+def measure(name, fn, ids, rounds):
+    fn(ids[0])  # warm imports
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for profile_id in ids:
+            fn(profile_id)
+    per_request = (time.perf_counter() - start) / (rounds * len(ids))
+
+    # Allocation peak of a single request, traced separately so timing isn't skewed
+    tracemalloc.start()
+    peaks = []
+    for profile_id in ids:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(profile_id)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    print(f"{name:<22} {per_request * 1e6:10.1f} µs/req  peak alloc {np.median(peaks) / 1e3:9.1f} kB/req")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile endpoint body construction benchmark")
+    parser.add_argument("--profiles", type=int, default=200)
+    parser.add_argument("--levels", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as root:
+        ids = [f"R{1900000 + i}_001" for i in range(args.profiles)]
+        for profile_id in ids:
+            pres = np.sort(rng.uniform(0, 2000, args.levels)).astype(np.float32)
+            pd.DataFrame({
+                "PRES": pres,
+                "TEMP": (20 * np.exp(-pres / 500)).astype(np.float32),
+                "PSAL": np.full(args.levels, 35.0, dtype=np.float32),
+            }).to_parquet(os.path.join(root, f"{profile_id}.parquet"))
+
+        store = ProfileStore(root, max_entries=args.profiles)
+        print(f"{args.profiles} profiles x {args.levels} levels, {args.rounds} rounds")
+        measure("legacy records", lambda p: legacy_body(root, p), ids, args.rounds)
+        measure("store json", lambda p: store_body(store, p, "json"), ids, args.rounds)
+        measure("store arrow", lambda p: store_body(store, p, "arrow"), ids, args.rounds)
+        cold = ProfileStore(root, max_entries=1)
+        measure("store json (cold)", lambda p: store_body(cold, p, "json"), ids, 1)
+
+        options = dict(variables=["TEMP"], pressure_range=(0, 1000), max_levels=100, method="bin")
+        for workers in (1, 8):
+            batch_store = ProfileStore(root, max_entries=1, workers=workers)
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                body = encode_batch(*batch_store.select_many(ids, **options), "json")
+            elapsed = (time.perf_counter() - start) / args.rounds
+            print(f"batch x{len(ids)} ({workers} worker{'s' * (workers > 1)}) "
+                  f"{elapsed * 1e3:8.1f} ms/req  body {len(body) / 1e3:9.1f} kB")
@@ -0,0 +1,204 @@
+"""
+Load generator for /chat and /profiles/{profile_id}: replays a question
+corpus at fixed concurrency and reports throughput and p50/p95/p99 latency
+per endpoint, plus the server's per-stage timings from /stats.
+
+By default the app runs in-process with the stub LLM and stub database
+from offline_app (no Gemini key or Postgres needed; client and server
+share one event loop, so latencies include the client's overhead):
+
+    cd benchmarks && python load_chat.py --concurrency 64 --requests 5000
+
+Against a running server (for offline runs start it with LLM_BACKEND=stub
+and STUB_LLM_SQL=benchmarks/chat_corpus.json):
+
+    python load_chat.py --url http://localhost:8000 --profile-ids ids.txt --out results/chat.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def workload(corpus, profile_ids, profiles_share, skew, seed):
+    """Endless, seeded sequence of (endpoint, argument); questions are Zipf-distributed."""
+    rng = random.Random(seed)
+    questions = [item["question"] for item in corpus]
+    rng.shuffle(questions)
+    weights = [1.0 / (rank + 1) ** skew for rank in range(len(questions))]
+    while True:
+        if profile_ids and rng.random() < profiles_share:
+            yield "profiles", rng.choice(profile_ids)
+        else:
+            yield "chat", rng.choices(questions, weights)[0]
+
+
+async def run_load(client, requests, concurrency, requests_total, duration):
+    samples = {"chat": [], "profiles": []}
+    errors = {"chat": 0, "profiles": 0}
+    sizes = {"chat": 0, "profiles": 0}
+    deadline = time.perf_counter() + duration if duration else None
+    issued = 0
+
+    def next_request():
+        nonlocal issued
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        if deadline is None and issued >= requests_total:
+            return None
+        issued += 1
+        return next(requests)
+
+    async def worker():
+        while (request := next_request()) is not None:
+            endpoint, argument = request
+            start = time.perf_counter()
+            try:
+                if endpoint == "chat":
+                    response = await client.post("/chat", json={"question": argument})
+                else:
+                    response = await client.get(f"/profiles/{argument}")
+                ok = response.status_code < 400
+                sizes[endpoint] += len(response.content)
+            except httpx.HTTPError:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            if ok:
+                samples[endpoint].append(elapsed)
+            else:
+                errors[endpoint] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return wall, samples, errors, sizes
+
+
+def summarize(values, errors, wall, nbytes=0):
+    values = np.asarray(values)
+    if not len(values):
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": int(len(values)),
+        "errors": errors,
+        "throughput_rps": round(len(values) / wall, 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+        "mean_bytes": round(nbytes / len(values)),
+    }
+
+
+def server_stages(stats):
+    """Per-stage latency summaries from /stats, flattened to "group.stage" names."""
+    stages = {}
+    for group in ("chat", "sql_generation"):
+        for source, summary in stats.get(group, {}).items():
+            if isinstance(summary, dict) and summary.get("count"):
+                stages[f"{group}.{source}"] = summary
+    for stage in ("wait", "query"):
+        summary = stats.get("db_pool", {}).get(stage, {})
+        if summary.get("count"):
+            stages[f"db_pool.{stage}"] = summary
+    parser = stats.get("sql_generation", {}).get("fast_path_parser", {})
+    if parser.get("parse", {}).get("count"):
+        stages["fast_path.parse"] = parser["parse"]
+    return stages
+
+
+def print_report(endpoints, stages, counters):
+    print(f"{'endpoint':<26}{'ok':>8}{'errors':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, s in endpoints.items():
+        if s["requests"]:
+            print(f"{name:<26}{s['requests']:>8}{s['errors']:>8}{s['throughput_rps']:>9.1f}"
+                  f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+    if stages:
+        print(f"\n{'server stage':<26}{'count':>8}{'':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for name, s in stages.items():
+            print(f"{name:<26}{s['count']:>8}{'':>8}{s['mean_ms']:>9.2f}{s['p50_ms']:>9.2f}"
+                  f"{s.get('p95_ms', float('nan')):>9.2f}{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}")
+    if counters:
+        print("\n" + "  ".join(f"{k}={v}" for k, v in counters.items()))
+
+
+async def main(args):
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = app = None
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+            profile_ids = []
+            if args.profile_ids:
+                with open(args.profile_ids) as f:
+                    profile_ids = [line.strip() for line in f if line.strip()]
+        else:
+            from offline_app import StubDatabase, load_app, write_profiles
+            profiles_dir = os.path.join(tmp_dir, "profiles")
+            profile_ids = write_profiles(profiles_dir, args.profiles, levels=args.levels, seed=args.seed)
+            app = load_app(tmp_dir, corpus=args.corpus, llm_latency=args.llm_latency, profiles_dir=profiles_dir)
+            db = StubDatabase(latency=args.db_latency, seed=args.seed).install(app)
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app.app), base_url="http://load", timeout=args.timeout
+            )
+
+        async with client:
+            requests = workload(corpus, profile_ids, args.profiles_share, args.skew, args.seed)
+            wall, samples, errors, sizes = await run_load(
+                client, requests, args.concurrency, args.requests, args.duration
+            )
+            stats = (await client.get("/stats")).json()
+
+    endpoints = {name: summarize(samples[name], errors[name], wall, sizes[name]) for name in samples}
+    endpoints["all"] = summarize(samples["chat"] + samples["profiles"], sum(errors.values()), wall)
+    stages = server_stages(stats)
+    if db is not None:
+        stages["database (stub)"] = db.latency.summary()
+    counters = {
+        "fast_path_hit_rate": stats.get("sql_generation", {}).get("fast_path_parser", {}).get("hit_rate"),
+        "sql_cache_hit_rate": stats.get("sql_cache", {}).get("hit_rate"),
+        "result_cache_hit_rate": stats.get("result_cache", {}).get("hit_rate"),
+        "profile_store_hit_rate": stats.get("profile_store", {}).get("hit_rate"),
+        "llm_calls": app.rag_model.client.calls if app is not None else None,
+        "db_queries": db.queries if db is not None else None,
+    }
+    counters = {k: v for k, v in counters.items() if v is not None}
+    print(f"{args.concurrency} concurrent clients, {wall:.1f} s")
+    print_report(endpoints, stages, counters)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "wall_s": wall, "endpoints": endpoints,
+                       "stages": stages, "counters": counters}, f, indent=2)
+        print(f"\n✅ Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a question corpus against /chat and /profiles")
+    parser.add_argument("--url", help="Running server to load (default: in-process app with stubs)")
+    parser.add_argument("--corpus", default=os.path.join(HERE, "chat_corpus.json"))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of --requests")
+    parser.add_argument("--profiles-share", type=float, default=0.3, help="Fraction of /profiles requests")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of question popularity (0 = uniform)")
+    parser.add_argument("--profile-ids", help="File with one profile id per line (with --url)")
+    parser.add_argument("--profiles", type=int, default=500, help="Synthetic profiles (in-process)")
+    parser.add_argument("--levels", type=int, default=1000)
+    parser.add_argument("--llm-latency", default="lognormal:800,0.4", help="Stub LLM latency distribution (ms)")
+    parser.add_argument("--db-latency", default="lognormal:20,0.5", help="Stub database latency distribution (ms)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results JSON here")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+"""
+backend/app.py without Gemini or Postgres: the stub LLM (llm_client.StubLLM)
+and an in-memory database stand-in with configurable latency, for load
+tests and benchmarks.
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND)
+
+from llm_client import latency_sampler  # noqa: E402
+from stats import LatencyWindow  # noqa: E402
+
+STUB_COLUMNS = ["profile_id", "date_time", "latitude", "longitude", "ocean"]
+
+
+def load_app(tmp_dir, corpus=None, llm_latency="lognormal:800,0.4", profiles_dir=None, **env):
+    """
+    Import backend/app.py configured for offline use: stub LLM (canned SQL
+    from the corpus file), exact-only SQL cache under tmp_dir, profiles
+    from profiles_dir. Extra keyword arguments are set as environment
+    variables first. Must run before anything else imports app.
+    """
+    os.environ.update({
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_LATENCY": str(llm_latency),
+        "SQL_CACHE_SEMANTIC": "0",
+        "SQL_CACHE_PATH": os.path.join(tmp_dir, "sql_cache.json"),
+        "PROFILES_DATA_DIR": profiles_dir or os.path.join(tmp_dir, "profiles"),
+        **{k: str(v) for k, v in env.items()},
+    })
+    if corpus:
+        os.environ["STUB_LLM_SQL"] = os.path.abspath(corpus)
+    import app
+    app.data_version.listen = False
+    return app
+
+
+class StubDatabase:
+    """
+    Stand-in for app.db_pool.fetch: EXPLAIN returns a cheap plan, the data
+    version stays at 1, and every other query sleeps for a sampled latency
+    and returns `rows` canned rows.
+    """
+
+    def __init__(self, latency="lognormal:20,0.5", rows=100, seed=0):
+        self._latency = latency_sampler(latency, seed)
+        self.rows = [
+            (f"R{1900000 + i}_001", "2023-01-01T00:00:00Z", -30.0 + i % 60, 150.0 - i % 90, "Pacific")
+            for i in range(rows)
+        ]
+        self.queries = 0
+        self.latency = LatencyWindow()
+        self._lock = threading.Lock()
+
+    def fetch(self, sql, params=None, timeout_ms=None):
+        if sql.startswith("EXPLAIN"):
+            return ["QUERY PLAN"], [([{"Plan": {"Node Type": "Limit", "Total Cost": 10.0, "Plan Rows": 100}}],)]
+        if sql.startswith("SELECT version FROM data_version"):
+            return ["version"], [(1,)]
+        ms = self._latency()
+        time.sleep(ms / 1000)
+        self.latency.record(ms)
+        with self._lock:
+            self.queries += 1
+        return list(STUB_COLUMNS), list(self.rows)
+
+    def install(self, app):
+        app.db_pool.fetch = self.fetch
+        return self
+
+
+def write_profiles(root, n_profiles, levels=1000, seed=0):
+    """Synthetic {root}/{profile_id}.parquet depth series; returns the ids."""
+    os.makedirs(root, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    ids = [f"R{1900000 + i}_001" for i in range(n_profiles)]
+    for profile_id in ids:
+        pres = np.sort(rng.uniform(0, 2000, levels)).astype(np.float32)
+        pd.DataFrame({
+            "PRES": pres,
+            "TEMP": (20 * np.exp(-pres / 500)).astype(np.float32),
+            "PSAL": (34.5 + rng.normal(0, 0.1, levels)).astype(np.float32),
+        }).to_parquet(os.path.join(root, f"{profile_id}.parquet"))
+    return ids
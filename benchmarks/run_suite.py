@@ -0,0 +1,205 @@
+"""
+Offline ingestion benchmark: synthetic profiles through every pipeline stage.
+
+Generates (or reuses) a synthetic dataset, then times index load, download
+from a local mirror, decode, flatten, Parquet write and the loader's
+profile/summary preparation. The DB load itself only runs when --db-params
+is given. Results are written as JSON so runs can be compared between
+commits:
+
+    cd benchmarks
+    python run_suite.py --profiles 10000 --out results/head.json
+    python run_suite.py --profiles 10000 --compare results/head.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", "db"))
+
+from fetch_profiles import download_profiles  # noqa: E402
+from load_index import load_argo_index  # noqa: E402
+from local_mirror import serve_profiles  # noqa: E402
+from preprocess import flatten_profiles, parse_profiles  # noqa: E402
+from processed_store import StoreWriter  # noqa: E402
+from synth_argo import generate  # noqa: E402
+
+import load_to_postgres  # noqa: E402
+
+
+class Timings:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, items=None, unit="profiles"):
+        start = time.perf_counter()
+        record = {"items": items, "unit": unit}
+        yield record
+        self.add(name, time.perf_counter() - start, record["items"], record["unit"])
+
+    def add(self, name, seconds, items=None, unit="profiles"):
+        entry = self.stages.setdefault(name, {"seconds": 0.0, "items": 0, "unit": unit})
+        entry["seconds"] += seconds
+        entry["items"] += items or 0
+        entry["per_second"] = entry["items"] / entry["seconds"] if entry["seconds"] else None
+        print(f"  {name:<16} {entry['seconds']:9.3f}s  {entry['items']:>10} {unit}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(data_dir, work_dir, workers, chunksize, batch_rows, skip_download, db_params):
+    timings = Timings()
+    index_path = os.path.join(data_dir, "ArgoFloats-index.csv")
+    cache_path = os.path.join(work_dir, "index.parquet")
+
+    with timings.stage("index_load_cold") as rec:
+        df_index = load_argo_index(index_path, cache_path=cache_path)
+        rec["items"] = len(df_index)
+    with timings.stage("index_load_warm") as rec:
+        df_index = load_argo_index(index_path, cache_path=cache_path)
+        rec["items"] = len(df_index)
+
+    profiles_dir = os.path.join(data_dir, "profiles")
+    files = list(df_index["file"])
+    if not skip_download:
+        server, base_url = serve_profiles(profiles_dir)
+        try:
+            with timings.stage("download", unit="files") as rec:
+                report = download_profiles(files, save_dir=os.path.join(work_dir, "download"),
+                                           mirrors=[base_url])
+                rec["items"] = report["downloaded"]
+            timings.stages["download"]["mb_per_s"] = report["mb_per_s"]
+        finally:
+            server.shutdown()
+
+    tasks = [(os.path.join(profiles_dir, os.path.basename(f)), None) for f in files]
+    store_dir = os.path.join(work_dir, "argo_store")
+    writer = StoreWriter(store_dir, max_rows=batch_rows)
+    results = parse_profiles(tasks, workers, chunksize)
+    rows, arrays, pending, levels = [], [], 0, 0
+
+    def emit():
+        with timings.stage("flatten", len(rows)):
+            df = flatten_profiles(df_index.iloc[rows], arrays)
+        with timings.stage("write", len(df), unit="rows"):
+            writer.write(df)
+
+    # Decoding overlaps with flatten/write, so "decode" is time spent waiting on workers
+    decode_seconds = 0.0
+    for position in range(len(tasks)):
+        start = time.perf_counter()
+        _, columns, error = next(results)
+        decode_seconds += time.perf_counter() - start
+        if error is not None:
+            continue
+        rows.append(position)
+        arrays.append(columns)
+        pending += len(columns[0])
+        levels += len(columns[0])
+        if pending >= batch_rows:
+            emit()
+            rows, arrays, pending = [], [], 0
+    if arrays:
+        emit()
+    timings.add("decode", decode_seconds, len(tasks))
+    with timings.stage("write_close", unit="rows") as rec:
+        writer.close()
+        rec["items"] = writer.rows
+
+    with timings.stage("db_prepare") as rec:
+        df_meta = load_to_postgres.prepare_profiles(store_dir)
+        rec["items"] = len(df_meta)
+    if db_params is not None:
+        with timings.stage("db_load", len(df_meta)):
+            load_to_postgres.load_data_to_postgres(store_dir, db_params, full=True)
+
+    return timings.stages, levels
+
+
+def compare(current, baseline, threshold):
+    """Print per-stage ratios; returns the stages that got slower than threshold."""
+    regressions = []
+    print(f"\n{'stage':<16} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, stage in current["stages"].items():
+        old = baseline["stages"].get(name)
+        if not old or not old["seconds"]:
+            continue
+        ratio = stage["seconds"] / old["seconds"]
+        flag = "  ⚠️" if ratio > 1 + threshold else ""
+        print(f"{name:<16} {old['seconds']:10.3f} {stage['seconds']:10.3f} {ratio:7.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=1000)
+    parser.add_argument("--levels", type=int, nargs=2, default=(50, 1000), metavar=("MIN", "MAX"))
+    parser.add_argument("--data-dir", help="Reuse (or create) the synthetic dataset here")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=8)
+    parser.add_argument("--batch-rows", type=int, default=500_000)
+    parser.add_argument("--skip-download", action="store_true")
+    parser.add_argument("--db-params", help='JSON connection params, e.g. \'{"dbname": "argo_bench"}\'')
+    parser.add_argument("--out", help="Write results JSON here")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression tolerance (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="floatchat-bench-")
+    data_dir = args.data_dir or os.path.join(work_dir, "synth")
+    try:
+        if not os.path.exists(os.path.join(data_dir, "ArgoFloats-index.csv")):
+            start = time.perf_counter()
+            generate(data_dir, args.profiles, tuple(args.levels), workers=args.workers)
+            print(f"🧪 Generated {args.profiles} synthetic profiles in {time.perf_counter() - start:.1f}s")
+
+        print("⏱️ Stages:")
+        stages, levels = run(data_dir, work_dir, args.workers, args.chunksize, args.batch_rows,
+                             args.skip_download, json.loads(args.db_params) if args.db_params else None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "params": {
+            "profiles": args.profiles, "levels": list(args.levels), "total_levels": levels,
+            "workers": args.workers, "chunksize": args.chunksize, "batch_rows": args.batch_rows,
+        },
+        "stages": stages,
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"📝 Results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print(f"❌ Slower than baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Synthetic Argo core-profile NetCDF files plus a matching index CSV.
+
+Files follow the GDAC single-profile layout closely enough for
+fetch_profiles.parse_profile (N_PROF x N_LEVELS PRES/TEMP/PSAL with _QC,
+_ADJUSTED and _ADJUSTED_QC counterparts, JULD, LATITUDE, LONGITUDE).
+
+    cd benchmarks && python synth_argo.py /tmp/synth --profiles 10000 --levels 50 1000
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import netCDF4
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from ingest_bgc import ocean_code  # noqa: E402
+
+FILL = np.float32(99999.0)
+JULD_EPOCH = pd.Timestamp("1950-01-01", tz="UTC")
+PROFILES_PER_FLOAT = 200
+PROFILER_TYPE = 845
+INSTITUTION = "AO"
+
+
+def _profile_values(rng, n_levels, with_psal):
+    pres = np.sort(rng.uniform(2.0, 2000.0, n_levels)).astype(np.float32)
+    temp = (26.0 * np.exp(-pres / 400.0) + 2.0 + rng.normal(0, 0.05, n_levels)).astype(np.float32)
+    psal = (34.2 + 0.6 * (1 - np.exp(-pres / 800.0)) + rng.normal(0, 0.01, n_levels)).astype(np.float32)
+    return {"PRES": pres, "TEMP": temp, "PSAL": psal if with_psal else None}
+
+
+def write_profile(path, values, juld, lat, lon, platform, cycle):
+    n_levels = len(values["PRES"])
+    with netCDF4.Dataset(path, "w", format="NETCDF3_CLASSIC") as ds:
+        ds.createDimension("N_PROF", 1)
+        ds.createDimension("N_LEVELS", n_levels)
+        ds.createDimension("STRING8", 8)
+
+        ds.createVariable("PLATFORM_NUMBER", "S1", ("N_PROF", "STRING8"))[:] = \
+            netCDF4.stringtochar(np.array([f"{platform:<8}"], dtype="S8"))
+        ds.createVariable("CYCLE_NUMBER", "i4", ("N_PROF",))[:] = cycle
+        ds.createVariable("DATA_MODE", "S1", ("N_PROF",))[:] = np.array([b"R"])
+        ds.createVariable("JULD", "f8", ("N_PROF",))[:] = juld
+        ds["JULD"].units = "days since 1950-01-01 00:00:00 UTC"
+        ds.createVariable("LATITUDE", "f8", ("N_PROF",))[:] = lat
+        ds.createVariable("LONGITUDE", "f8", ("N_PROF",))[:] = lon
+
+        for name, data in values.items():
+            if data is None:
+                continue
+            for suffix in ("", "_ADJUSTED"):
+                var = ds.createVariable(name + suffix, "f4", ("N_PROF", "N_LEVELS"), fill_value=FILL)
+                var[:] = data[np.newaxis, :]
+                qc = ds.createVariable(name + suffix + "_QC", "S1", ("N_PROF", "N_LEVELS"), fill_value=b" ")
+                qc[:] = np.full((1, n_levels), b"1")
+
+
+def _generate_chunk(args):
+    out_dir, rows, levels, psal_fraction, seed = args
+    rng = np.random.default_rng(seed)
+    for file_path, juld, lat, lon, platform, cycle in rows:
+        n_levels = int(rng.integers(levels[0], levels[1] + 1))
+        values = _profile_values(rng, n_levels, rng.random() < psal_fraction)
+        write_profile(os.path.join(out_dir, "profiles", os.path.basename(file_path)),
+                      values, juld, lat, lon, platform, cycle)
+    return len(rows)
+
+
+def generate(out_dir, n_profiles, levels=(50, 1000), psal_fraction=0.8, seed=0,
+             workers=None, chunk=500):
+    """
+    Write n_profiles synthetic files to out_dir/profiles and the index to
+    out_dir/ArgoFloats-index.csv. Returns the index path.
+    """
+    os.makedirs(os.path.join(out_dir, "profiles"), exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    floats = 1_900_000 + np.arange(n_profiles) // PROFILES_PER_FLOAT
+    cycles = np.arange(n_profiles) % PROFILES_PER_FLOAT + 1
+    lat = rng.uniform(-70, 75, n_profiles).round(3)
+    lon = rng.uniform(-180, 180, n_profiles).round(3)
+    juld = rng.uniform(17000, 27500, n_profiles)  # 1996 .. 2025
+    dates = JULD_EPOCH + pd.to_timedelta(juld, unit="D")
+    files = [f"synth/{f}/profiles/R{f}_{c:03d}.nc" for f, c in zip(floats, cycles)]
+
+    index = pd.DataFrame({
+        "file": files,
+        "date": dates.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "latitude": lat,
+        "longitude": lon,
+        "ocean": ocean_code(lat, lon),
+        "profiler_type": PROFILER_TYPE,
+        "institution": INSTITUTION,
+        "date_update": (dates + pd.Timedelta(days=30)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
+    index_path = os.path.join(out_dir, "ArgoFloats-index.csv")
+    with open(index_path, "w") as f:
+        f.write(",".join(index.columns) + "\n")
+        f.write(",UTC,degrees_north,degrees_east,,,,UTC\n")
+        index.to_csv(f, header=False, index=False)
+
+    rows = list(zip(files, juld, lat, lon, floats, cycles))
+    tasks = [
+        (out_dir, rows[i:i + chunk], levels, psal_fraction, seed + 1 + i // chunk)
+        for i in range(0, n_profiles, chunk)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(_generate_chunk, tasks):
+            pass
+    return index_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Argo profiles and index")
+    parser.add_argument("out_dir")
+    parser.add_argument("--profiles", type=int, default=1000)
+    parser.add_argument("--levels", type=int, nargs=2, default=(50, 1000), metavar=("MIN", "MAX"))
+    parser.add_argument("--psal-fraction", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    path = generate(args.out_dir, args.profiles, tuple(args.levels), args.psal_fraction,
+                    args.seed, args.workers)
+    print(f"✅ {args.profiles} profiles + {path} in {time.perf_counter() - start:.1f}s")
@@ -1,6 +1,12 @@
+import hashlib
+import io
+import os
+import time
+import string
+import numpy as np
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+import pyarrow.dataset as ds
 import warnings
 
 # Suppress the UserWarning from pandas
@@ -15,13 +21,156 @@ OCEAN_MAP = {
     "N": "Arctic"
 }
 
-def load_data_to_postgres(csv_path="../data/processed/argo_clean.csv", db_params={}):
-    """Loads cleaned data from a CSV into a PostgreSQL database with enriched summaries."""
-    try:
-        df = pd.read_csv(csv_path)
-    except FileNotFoundError:
-        print(f"❌ Error: {csv_path} not found. Please run the preprocessing script first.")
-        return
+# Profile-level columns; per-level measurements are never read by the loader
+PROFILE_COLUMNS = ["float_file", "date", "lat", "lon", "ocean", "profiler_type"]
+
+# Columns COPY'd into the staging table; geom is derived on merge
+LOAD_COLUMNS = [
+    "profile_id", "float_file", "date_time", "latitude", "longitude",
+    "ocean", "institution", "profiler_type", "summary", "date_update", "store_partition"
+]
+COPY_CHUNK_ROWS = 200_000
+# Per-level columns copied into measurements / profile_measurements
+MEASUREMENT_COLUMNS = ["pressure", "temperature", "salinity"]
+BGC_LEVEL_COLUMNS = ["doxy", "chla", "nitrate", "turbidity"]
+LEVEL_COLUMNS = MEASUREMENT_COLUMNS + BGC_LEVEL_COLUMNS
+# Per-profile aggregates kept in profile_stats
+STATS_COLUMNS = [
+    "profile_id", "n_levels", "max_pressure",
+    "surface_pressure", "surface_temperature", "surface_salinity",
+    "min_temperature", "max_temperature", "min_salinity", "max_salinity",
+    "has_psal", "has_doxy", "has_chla", "has_nitrate", "has_turbidity"
+]
+MEASUREMENT_LAYOUTS = ("rows", "arrays", "none")
+MEASUREMENT_BATCH_ROWS = 1_000_000
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pg_schema.sql")
+
+# Enriched summary template. Each {field} is rendered a whole column at a time
+# by SUMMARY_FIELDS; other fields are taken from the column of the same name
+# ("unknown" if absent) and may carry a format spec, e.g. {latitude:.3f}.
+SUMMARY_TEMPLATE = (
+    "Profile from float {float} "
+    "deployed by institution {institution} "
+    "collected on {date_time} UTC "
+    "in the {ocean} Ocean at "
+    "latitude {latitude}° and longitude {longitude}°. "
+    "Profiler type: {profiler_type}. "
+    "Contains measurements of temperature and salinity. "
+    "Last updated on {date_update}."
+)
+
+def _per_unique(values, spec=""):
+    """Formats each distinct value once and maps the strings back onto the rows."""
+    values = np.asarray(values)
+    codes, uniques = pd.factorize(values)
+    out = np.array([format(u, spec) for u in uniques], dtype=object)[codes]
+    # Missing values keep their own spelling (None vs nan)
+    missing = codes == -1
+    out[missing] = [format(v, spec) for v in values[missing]]
+    return out
+
+def _column(column, missing="unknown", spec=""):
+    def render(df):
+        return _per_unique(df[column], spec) if column in df else missing
+    return render
+
+def _timestamp(column, suffix="", missing="unknown"):
+    """'%Y-%m-%d %H:%M:%S' + suffix in UTC, without a per-row strftime."""
+    def render(df):
+        if column not in df:
+            return missing
+        ts = pd.to_datetime(df[column], utc=True).dt.tz_localize(None)
+        text = np.datetime_as_string(ts.to_numpy().astype("datetime64[s]"))
+        text = np.char.add(np.char.replace(text, "T", " "), suffix).astype(object)
+        return np.where(ts.isna().to_numpy(), missing, text)
+    return render
+
+SUMMARY_FIELDS = {
+    # Historically the "float" slot shows the profiler type
+    "float": _column("profiler_type"),
+    "institution": _column("institution"),
+    "date_time": _timestamp("date_time"),
+    "ocean": _column("ocean"),
+    "latitude": _column("latitude", spec=".2f"),
+    "longitude": _column("longitude", spec=".2f"),
+    "profiler_type": _column("profiler_type", missing="N/A"),
+    "date_update": _timestamp("date_update", suffix=" UTC"),
+}
+
+def build_summaries(df, template=None, fields=None):
+    """Renders template for every row of df column-wise; returns an object array of strings."""
+    template = template or SUMMARY_TEMPLATE
+    fields = {**SUMMARY_FIELDS, **(fields or {})}
+    out = np.full(len(df), "", dtype=object)
+    for literal, name, spec, conversion in string.Formatter().parse(template):
+        if literal:
+            out = out + literal
+        if name is None:
+            continue
+        if conversion:
+            raise ValueError(f"Unsupported summary field {{{name}!{conversion}:{spec}}}")
+        render = _column(name, spec=spec) if spec or name not in fields else fields[name]
+        out = out + render(df)
+    return out
+
+def read_processed(path, columns, files=None):
+    """
+    Read the partitioned Parquet store (or a legacy CSV export) with column
+    projection; files limits the read to those Parquet files of the store.
+    """
+    if path.endswith(".csv"):
+        return pd.read_csv(path, usecols=lambda c: c in columns)
+    if files is None:
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        dataset = ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=path)
+        df = dataset.to_table(columns=columns).to_pandas()
+    # Partition keys come back as categoricals
+    if 'ocean' in df:
+        df['ocean'] = df['ocean'].astype(object)
+    return df
+
+def profile_ids(float_files):
+    """profile_id is the file basename without .nc, e.g. R13857_001."""
+    return pd.Series(float_files).str.rsplit('/', n=1).str[-1].str.removesuffix('.nc')
+
+def store_partitions(store_path):
+    """
+    {partition: (fingerprint, parquet paths)} for every ocean=/year= directory
+    of the store. The fingerprint changes whenever a part file is added,
+    rewritten or removed.
+    """
+    parts = {}
+    for root, _, files in os.walk(store_path):
+        paths = sorted(os.path.join(root, f) for f in files if f.endswith(".parquet"))
+        if not paths:
+            continue
+        digest = hashlib.sha1()
+        for path in paths:
+            st = os.stat(path)
+            digest.update(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        parts[os.path.relpath(root, store_path).replace(os.sep, "/")] = (digest.hexdigest(), paths)
+    return parts
+
+def _read_profiles(store_path, partitions):
+    if partitions is None:
+        return read_processed(store_path, PROFILE_COLUMNS)
+    frames = []
+    for part, paths in partitions.items():
+        df = read_processed(store_path, PROFILE_COLUMNS, files=paths)
+        df["store_partition"] = part
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=PROFILE_COLUMNS + ["store_partition"])
+    return pd.concat(frames, ignore_index=True)
+
+def prepare_profiles(store_path="../data/processed/argo_store", template=None, partitions=None):
+    """
+    Reads the processed store and builds one row per profile with its summary
+    and profile_id. partitions ({partition: parquet paths}) limits the read to
+    those partitions and records each profile's partition in store_partition.
+    """
+    df = _read_profiles(store_path, partitions)
 
     # Basic cleanup and data type conversion
     df = df.rename(columns={
@@ -31,6 +180,9 @@ def load_data_to_postgres(csv_path="../data/processed/argo_clean.csv", db_params
     })
     df['date_time'] = pd.to_datetime(df['date_time'], errors='coerce', utc=True)
     df['date_update'] = pd.to_datetime(df.get('date_update', pd.NaT), errors='coerce', utc=True)
+    # The store keeps profiler_type as int32; render it as the float the CSV era did
+    # ("845.0"), so summaries, and the embeddings built from them, stay unchanged on reload
+    df['profiler_type'] = pd.to_numeric(df['profiler_type'], errors='coerce').astype('float64')
 
     # Normalize ocean codes
     df['ocean'] = df['ocean'].map(OCEAN_MAP).fillna(df['ocean'])
@@ -39,35 +191,259 @@ def load_data_to_postgres(csv_path="../data/processed/argo_clean.csv", db_params
     df = df.dropna(subset=['date_time', 'latitude', 'longitude'])
 
     # Deduplicate by float_file + timestamp
-    df_meta = df.drop_duplicates(subset=['float_file', 'date_time'])
+    df_meta = df.drop_duplicates(subset=['float_file', 'date_time']).copy()
 
-    # Enriched summary generator
-    def create_summary(row):
-        date_update_str = (
-            row['date_update'].strftime('%Y-%m-%d %H:%M:%S UTC')
-            if pd.notna(row.get('date_update')) else "unknown"
-        )
-        return (
-            f"Profile from float {row.get('profiler_type', 'unknown')} "
-            f"deployed by institution {row.get('institution', 'unknown')} "
-            f"collected on {row['date_time'].strftime('%Y-%m-%d %H:%M:%S')} UTC "
-            f"in the {row.get('ocean', 'unknown')} Ocean at "
-            f"latitude {row['latitude']:.2f}° and longitude {row['longitude']:.2f}°. "
-            f"Profiler type: {row.get('profiler_type', 'N/A')}. "
-            f"Contains measurements of temperature and salinity. "
-            f"Last updated on {date_update_str}."
+    df_meta['summary'] = build_summaries(df_meta, template)
+
+    # Stable id so re-runs update the same rows instead of colliding
+    df_meta['profile_id'] = profile_ids(df_meta['float_file'])
+    df_meta = df_meta.drop_duplicates(subset=['profile_id'], keep='last')
+    return df_meta
+
+def _copy_chunk(cur, df, table, columns):
+    """Streams one chunk of rows into table as CSV via COPY FROM STDIN."""
+    buf = io.StringIO()
+    df.reindex(columns=columns).to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+def bump_data_version(cur):
+    """
+    Marks the data as changed for the backend's result cache; call inside
+    each load transaction so the bump commits together with the rows.
+    """
+    cur.execute("""
+        WITH bumped AS (
+            UPDATE data_version SET version = version + 1, loaded_at = now() RETURNING version
         )
+        SELECT pg_notify('data_version', version::text) FROM bumped
+    """)
+
+def _upsert(conn, df, table, columns, derived=None, chunk_rows=COPY_CHUNK_ROWS):
+    """
+    COPYs df into a temporary staging copy of table and merges it with
+    INSERT ... ON CONFLICT (profile_id) DO UPDATE, all in one transaction.
+    derived maps extra target columns to SQL expressions over the staged
+    columns. Returns the number of rows merged.
+    """
+    derived = derived or {}
+    staging = f"{table}_staging"
+    targets = columns + list(derived)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in targets if c != "profile_id")
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+            for start in range(0, len(df), chunk_rows):
+                _copy_chunk(cur, df.iloc[start:start + chunk_rows], staging, columns)
+            cur.execute(f"""
+                INSERT INTO {table} ({', '.join(targets)})
+                SELECT {', '.join(columns + list(derived.values()))}
+                FROM {staging}
+                ON CONFLICT (profile_id) DO UPDATE SET {updates}
+            """)
+            rows = cur.rowcount
+            bump_data_version(cur)
+            return rows
 
-    df_meta['summary'] = df_meta.apply(create_summary, axis=1)
+def upsert_profiles(conn, df_meta, chunk_rows=COPY_CHUNK_ROWS):
+    """Merges df_meta into profiles; geom is built server-side from longitude/latitude."""
+    return _upsert(conn, df_meta, "profiles", LOAD_COLUMNS,
+                   {"geom": "ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)"}, chunk_rows)
 
-    # Replace NaT with None before inserting
-    df_meta['date_update'] = df_meta['date_update'].where(pd.notna(df_meta['date_update']), None)
+def _level_stats(df):
+    """Per-profile aggregates of one batch of levels, vectorized with groupby."""
+    g = df.groupby("profile_id", sort=False)
+    stats = g.agg(
+        n_levels=("pressure", "size"),
+        max_pressure=("pressure", "max"),
+        min_temperature=("temperature", "min"),
+        max_temperature=("temperature", "max"),
+        min_salinity=("salinity", "min"),
+        max_salinity=("salinity", "max"),
+        **{f"_n_{c}": (c, "count") for c in ["salinity"] + BGC_LEVEL_COLUMNS},
+    )
+    # Surface = shallowest level with a valid pressure
+    surface = (
+        df.dropna(subset=["pressure"])
+        .sort_values(["profile_id", "pressure"], kind="stable")
+        .drop_duplicates("profile_id")
+        .set_index("profile_id")[["pressure", "temperature", "salinity"]]
+        .add_prefix("surface_")
+    )
+    return stats.join(surface)
 
-    # Add a simple profile_id as it might not be in the CSV
-    df_meta['profile_id'] = (
-        df_meta['float_file'].apply(lambda x: x.split('/')[-1].replace('.nc', ''))
-        + '_' + df_meta.index.astype(str)
+def _combine_stats(parts):
+    """Merges partial stats of profiles whose levels were split across batches."""
+    stats = pd.concat(parts)
+    if stats.index.is_unique:
+        return stats
+    surface = [c for c in stats.columns if c.startswith("surface_")]
+    g = stats.groupby(level=0, sort=False)
+    # Counts add up; min_* / max_* columns take min / max
+    combined = g.agg({
+        c: "sum" if c == "n_levels" or c.startswith("_n_") else c.split("_")[0]
+        for c in stats.columns if c not in surface
+    })
+    shallowest = (
+        stats[surface].sort_values("surface_pressure", kind="stable")
+        .loc[lambda s: ~s.index.duplicated()]
     )
+    return combined.join(shallowest)
+
+def compute_profile_stats(store_path, batch_rows=MEASUREMENT_BATCH_ROWS, files=None):
+    """
+    One vectorized pass over the store (or just files of it): level count,
+    max pressure, surface / min / max temperature and salinity and which
+    variables are present.
+    """
+    parts = [_level_stats(df) for df in iter_measurement_batches(store_path, batch_rows, files)]
+    if not parts:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    stats = _combine_stats(parts)
+    for c in ["salinity"] + BGC_LEVEL_COLUMNS:
+        flag = "has_psal" if c == "salinity" else f"has_{c}"
+        stats[flag] = stats.pop(f"_n_{c}") > 0
+    return stats.rename_axis("profile_id").reset_index()[STATS_COLUMNS]
+
+def upsert_profile_stats(conn, stats, chunk_rows=COPY_CHUNK_ROWS):
+    """Merges freshly computed stats into profile_stats."""
+    return _upsert(conn, stats, "profile_stats", STATS_COLUMNS, chunk_rows=chunk_rows)
+
+def iter_measurement_batches(store_path, batch_rows=MEASUREMENT_BATCH_ROWS, files=None):
+    """Yields per-level frames (profile_id, date_time, LEVEL_COLUMNS) from the store or files of it."""
+    if files is None:
+        dataset = ds.dataset(store_path, format="parquet", partitioning="hive")
+    else:
+        dataset = ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=store_path)
+    columns = ["float_file", "date"] + [c for c in LEVEL_COLUMNS if c in dataset.schema.names]
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_rows):
+        df = batch.to_pandas().dropna(subset=["date"])
+        if df.empty:
+            continue
+        df.insert(0, "profile_id", profile_ids(df.pop("float_file")).to_numpy())
+        yield df.rename(columns={"date": "date_time"})
+
+def _ensure_year_partitions(cur, years, known):
+    for year in sorted(set(years) - known):
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS measurements_y{year} PARTITION OF measurements "
+            f"FOR VALUES FROM ('{year}-01-01 00:00+00') TO ('{year + 1}-01-01 00:00+00')"
+        )
+        known.add(year)
+
+def load_measurements(conn, store_path, layout="rows", batch_rows=MEASUREMENT_BATCH_ROWS, files=None):
+    """
+    COPYs per-level data from the store (or just files of it) into Postgres
+    in one transaction.
+
+    layout="rows" fills the date-partitioned measurements table; profiles
+    being reloaded have their old levels deleted first. layout="arrays"
+    stages the same rows and aggregates them server-side into one
+    profile_measurements row per profile. Returns the number of levels copied.
+    """
+    copy_columns = ["profile_id", "date_time"] + LEVEL_COLUMNS
+    levels, seen, partitions = 0, set(), set()
+    with conn:
+        with conn.cursor() as cur:
+            if layout == "arrays":
+                cur.execute(
+                    "CREATE TEMP TABLE measurements_staging "
+                    "(LIKE measurements, seq BIGSERIAL) ON COMMIT DROP"
+                )
+            for df in iter_measurement_batches(store_path, batch_rows, files):
+                if layout == "rows":
+                    _ensure_year_partitions(cur, df["date_time"].dt.year.unique().tolist(), partitions)
+                    fresh = [p for p in df["profile_id"].unique() if p not in seen]
+                    cur.execute("DELETE FROM measurements WHERE profile_id = ANY(%s)", (fresh,))
+                    seen.update(fresh)
+                    _copy_chunk(cur, df, "measurements", copy_columns)
+                else:
+                    _copy_chunk(cur, df, "measurements_staging", copy_columns)
+                levels += len(df)
+
+            if layout == "arrays":
+                # Arrays keep store order; BGC arrays are NULL when a profile has none
+                aggregates = ", ".join(
+                    f"array_agg({c} ORDER BY seq)" if c in MEASUREMENT_COLUMNS else
+                    f"CASE WHEN count({c}) > 0 THEN array_agg({c} ORDER BY seq) END"
+                    for c in LEVEL_COLUMNS
+                )
+                updates = ", ".join(
+                    f"{c} = EXCLUDED.{c}"
+                    for c in ["date_time", "n_levels", "max_pressure"] + LEVEL_COLUMNS
+                )
+                cur.execute(f"""
+                    INSERT INTO profile_measurements (
+                        profile_id, date_time, n_levels, max_pressure, {', '.join(LEVEL_COLUMNS)}
+                    )
+                    SELECT profile_id, min(date_time), count(*), max(pressure), {aggregates}
+                    FROM measurements_staging
+                    GROUP BY profile_id
+                    ON CONFLICT (profile_id) DO UPDATE SET {updates}
+                """)
+            bump_data_version(cur)
+    if layout == "rows":
+        with conn, conn.cursor() as cur:
+            cur.execute("ANALYZE measurements")
+    return levels
+
+def loaded_partitions(conn):
+    """{partition: fingerprint} of the store partitions already in the database."""
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT store_partition, fingerprint FROM loaded_partitions")
+        return dict(cur.fetchall())
+
+def record_partitions(conn, fingerprints, gone=(), reset=False):
+    """Remembers which partition versions are loaded; reset forgets all of them first."""
+    with conn, conn.cursor() as cur:
+        if reset:
+            cur.execute("DELETE FROM loaded_partitions")
+        cur.execute("DELETE FROM loaded_partitions WHERE store_partition = ANY(%s)", (list(gone),))
+        for part, fingerprint in fingerprints.items():
+            cur.execute("""
+                INSERT INTO loaded_partitions (store_partition, fingerprint, loaded_at) VALUES (%s, %s, now())
+                ON CONFLICT (store_partition) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, loaded_at = now()
+            """, (part, fingerprint))
+
+def delete_stale_profiles(conn, partitions, keep, everything=False):
+    """
+    Deletes profiles that were loaded from partitions (or from anywhere, with
+    everything=True) but are not in keep, with their levels and stats.
+    Returns the number of profiles deleted.
+    """
+    with conn:
+        with conn.cursor() as cur:
+            if everything:
+                cur.execute("SELECT profile_id FROM profiles")
+            else:
+                cur.execute("SELECT profile_id FROM profiles WHERE store_partition = ANY(%s)",
+                            (list(partitions),))
+            stale = [pid for (pid,) in cur.fetchall() if pid not in keep]
+            if not stale:
+                return 0
+            for table in ("measurements", "profile_measurements", "profiles"):
+                # profile_stats rows go with their profile (ON DELETE CASCADE)
+                cur.execute(f"DELETE FROM {table} WHERE profile_id = ANY(%s)", (stale,))
+            bump_data_version(cur)
+            return len(stale)
+
+def load_data_to_postgres(store_path="../data/processed/argo_store", db_params={}, init_schema=True,
+                          measurements="rows", full=False):
+    """
+    Loads cleaned profile metadata, and the per-level data in the chosen
+    layout ("rows", "arrays" or "none"), into PostgreSQL.
+
+    Only store partitions that changed since the last load are read: their
+    profiles are upserted, their levels and profile_stats replaced, and
+    profiles that left them (or a removed partition) are deleted. full=True
+    (or a legacy CSV) reloads everything.
+    """
+    if measurements not in MEASUREMENT_LAYOUTS:
+        raise ValueError(f"measurements must be one of {MEASUREMENT_LAYOUTS}")
+    is_csv = store_path.endswith(".csv")
+    if not os.path.exists(store_path):
+        print(f"❌ Error: {store_path} not found. Please run the preprocessing script first.")
+        return
 
     # Use your database connection parameters
     default_db_params = {
@@ -81,42 +457,79 @@ def load_data_to_postgres(csv_path="../data/processed/argo_clean.csv", db_params
 
     try:
         conn = psycopg2.connect(**db_params)
-        cur = conn.cursor()
+    except psycopg2.OperationalError as e:
+        print(f"❌ Database connection failed. Please ensure your PostgreSQL is running and credentials are correct. Error: {e}")
+        return
+
+    try:
+        if init_schema:
+            with conn, conn.cursor() as cur, open(SCHEMA_PATH) as f:
+                cur.execute(f.read())
+
+        partitions = None if is_csv else store_partitions(store_path)
+        changed, gone, loaded = None, set(), {}
+        if partitions is not None:
+            loaded = {} if full else loaded_partitions(conn)
+            changed = {p: paths for p, (fingerprint, paths) in partitions.items() if loaded.get(p) != fingerprint}
+            gone = set(loaded) - set(partitions)
+            if not changed and not gone:
+                print("✅ Store unchanged since the last load; nothing to do.")
+                return 0
+            print(f"🔄 {len(changed)} of {len(partitions)} store partitions changed, {len(gone)} removed")
+        files = None if changed is None else [path for paths in changed.values() for path in paths]
+
+        df_meta = prepare_profiles(store_path, partitions=changed)
+        # Without partition bookkeeping (first load, --full, CSV) anything not in the store goes
+        deleted = delete_stale_profiles(conn, set(changed or ()) | gone, set(df_meta["profile_id"]),
+                                        everything=full or is_csv or not loaded)
+        if deleted:
+            print(f"🗑️ Removed {deleted} profiles that are no longer in the store")
 
-        # Insert into the profiles table
         print(f"📥 Loading {len(df_meta)} unique profiles into PostgreSQL...")
+        start = time.perf_counter()
+        rows = upsert_profiles(conn, df_meta)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Data loaded successfully! {rows} profiles in {elapsed:.1f}s "
+              f"({rows / elapsed if elapsed else 0:,.0f} rows/s)")
 
-        insert_query = """
-        INSERT INTO profiles (
-            profile_id, float_file, date_time, latitude, longitude, geom,
-            ocean, institution, profiler_type, summary, date_update
-        ) VALUES %s
-        """
-
-        values = [(
-            row['profile_id'],
-            row['float_file'],
-            row['date_time'],
-            row['latitude'],
-            row['longitude'],
-            f"POINT({row['longitude']} {row['latitude']})",  # PostGIS geometry
-            row.get('ocean', None),
-            row.get('institution', None),
-            row.get('profiler_type', None),
-            row['summary'],
-            row['date_update'] if pd.notna(row.get('date_update')) else None
-        ) for _, row in df_meta.iterrows()]
-
-        execute_values(cur, insert_query, values)
-        conn.commit()
-        print("✅ Data loaded successfully!")
+        if measurements != "none" and not is_csv:
+            print(f"📥 Loading per-level measurements ({measurements} layout)...")
+            start = time.perf_counter()
+            levels = load_measurements(conn, store_path, measurements, files=files)
+            elapsed = time.perf_counter() - start
+            print(f"✅ {levels} levels in {elapsed:.1f}s ({levels / elapsed if elapsed else 0:,.0f} rows/s)")
 
-    except psycopg2.OperationalError as e:
-        print(f"❌ Database connection failed. Please ensure your PostgreSQL is running and credentials are correct. Error: {e}")
+        if not is_csv:
+            stats = compute_profile_stats(store_path, files=files)
+            # Only profiles that made it into the profiles table
+            stats = stats[stats["profile_id"].isin(df_meta["profile_id"])]
+            print(f"✅ Per-profile stats refreshed for {upsert_profile_stats(conn, stats)} profiles")
+            # Recorded last, so an interrupted load is redone on the next run
+            record_partitions(conn, {p: partitions[p][0] for p in changed}, gone, reset=full)
+        else:
+            # Rows loaded from a CSV carry no partition; the next store load must be a full one
+            record_partitions(conn, {}, reset=True)
+        return rows
     finally:
-        if 'conn' in locals():
-            cur.close()
-            conn.close()
+        conn.close()
 
 if __name__ == "__main__":
-    load_data_to_postgres()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load processed profiles into PostgreSQL")
+    parser.add_argument("--store", default="../data/processed/argo_store")
+    parser.add_argument("--dbname")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--host")
+    parser.add_argument("--port")
+    parser.add_argument("--measurements", choices=MEASUREMENT_LAYOUTS, default="rows",
+                        help="Per-level layout: a row per level, arrays per profile, or skip")
+    parser.add_argument("--no-init-schema", action="store_true", help="Don't apply pg_schema.sql first")
+    parser.add_argument("--full", action="store_true", help="Reload every partition, not just changed ones")
+    args = parser.parse_args()
+
+    db_params = {k: v for k in ("dbname", "user", "password", "host", "port")
+                 if (v := getattr(args, k)) is not None}
+    load_data_to_postgres(args.store, db_params, init_schema=not args.no_init_schema,
+                          measurements=args.measurements, full=args.full)
@@ -1,6 +1,6 @@
 CREATE EXTENSION IF NOT EXISTS postgis;
 
-CREATE TABLE profiles (
+CREATE TABLE IF NOT EXISTS profiles (
     profile_id TEXT PRIMARY KEY,
     float_file TEXT,
     date_time TIMESTAMP WITH TIME ZONE,
@@ -11,8 +11,95 @@ CREATE TABLE profiles (
     institution TEXT,
     profiler_type TEXT,
     summary TEXT,
+    date_update TIMESTAMP WITH TIME ZONE,
     argo_index_row_id INT
 );
 
-CREATE INDEX idx_profiles_geom ON profiles USING GIST(geom);
-CREATE INDEX idx_profiles_date ON profiles(date_time);
\ No newline at end of file
+-- Databases created before date_update was part of the table
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS date_update TIMESTAMP WITH TIME ZONE;
+-- Store partition (ocean=X/year=Y) the profile was loaded from
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS store_partition TEXT;
+CREATE INDEX IF NOT EXISTS idx_profiles_store_partition ON profiles(store_partition);
+
+CREATE INDEX IF NOT EXISTS idx_profiles_geom ON profiles USING GIST(geom);
+CREATE INDEX IF NOT EXISTS idx_profiles_date ON profiles(date_time);
+
+
+-- Per-level data, one row per level. Range-partitioned by observation time;
+-- the loader adds a partition per year (measurements_y1997, ...) as needed.
+CREATE TABLE IF NOT EXISTS measurements (
+    profile_id TEXT NOT NULL,
+    date_time TIMESTAMP WITH TIME ZONE NOT NULL,
+    pressure REAL,
+    temperature REAL,
+    salinity REAL,
+    doxy REAL,
+    chla REAL,
+    nitrate REAL,
+    turbidity REAL
+) PARTITION BY RANGE (date_time);
+
+CREATE TABLE IF NOT EXISTS measurements_default PARTITION OF measurements DEFAULT;
+
+-- BRIN keeps these tiny; the loader streams the store year partition by year
+CREATE INDEX IF NOT EXISTS idx_measurements_date_brin ON measurements USING BRIN(date_time);
+CREATE INDEX IF NOT EXISTS idx_measurements_pres_brin ON measurements USING BRIN(pressure);
+CREATE INDEX IF NOT EXISTS idx_measurements_profile ON measurements(profile_id);
+
+-- Compact alternative layout: one row per profile with the levels as arrays
+CREATE TABLE IF NOT EXISTS profile_measurements (
+    profile_id TEXT PRIMARY KEY,
+    date_time TIMESTAMP WITH TIME ZONE,
+    n_levels INT,
+    max_pressure REAL,
+    pressure REAL[],
+    temperature REAL[],
+    salinity REAL[],
+    doxy REAL[],
+    chla REAL[],
+    nitrate REAL[],
+    turbidity REAL[]
+);
+
+CREATE INDEX IF NOT EXISTS idx_profile_measurements_date ON profile_measurements(date_time);
+
+-- Per-profile aggregates so value filters ("deeper than 2000 m", "surface
+-- temperature above 28 °C") are index lookups instead of level scans
+CREATE TABLE IF NOT EXISTS profile_stats (
+    profile_id TEXT PRIMARY KEY REFERENCES profiles(profile_id) ON DELETE CASCADE,
+    n_levels INT,
+    max_pressure REAL,
+    surface_pressure REAL,
+    surface_temperature REAL,
+    surface_salinity REAL,
+    min_temperature REAL,
+    max_temperature REAL,
+    min_salinity REAL,
+    max_salinity REAL,
+    has_psal BOOLEAN,
+    has_doxy BOOLEAN,
+    has_chla BOOLEAN,
+    has_nitrate BOOLEAN,
+    has_turbidity BOOLEAN
+);
+
+CREATE INDEX IF NOT EXISTS idx_profile_stats_max_pressure ON profile_stats(max_pressure);
+CREATE INDEX IF NOT EXISTS idx_profile_stats_surface_temperature ON profile_stats(surface_temperature);
+CREATE INDEX IF NOT EXISTS idx_profile_stats_surface_salinity ON profile_stats(surface_salinity);
+
+-- Single-row counter bumped by every load transaction; the backend's result
+-- cache only serves entries read under the current version
+CREATE TABLE IF NOT EXISTS data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    loaded_at TIMESTAMP WITH TIME ZONE
+);
+
+INSERT INTO data_version (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
+
+-- Store partitions already loaded, so the loader only reads the ones that changed
+CREATE TABLE IF NOT EXISTS loaded_partitions (
+    store_partition TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    loaded_at TIMESTAMP WITH TIME ZONE
+);
@@ -1,62 +1,473 @@
-# src/fetch_profiles.py
+import hashlib
+import json
 import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import netCDF4
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 import xarray as xr
 
 # ✅ Define GDAC mirrors at the top
 GDAC_MIRRORS = [
-    "https://data-argo.ifremer.fr/dac/"
+    "https://data-argo.ifremer.fr/dac/",
+    "https://usgodae.org/pub/outgoing/argo/dac/",
 ]
 
-def download_profile(file_path, save_dir="../data/raw/profiles"):
+CHUNK_SIZE = 1 << 16
+
+
+class MirrorStats:
+    """Observed latency and error record for a single GDAC mirror."""
+
+    def __init__(self, base, max_concurrency, failure_penalty=60.0):
+        self.base = base
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.failure_penalty = failure_penalty  # latency charged for a failed request, seconds
+        self.latency = None  # exponentially weighted mean, seconds
+        self.requests = 0
+        self.errors = 0
+        self.probing = False
+
+    def record(self, elapsed, ok, alpha=0.3):
+        self.requests += 1
+        if not ok:
+            # A timeout or 503 costs the caller at least the penalty before it moves on
+            self.errors += 1
+            elapsed = max(elapsed, self.failure_penalty)
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency = alpha * elapsed + (1 - alpha) * self.latency
+
+    def score(self):
+        """
+        Lower is better. An untried mirror scores 0 until it has been handed
+        out once, then the failure penalty until its first result is in.
+        """
+        if self.latency is None:
+            return self.failure_penalty if self.probing else 0.0
+        # Laplace-smoothed success rate so one early failure doesn't bury a mirror
+        success = (self.requests - self.errors + 1) / (self.requests + 2)
+        return self.latency / success
+
+
+class MirrorPool:
+    """Ranks mirrors by latency and error rate and caps concurrency per mirror."""
+
+    def __init__(self, bases, max_concurrency=8, failure_penalty=60.0):
+        self._lock = threading.Lock()
+        self.mirrors = [MirrorStats(base, max_concurrency, failure_penalty) for base in bases]
+
+    def ranked(self):
+        with self._lock:
+            ranked = sorted(self.mirrors, key=lambda m: m.score())
+            # Explore an untried mirror once rather than sending everything to it
+            if ranked[0].latency is None:
+                ranked[0].probing = True
+            return ranked
+
+    def record(self, mirror, elapsed, ok):
+        with self._lock:
+            mirror.record(elapsed, ok)
+
+    def summary(self):
+        with self._lock:
+            return [
+                {
+                    "mirror": m.base,
+                    "latency_s": m.latency,
+                    "requests": m.requests,
+                    "errors": m.errors,
+                }
+                for m in sorted(self.mirrors, key=lambda m: m.score())
+            ]
+
+
+_default_pool = MirrorPool(GDAC_MIRRORS)
+_sessions = threading.local()
+
+
+def _session(pool_size=16):
+    """One keep-alive session per thread; requests.Session is not thread-safe."""
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _sessions.session = session
+    return session
+
+
+class ProfileNotFound(RuntimeError):
+    pass
+
+
+class IncompleteDownload(RuntimeError):
+    pass
+
+
+PART_SUFFIX = ".part"
+MANIFEST_NAME = ".download_manifest.json"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DownloadManifest:
+    """
+    Size, mtime and sha256 of every completed download in one save_dir, so
+    cache hits can be verified without opening the NetCDF file.
+    """
+
+    def __init__(self, save_dir):
+        self.path = os.path.join(save_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def __contains__(self, local_path):
+        return os.path.basename(local_path) in self.entries
+
+    def verify(self, local_path, full=False):
+        """
+        True if the file matches its recorded size and content. The hash is
+        only recomputed when the mtime moved, or always with full=True.
+        """
+        entry = self.entries.get(os.path.basename(local_path))
+        if entry is None or not os.path.exists(local_path):
+            return False
+        stat = os.stat(local_path)
+        if stat.st_size != entry["size"]:
+            return False
+        if not full and stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        return file_sha256(local_path) == entry["sha256"]
+
+    def record(self, local_path, source):
+        stat = os.stat(local_path)
+        entry = {
+            "source": source,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(local_path),
+        }
+        with self._lock:
+            self.entries[os.path.basename(local_path)] = entry
+
+    def forget(self, local_path):
+        with self._lock:
+            self.entries.pop(os.path.basename(local_path), None)
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def _content_range_total(header):
+    """Total size from a Content-Range header such as 'bytes 100-199/200' or 'bytes */200'."""
+    try:
+        return int(header.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _transfer(url, part_path, timeout):
+    """
+    Download url into part_path, resuming from its current size with an HTTP
+    Range request. Returns bytes transferred, or None on 404.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    r = _session().get(url, stream=True, timeout=timeout, headers=headers)
+    with r:
+        if r.status_code == 404:
+            return None
+        if r.status_code == 416:
+            # Nothing left to fetch if the partial already holds the whole file
+            if _content_range_total(r.headers.get("Content-Range")) == offset:
+                return 0
+            os.remove(part_path)
+            raise IncompleteDownload(f"partial file is larger than {url}")
+        r.raise_for_status()
+
+        if r.status_code == 206:
+            mode, expected = "ab", _content_range_total(r.headers.get("Content-Range"))
+        else:
+            # Server ignored the Range header: start over
+            mode, offset = "wb", 0
+            length = r.headers.get("Content-Length")
+            expected = int(length) if length and not r.headers.get("Content-Encoding") else None
+
+        written = 0
+        with open(part_path, mode) as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                written += len(chunk)
+
+    if expected is not None and offset + written != expected:
+        raise IncompleteDownload(f"got {offset + written} of {expected} bytes from {url}")
+    return written
+
+
+def _fetch(file_path, local_path, pool, retries, backoff, timeout):
+    """
+    Fetch one file, walking mirrors best-first. Data goes to a .part file
+    that is resumed across attempts and atomically renamed once complete.
+    Returns bytes transferred.
+    """
+    part_path = local_path + PART_SUFFIX
+    last_error = None
+    for attempt in range(retries):
+        not_found = 0
+        mirrors = pool.ranked()
+        for mirror in mirrors:
+            url = mirror.base + file_path
+            with mirror.slots:
+                start = time.perf_counter()
+                try:
+                    written = _transfer(url, part_path, timeout)
+                except (requests.exceptions.RequestException, IncompleteDownload) as e:
+                    pool.record(mirror, time.perf_counter() - start, ok=False)
+                    last_error = e
+                    continue
+            if written is None:
+                # A missing file says nothing about mirror health
+                not_found += 1
+                continue
+            pool.record(mirror, time.perf_counter() - start, ok=True)
+            os.replace(part_path, local_path)
+            return written
+
+        if not_found == len(mirrors):
+            raise ProfileNotFound(f"Profile {file_path} not found on any GDAC mirror")
+        if attempt + 1 < retries:
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+    raise RuntimeError(f"Profile {file_path} failed after {retries} attempts: {last_error}")
+
+
+def _get(file_path, local_path, manifest, pool, retries, backoff, timeout, force, verify_hash):
+    """
+    Return (local_path, bytes transferred), with None bytes for a verified
+    cache hit. Corrupt cache entries are deleted and re-fetched. Files that
+    predate the manifest are checked by resuming from their current size;
+    if no mirror can be reached they are kept as they are.
+    """
+    part_path = local_path + PART_SUFFIX
+    if force:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    elif manifest.verify(local_path, full=verify_hash):
+        return local_path, None
+    elif local_path in manifest:
+        print(f"⚠️ Cache entry failed verification, re-fetching: {local_path}")
+        manifest.forget(local_path)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+    elif os.path.exists(local_path):
+        shutil.copyfile(local_path, part_path)
+        try:
+            written = _fetch(file_path, local_path, pool, retries, backoff, timeout)
+        except Exception as e:
+            print(f"⚠️ Keeping unverified {local_path}: {e}")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return local_path, None
+        manifest.record(local_path, file_path)
+        return local_path, written
+
+    written = _fetch(file_path, local_path, pool, retries, backoff, timeout)
+    manifest.record(local_path, file_path)
+    return local_path, written
+
+
+def download_profile(file_path, save_dir="../data/raw/profiles", pool=None,
+                     retries=3, backoff=0.5, timeout=60, force=False, verify_hash=False):
     os.makedirs(save_dir, exist_ok=True)
     local_path = os.path.join(save_dir, os.path.basename(file_path))
+    manifest = DownloadManifest(save_dir)
 
-    if os.path.exists(local_path):
+    pool = pool or _default_pool
+    try:
+        local_path, written = _get(file_path, local_path, manifest, pool, retries,
+                                   backoff, timeout, force, verify_hash)
+    finally:
+        manifest.save()
+    if written is None:
         print(f"✅ Already exists: {local_path}")
-        return local_path
+    else:
+        print(f"✅ Downloaded {file_path}")
+    return local_path
 
-    for base in GDAC_MIRRORS:
-        url = base + file_path
-        print(f"🔎 Trying {url} ...")
-        try:
-            r = requests.get(url, stream=True, timeout=60)
-            if r.status_code == 200:
-                with open(local_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                print(f"✅ Downloaded from {base}")
-                return local_path
-            else:
-                print(f"❌ Not found at {base} (status {r.status_code})")
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️ Error with {base}: {e}")
 
-    raise RuntimeError(f"Profile {file_path} not found on any GDAC mirror")
+def download_profiles(file_paths, save_dir="../data/raw/profiles", mirrors=None,
+                      max_workers=16, per_mirror_limit=8, retries=3, backoff=0.5,
+                      timeout=60, pool=None, force=False, verify_hash=False):
+    """
+    Download many index paths concurrently over keep-alive sessions.
+
+    Mirrors are tried best-first by observed latency and error rate, with at
+    most `per_mirror_limit` requests in flight against any one of them.
+    Pass a `pool` to carry mirror rankings over between calls, and `force`
+    to re-fetch files that already exist locally. Cache hits are checked
+    against the save_dir's download manifest (size + mtime, or a full sha256
+    with verify_hash=True); corrupt entries are re-fetched and interrupted
+    transfers resume from their .part file.
+    Returns a dict with the local paths, failures and throughput figures.
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    pool = pool or MirrorPool(mirrors or GDAC_MIRRORS, per_mirror_limit, failure_penalty=timeout)
+
+    manifest = DownloadManifest(save_dir)
 
-def parse_profile(nc_path):
-    ds = xr.open_dataset(nc_path)
+    paths, failed = {}, {}
+    cached = downloaded = total_bytes = 0
 
-    def safe_get(var):
-        return ds[var].values.flatten() if var in ds.variables else None
+    def work(file_path):
+        local_path = os.path.join(save_dir, os.path.basename(file_path))
+        return _get(file_path, local_path, manifest, pool, retries, backoff, timeout,
+                    force, verify_hash)
 
-    return {
-        "PRES": safe_get("PRES"),
-        "TEMP": safe_get("TEMP"),
-        "PSAL": safe_get("PSAL"),  # may be None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(work, fp): fp for fp in file_paths}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                local_path, written = future.result()
+            except Exception as e:
+                print(f"❌ Error with {file_path}: {e}")
+                failed[file_path] = str(e)
+                continue
+            paths[file_path] = local_path
+            if written is None:
+                cached += 1
+            else:
+                downloaded += 1
+                total_bytes += written
+    elapsed = time.perf_counter() - start
+    manifest.save()
+
+    report = {
+        "paths": paths,
+        "failed": failed,
+        "downloaded": downloaded,
+        "cached": cached,
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "files_per_s": downloaded / elapsed if elapsed else 0.0,
+        "mb_per_s": total_bytes / 1e6 / elapsed if elapsed else 0.0,
+        "mirrors": pool.summary(),
     }
+    print(
+        f"✅ Downloaded {downloaded} files ({total_bytes / 1e6:.1f} MB) in {elapsed:.1f}s "
+        f"— {report['files_per_s']:.1f} files/s, {report['mb_per_s']:.2f} MB/s "
+        f"({cached} cached, {len(failed)} failed)"
+    )
+    return report
+
+
+CORE_VARIABLES = ("PRES", "TEMP", "PSAL")
+
+
+def _read_variable(var):
+    """Flattened values of one netCDF4 variable with _FillValue masked to NaN."""
+    var.set_auto_maskandscale(False)
+    data = var[:].reshape(-1)
+    if data.dtype.kind not in "fiu":
+        return data  # QC flags come back as raw bytes, b" " where unset
+
+    fill = getattr(var, "_FillValue", None)
+    scale = getattr(var, "scale_factor", None)
+    offset = getattr(var, "add_offset", None)
+    if data.dtype.kind != "f":
+        data = data.astype(np.float64 if scale is not None or offset is not None else np.float32)
+    else:
+        data = data.copy()
+    if fill is not None:
+        data[data == fill] = np.nan
+    if scale is not None:
+        data *= scale
+    if offset is not None:
+        data += offset
+    return data
+
+
+def _requested(variables, counterparts):
+    names = []
+    for name in variables:
+        names.append(name)
+        if counterparts:
+            names += [f"{name}_QC", f"{name}_ADJUSTED", f"{name}_ADJUSTED_QC"]
+    return names
+
+
+def decode_profile(nc_path, variables=CORE_VARIABLES, counterparts=True):
+    """
+    Fast path: read only `variables` (and their _QC / _ADJUSTED / _ADJUSTED_QC
+    counterparts) straight from netCDF4, without building an xarray dataset.
+    Variables missing from the file come back as None.
+    """
+    with netCDF4.Dataset(nc_path) as ds:
+        return {
+            name: _read_variable(ds.variables[name]) if name in ds.variables else None
+            for name in _requested(variables, counterparts)
+        }
+
+
+def _parse_profile_xarray(nc_path, variables=CORE_VARIABLES, counterparts=False):
+    with xr.open_dataset(nc_path) as ds:
+        def safe_get(var):
+            return ds[var].values.flatten() if var in ds.variables else None
+
+        return {name: safe_get(name) for name in _requested(variables, counterparts)}
+
+
+def parse_profile(nc_path, variables=CORE_VARIABLES, counterparts=False):
+    """Decode PRES/TEMP/PSAL (PSAL may be None); falls back to xarray for odd files."""
+    try:
+        return decode_profile(nc_path, variables, counterparts)
+    except Exception:
+        return _parse_profile_xarray(nc_path, variables, counterparts)
 
 if __name__ == "__main__":
+    import argparse
     from load_index import load_argo_index
+
+    parser = argparse.ArgumentParser(description="Download and parse Argo profiles")
+    parser.add_argument("--mirror", action="append", help="Override GDAC mirror base URL (repeatable)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--per-mirror", type=int, default=8)
+    args = parser.parse_args()
+
     df = load_argo_index()
-    for idx, row in df.iterrows():
-        file_path = row["file"]
-        if not isinstance(file_path, str) or file_path.strip() == "":
+    files = [f for f in df["file"] if isinstance(f, str) and f.strip() != ""]
+    report = download_profiles(files, mirrors=args.mirror, max_workers=args.workers,
+                               per_mirror_limit=args.per_mirror)
+    for idx, file_path in enumerate(files):
+        if file_path not in report["paths"]:
             continue
         try:
             print(f"=== Processing profile {idx + 1}: {file_path} ===")
-            nc_path = download_profile(file_path)
-            data = parse_profile(nc_path)
+            data = parse_profile(report["paths"][file_path])
             print(data)
         except Exception as e:
             print(f"❌ Error with {file_path}: {e}")
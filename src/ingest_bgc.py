@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from processed_store import BGC_COLUMNS, BGC_FILE_PREFIX, STORE_DIR, StoreWriter
+
+# Ingests ERDDAP-style wide exports (one row per level, *_qc and *_adjusted
+# columns side by side) such as ArgoFloats_1740_128e_c78f.csv into the same
+# processed store as the core profiles.
+
+# Argo QC flags kept: good, probably good, changed, interpolated/estimated
+GOOD_QC = [1, 2, 5, 8]
+# Data modes whose *_adjusted values supersede the raw ones
+ADJUSTED_MODES = ["A", "D"]
+
+# store column: export variable
+VARIABLES = {
+    "pressure": "pres",
+    "temperature": "temp",
+    "salinity": "psal",
+    "doxy": "doxy",
+    "chla": "chla",
+    "nitrate": "nitrate",
+    "turbidity": "turbidity",
+}
+META_COLUMNS = ["platform_number", "cycle_number", "direction", "data_mode",
+                "wmo_inst_type", "time", "latitude", "longitude"]
+
+
+def _export_columns(header):
+    wanted = set(META_COLUMNS)
+    for var in VARIABLES.values():
+        wanted |= {var, f"{var}_qc", f"{var}_adjusted", f"{var}_adjusted_qc"}
+    return [c for c in header if c in wanted]
+
+
+def ocean_code(lat, lon):
+    """Coarse basin boxes giving the index's one-letter ocean codes."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = ((np.asarray(lon, dtype=np.float64) + 180) % 360) - 180
+    return np.select(
+        [
+            lat >= 66,
+            lat <= -60,
+            (lon >= 20) & (lon < 147) & (lat < 30),
+            ((lon >= -70) & (lon < 20)) | ((lon >= -100) & (lon < -70) & (lat > 8)),
+        ],
+        ["N", "S", "I", "A"],
+        default="P",
+    )
+
+
+def select_variable(chunk, var, use_adjusted):
+    """
+    Vectorized value choice for one variable: in adjusted/delayed mode only
+    *_adjusted (with *_adjusted_qc) is used, since a missing adjusted value
+    there means the raw value is bad; in real-time mode the raw value with
+    its QC. Variables exported without *_adjusted columns (the BGC ones,
+    whose data_mode is the core profile's) always use the raw value.
+    NaN wherever the QC flag is not in GOOD_QC.
+    """
+    if var not in chunk:
+        return np.full(len(chunk), np.nan, dtype=np.float32)
+    missing = np.full(len(chunk), np.nan, dtype=np.float32)
+    values = chunk[var].to_numpy(dtype=np.float32, na_value=np.nan)
+    qc = chunk[f"{var}_qc"].to_numpy(dtype=np.float32, na_value=np.nan) if f"{var}_qc" in chunk \
+        else missing
+
+    if f"{var}_adjusted" in chunk:
+        adjusted = chunk[f"{var}_adjusted"].to_numpy(dtype=np.float32, na_value=np.nan)
+        adjusted_qc = chunk[f"{var}_adjusted_qc"].to_numpy(dtype=np.float32, na_value=np.nan) \
+            if f"{var}_adjusted_qc" in chunk else missing
+        values = np.where(use_adjusted, adjusted, values)
+        qc = np.where(use_adjusted, adjusted_qc, qc)
+
+    # Variables that carry no QC at all (NaN flag on a present value) are dropped too
+    return np.where(np.isin(qc, GOOD_QC), values, np.float32(np.nan)).astype(np.float32)
+
+
+def transform_chunk(chunk):
+    """Turn one chunk of the wide export into store rows; levels without a cycle number are dropped."""
+    chunk = chunk[chunk["cycle_number"].notna()]
+    use_adjusted = chunk["data_mode"].isin(ADJUSTED_MODES).to_numpy()
+    out = {name: select_variable(chunk, var, use_adjusted) for name, var in VARIABLES.items()}
+
+    platform = chunk["platform_number"].astype(str)
+    cycle = chunk["cycle_number"].astype(int).map("{:03d}".format)
+    descending = np.where(chunk["direction"].astype(str) == "D", "D", "")
+    mode = chunk["data_mode"].astype(str)
+    df = pd.DataFrame({
+        # GDAC-style B-file name; the export carries no DAC directory
+        "float_file": BGC_FILE_PREFIX + platform + "/profiles/B" + mode + platform + "_" + cycle + descending + ".nc",
+        "date": pd.to_datetime(chunk["time"], format="ISO8601", utc=True, errors="coerce"),
+        "lat": chunk["latitude"].to_numpy(dtype=np.float64),
+        "lon": chunk["longitude"].to_numpy(dtype=np.float64),
+        "ocean": ocean_code(chunk["latitude"], chunk["longitude"]),
+        "profiler_type": chunk["wmo_inst_type"],
+        **out,
+    })
+    # A level without a usable pressure can't be placed in the profile
+    return df[~np.isnan(out["pressure"])]
+
+
+def ingest_bgc_csv(path="../data/raw/ArgoFloats_1740_128e_c78f.csv", store_dir=STORE_DIR,
+                   chunksize=1_000_000, max_rows=500_000):
+    """
+    Stream a wide BGC export into the processed store in `chunksize`-row
+    chunks. Profiles already ingested from an earlier run of the same export
+    are replaced rather than duplicated.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    columns = _export_columns(header)
+    dtypes = {c: np.float32 for c in columns if c not in META_COLUMNS}
+    dtypes.update({"platform_number": str, "direction": str, "data_mode": str})
+
+    writer = StoreWriter(store_dir, max_rows=max_rows, replace=False)
+    levels = kept = no_cycle = 0
+    with writer:
+        # Row 1 is ERDDAP's units row
+        for chunk in pd.read_csv(path, skiprows=[1], usecols=columns, dtype=dtypes, chunksize=chunksize):
+            no_cycle += int(chunk["cycle_number"].isna().sum())
+            df = transform_chunk(chunk)
+            writer.drop_files.update(df["float_file"].unique())
+            writer.write(df)
+            levels += len(chunk)
+            kept += len(df)
+
+    present = [c for c in BGC_COLUMNS if VARIABLES[c] in header]
+    if no_cycle:
+        print(f"⚠️ Skipped {no_cycle} levels without a cycle number")
+    print(f"✅ Ingested {kept}/{levels} levels from {path} into {store_dir} (BGC: {', '.join(present) or 'none'})")
+    return {"levels": levels, "rows": kept, "no_cycle": no_cycle}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest an ERDDAP wide BGC export into the processed store")
+    parser.add_argument("path", nargs="?", default="../data/raw/ArgoFloats_1740_128e_c78f.csv")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    ingest_bgc_csv(args.path, chunksize=args.chunksize)
@@ -1,11 +1,102 @@
+import hashlib
+import json
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def load_argo_index(path="../data/raw/ArgoFloats-index.csv"):
-    df = pd.read_csv(path)
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    df['date_update'] = pd.to_datetime(df['date_update'], errors='coerce')
+CATEGORICAL_COLUMNS = ["ocean", "institution", "profiler_type"]
+COORDINATE_COLUMNS = ["latitude", "longitude"]
+DATE_COLUMNS = ["date", "date_update"]
+
+# Parquet schema metadata key recording which CSV the cache was built from
+CACHE_SOURCE_KEY = b"floatchat.index_source"
+
+
+def _has_units_row(path):
+    """ERDDAP exports put a units row (",UTC,degrees_north,...") under the header."""
+    with open(path, encoding="utf-8-sig") as f:
+        f.readline()
+        second = f.readline().rstrip("\n").split(",")
+    return "UTC" in second or "degrees_north" in second
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def parse_argo_index(path):
+    """Parse the index CSV into typed columns, dropping the units row."""
+    df = pd.read_csv(
+        path,
+        encoding="utf-8-sig",
+        skiprows=[1] if _has_units_row(path) else None,
+        dtype={
+            **{c: "category" for c in CATEGORICAL_COLUMNS},
+            **{c: "float32" for c in COORDINATE_COLUMNS},
+            "file": str,
+        },
+    )
+    for col in DATE_COLUMNS:
+        df[col] = pd.to_datetime(df[col], format="ISO8601", utc=True, errors="coerce")
+    return df
+
+
+def _cached_source(cache_path):
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+        return json.loads(metadata[CACHE_SOURCE_KEY])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(df, cache_path, source):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), CACHE_SOURCE_KEY: json.dumps(source).encode()}
+    tmp_path = cache_path + ".tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def load_argo_index(path="../data/raw/ArgoFloats-index.csv", cache_path=None, use_cache=True):
+    """
+    Load the Argo index with typed columns: categorical ocean / institution /
+    profiler_type, float32 coordinates and UTC datetimes.
+
+    The parsed index is cached as Parquet next to the CSV. The cache is
+    reused while the CSV's size and mtime match; if only the mtime moved, a
+    matching content hash still counts as a hit.
+    """
+    if not use_cache:
+        return parse_argo_index(path)
+
+    cache_path = cache_path or os.path.splitext(path)[0] + ".parquet"
+    stat = os.stat(path)
+    source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    cached = _cached_source(cache_path)
+    if cached is not None:
+        if cached["size"] == source["size"] and cached["mtime_ns"] == source["mtime_ns"]:
+            return pd.read_parquet(cache_path)
+        source["sha256"] = _sha256(path)
+        if cached.get("sha256") == source["sha256"]:
+            df = pd.read_parquet(cache_path)
+            _write_cache(df, cache_path, source)
+            return df
+
+    df = parse_argo_index(path)
+    source.setdefault("sha256", _sha256(path))
+    try:
+        _write_cache(df, cache_path, source)
+    except OSError as e:
+        print(f"⚠️ Could not write index cache {cache_path}: {e}")
     return df
 
 if __name__ == "__main__":
     df = load_argo_index()
     print(df.head())
+    print(df.dtypes)
@@ -0,0 +1,90 @@
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for a GDAC mirror. Any request path is resolved by basename
+# against a flat directory of .nc files, so "aoml/13857/profiles/R13857_001.nc"
+# is served from data/raw/profiles/R13857_001.nc.
+
+
+def _make_handler(profile_dir, latency, fail_rate):
+    class MirrorHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            if fail_rate and random.random() < fail_rate:
+                self.send_error(503, "Injected failure")
+                return
+
+            local_path = os.path.join(profile_dir, os.path.basename(self.path))
+            if not os.path.isfile(local_path):
+                self.send_error(404, "Not found")
+                return
+
+            with open(local_path, "rb") as f:
+                body = f.read()
+            size = len(body)
+
+            # Open-ended "bytes=N-" ranges, enough for resumed downloads
+            range_header = self.headers.get("Range", "")
+            if range_header.startswith("bytes=") and range_header.endswith("-"):
+                offset = int(range_header[len("bytes="):-1])
+                if offset >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {offset}-{size - 1}/{size}")
+                body = body[offset:]
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "application/x-netcdf")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MirrorHandler
+
+
+def serve_profiles(profile_dir="../data/raw/profiles", host="127.0.0.1", port=0,
+                   latency=0.0, fail_rate=0.0):
+    """
+    Start a threaded HTTP server in the background.
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    handler = _make_handler(os.path.abspath(profile_dir), latency, fail_rate)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/dac/"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve local profiles as a GDAC mirror")
+    parser.add_argument("--dir", default="../data/raw/profiles")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server, base_url = serve_profiles(args.dir, port=args.port, latency=args.latency,
+                                      fail_rate=args.fail_rate)
+    print(f"🌊 Serving {args.dir} at {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,51 +1,347 @@
+import json
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-from fetch_profiles import download_profile, parse_profile
+from fetch_profiles import download_profiles, file_sha256, parse_profile
 from load_index import load_argo_index
+from processed_store import (BGC_FILE_PREFIX, MEASUREMENT_COLUMNS, STORE_DIR, StoreWriter, partition_path,
+                             read_store)
+
+PROCESSED_CSV = "../data/processed/argo_clean.csv"
+MANIFEST_PATH = "../data/processed/ingest_manifest.json"
+
+# Files that failed to download or decode are retried after 1h, 2h, 4h, ... up to a week
+RETRY_BACKOFF_S = 3600
+MAX_RETRY_BACKOFF_S = 7 * 24 * 3600
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """
+    Ingested files keyed by index path: {date_update, sha256, rows, partition}.
+    Files whose last attempt failed also carry failed: {error, attempts, retry_after}.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["files"]
+
+
+def save_manifest(files, path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"files": files}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _date_key(value):
+    return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+
+
+def record_failure(manifest, file_path, date_update, error, now=None):
+    """
+    Mark file_path as failed at this date_update, doubling its retry delay on
+    every consecutive failure. Rows from an earlier successful ingest are kept.
+    """
+    entry = dict(manifest.get(file_path) or {})
+    attempts = entry.get("failed", {}).get("attempts", 0) + 1
+    delay = min(RETRY_BACKOFF_S * 2 ** (attempts - 1), MAX_RETRY_BACKOFF_S)
+    entry["date_update"] = _date_key(date_update)
+    entry["failed"] = {
+        "error": str(error),
+        "attempts": attempts,
+        "retry_after": (now or time.time()) + delay,
+    }
+    manifest[file_path] = entry
+
+
+def plan_incremental(df_index, manifest, now=None):
+    """
+    Compare the index against the manifest.
+    Returns (new, updated, retired) lists of index paths. Failed files are
+    retried once their backoff has passed, or straight away if the index
+    has a newer date_update for them.
+    """
+    now = now or time.time()
+    new, updated = [], []
+    seen = set()
+    for file_path, date_update in zip(df_index["file"], df_index["date_update"]):
+        seen.add(file_path)
+        entry = manifest.get(file_path)
+        if entry is None:
+            new.append(file_path)
+        elif entry["date_update"] != _date_key(date_update):
+            updated.append(file_path)
+        elif "failed" in entry and entry["failed"]["retry_after"] <= now:
+            # Re-fetched like an update: the local copy may be what failed to decode
+            updated.append(file_path)
+    retired = [f for f in manifest if f not in seen]
+    return new, updated, retired
+
+
+META_COLUMNS = {
+    # output column: index column
+    "float_file": "file",
+    "date": "date",
+    "lat": "latitude",
+    "lon": "longitude",
+    "ocean": "ocean",
+    "profiler_type": "profiler_type",
+}
+CATEGORICAL_COLUMNS = ["float_file", "ocean", "profiler_type"]
+CSV_COLUMNS = list(META_COLUMNS) + MEASUREMENT_COLUMNS
+
+# Profiles are flattened and handed to the store writer in batches of this many rows
+FLATTEN_ROWS = 50_000
+
+
+def profile_arrays(profile):
+    """
+    Per-level float32 columns (pressure, temperature, salinity) for one profile.
+    Missing PSAL becomes NaN; unequal lengths are cut to the shortest.
+    """
+    pres, temp, psal = profile.get("PRES"), profile.get("TEMP"), profile.get("PSAL")
+    if pres is None or temp is None:
+        raise ValueError("profile has no PRES/TEMP")
+    pres = np.asarray(pres, dtype=np.float32)
+    temp = np.asarray(temp, dtype=np.float32)
+    psal = (np.full(len(pres), np.nan, dtype=np.float32) if psal is None
+            else np.asarray(psal, dtype=np.float32))
+    n = min(len(pres), len(temp), len(psal))
+    return pres[:n], temp[:n], psal[:n]
+
+
+def flatten_profiles(df_meta, arrays):
+    """
+    Build the long per-level table from one metadata row and one
+    (pres, temp, psal) tuple per profile. Metadata is broadcast by repeating
+    row positions rather than copied into per-level records.
+    """
+    counts = np.fromiter((len(a[0]) for a in arrays), dtype=np.int64, count=len(arrays))
+    meta = df_meta[list(META_COLUMNS.values())].rename(
+        columns={v: k for k, v in META_COLUMNS.items()}
+    ).reset_index(drop=True)
+    for col in CATEGORICAL_COLUMNS:
+        meta[col] = meta[col].astype("category")
+    for col in ("lat", "lon"):
+        # Widen float32 index coordinates through their shortest repr so 0.267 stays 0.267
+        meta[col] = pd.to_numeric(meta[col].astype(str), errors="coerce")
+
+    df = meta.take(np.repeat(np.arange(len(meta)), counts)).reset_index(drop=True)
+    for k, name in enumerate(MEASUREMENT_COLUMNS):
+        df[name] = (np.concatenate([a[k] for a in arrays]) if arrays
+                    else np.empty(0, dtype=np.float32))
+    return df
+
+
+def _parse_task(task):
+    """
+    Process-pool worker: hash and decode one file.
+    Returns (sha256, arrays, error); arrays is None when the hash matches
+    `known_sha256` (nothing to re-parse) or decoding failed.
+    """
+    nc_path, known_sha256 = task
+    try:
+        sha256 = file_sha256(nc_path)
+        if sha256 == known_sha256:
+            return sha256, None, None
+        return sha256, profile_arrays(parse_profile(nc_path)), None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def _parse_chunk(tasks):
+    return [_parse_task(task) for task in tasks]
 
-def build_clean_dataset():
+
+def parse_profiles(tasks, workers=None, chunksize=8):
+    """
+    Decode (nc_path, known_sha256) tasks across a process pool.
+
+    Yields one (sha256, arrays, error) per task in input order; a failing file
+    yields its error instead of aborting the batch. workers=1 runs in-process.
+    Tasks are submitted `chunksize` at a time with at most two chunks per
+    worker in flight, so decoded profiles never pile up ahead of the consumer.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        yield from map(_parse_task, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for start in range(0, len(tasks), chunksize):
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+            in_flight.append(executor.submit(_parse_chunk, tasks[start:start + chunksize]))
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def build_clean_dataset(incremental=False, mirrors=None, workers=None, chunksize=8,
+                        csv=False, max_rows=500_000):
+    """
+    Build the partitioned Parquet store (data/processed/argo_store) from the
+    Argo index, streaming profiles to disk as they are parsed so memory stays
+    bounded by `max_rows` buffered rows. csv=True also exports argo_clean.csv.
+
+    With incremental=True only profiles whose `date_update` is new or changed
+    since the last run are downloaded and parsed, rows for files that left the
+    index are retired, and the rest of the store is kept as is. Falls back to
+    a full rebuild when there is no manifest or store yet.
+
+    Files are decoded on `workers` processes (default: all cores), handed out
+    `chunksize` at a time.
+    """
     df_index = load_argo_index()
-    
+
     # Drop rows where 'file' is NaN
     df_index = df_index.dropna(subset=["file"])
-    records = []
-    for i, row in df_index.iterrows():
-        file_path = row["file"]
-        if not isinstance(file_path, str):
-            print(f"Skipping invalid file path: {file_path}")
-            continue
-
-        try:
-            print(f"=== Processing profile {i+1}: {file_path} ===")
-            nc_path = download_profile(file_path)
-            profile = parse_profile(nc_path)
-
-            pres = profile.get("PRES", [])
-            temp = profile.get("TEMP", [])
-            psal = profile.get("PSAL") or [None] * len(pres)  # Handle missing PSAL
-
-            for p, t, s in zip(pres, temp, psal):
-                records.append({
-                    "float_file": file_path,
-                    "date": row["date"],
-                    "lat": row["latitude"],
-                    "lon": row["longitude"],
-                    "ocean": row["ocean"],
-                    "profiler_type": row["profiler_type"],
-                    "pressure": p,
-                    "temperature": t,
-                    "salinity": s
-                })
-                
-        except Exception as e:
-            print(f"❌ Error with {file_path}: {e}")
-            
-    df_clean = pd.DataFrame(records)
-    os.makedirs("../data/processed", exist_ok=True)
-    df_clean.to_csv("../data/processed/argo_clean.csv", index=False)
-    print(f"✅ Saved cleaned dataset with {len(df_clean)} rows to data/processed/argo_clean.csv")
-    return df_clean
+    df_index = df_index[df_index["file"].map(lambda f: isinstance(f, str))]
+
+    manifest = load_manifest() if incremental else {}
+    if incremental and not (manifest and os.path.exists(STORE_DIR)):
+        print("⚠️ No previous ingest found, doing a full rebuild.")
+        incremental = False
+        manifest = {}
+
+    if incremental:
+        new, updated, retired = plan_incremental(df_index, manifest)
+        print(f"🔄 Incremental refresh: {len(new)} new, {len(updated)} updated, {len(retired)} retired")
+        todo = set(new) | set(updated)
+        df_todo = df_index[df_index["file"].isin(todo)]
+    else:
+        updated, retired = [], []
+        df_todo = df_index
+
+    # Updated files must be re-fetched: the local copy is the old version
+    updated_set = set(updated)
+    fresh = [f for f in df_todo["file"].unique() if f not in updated_set]
+    report = download_profiles(fresh, mirrors=mirrors)
+    fetched, download_errors = report["paths"], report["failed"]
+    if updated:
+        report = download_profiles(updated, mirrors=mirrors, force=True)
+        fetched.update(report["paths"])
+        download_errors.update(report["failed"])
+    for file_path, date_update in zip(df_todo["file"], df_todo["date_update"]):
+        if file_path not in fetched:
+            record_failure(manifest, file_path, date_update,
+                           download_errors.get(file_path, "download failed"))
+
+    jobs = [(i, row) for i, row in df_todo.iterrows() if row["file"] in fetched]
+    tasks = [
+        (fetched[row["file"]], manifest.get(row["file"], {}).get("sha256"))
+        for _, row in jobs
+    ]
+
+    # Rows of retired and re-parsed files are dropped from the partitions
+    # they were written to when the writer commits
+    writer = StoreWriter(
+        STORE_DIR, max_rows=max_rows, replace=not incremental,
+        drop_files=retired,
+        drop_partitions={manifest[f].get("partition") for f in retired} - {None},
+    )
+    csv_path = PROCESSED_CSV if csv and not incremental else None
+    if csv_path and os.path.exists(csv_path):
+        os.remove(csv_path)
+
+    def emit(rows, arrays):
+        df = flatten_profiles(df_todo.loc[rows], arrays)
+        writer.write(df)
+        if csv_path:
+            csv_rows(df).to_csv(csv_path, mode="a", header=not os.path.exists(csv_path), index=False)
+
+    with writer:
+        parsed_rows, arrays, pending = [], [], 0
+        for (i, row), (sha256, columns, error) in zip(jobs, parse_profiles(tasks, workers, chunksize)):
+            file_path = row["file"]
+            if error is not None:
+                print(f"❌ Error with {file_path}: {error}")
+                record_failure(manifest, file_path, row["date_update"], error)
+                continue
+            if columns is None:
+                # date_update moved but the content did not; keep existing rows
+                manifest[file_path]["date_update"] = _date_key(row["date_update"])
+                manifest[file_path].pop("failed", None)
+                continue
+
+            print(f"=== Processed profile {i+1}: {file_path} ===")
+            parsed_rows.append(i)
+            arrays.append(columns)
+            pending += len(columns[0])
+            previous = manifest.get(file_path)
+            if previous is not None and previous.get("partition"):
+                writer.drop_files.add(file_path)
+                writer.drop_partitions.add(previous["partition"])
+            manifest[file_path] = {
+                "date_update": _date_key(row["date_update"]),
+                "sha256": sha256,
+                "rows": len(columns[0]),
+                "partition": partition_path(row["ocean"], pd.Timestamp(row["date"]).year
+                                            if pd.notna(row["date"]) else None),
+            }
+            if pending >= FLATTEN_ROWS:
+                emit(parsed_rows, arrays)
+                parsed_rows, arrays, pending = [], [], 0
+
+        if arrays:
+            emit(parsed_rows, arrays)
+
+    for file_path in retired:
+        manifest.pop(file_path, None)
+    save_manifest(manifest)
+    failed = sum("failed" in entry for entry in manifest.values())
+    print(f"✅ Wrote {writer.rows} rows to {STORE_DIR}" + (f" ({failed} files failed, will retry)" if failed else ""))
+
+    if csv and incremental:
+        export_csv(df_index)
+    return {
+        "rows": writer.rows,
+        "profiles": sum("sha256" in entry for entry in manifest.values()),
+        "failed": failed,
+        "store": STORE_DIR,
+    }
+
+
+def csv_rows(df):
+    """
+    argo_clean.csv rows of a flattened or store frame: core profiles only
+    (BGC export rows stay in the store), profiler_type as a float ("845.0")
+    the way the CSV has always written it.
+    """
+    df = df[~df["float_file"].astype(str).str.startswith(BGC_FILE_PREFIX)][CSV_COLUMNS].copy()
+    df["profiler_type"] = df["profiler_type"].astype("float64")
+    return df
+
+
+def export_csv(df_index=None, path=PROCESSED_CSV):
+    """Export the core profiles in the store as argo_clean.csv, rows grouped in index order."""
+    df = csv_rows(read_store(STORE_DIR, columns=CSV_COLUMNS))
+    if df_index is not None:
+        order = {f: n for n, f in enumerate(df_index["file"])}
+        df = df.sort_values("float_file", key=lambda s: s.map(order), kind="stable")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(path, index=False)
+    print(f"✅ Saved cleaned dataset with {len(df)} rows to {path}")
 
 if __name__ == "__main__":
-    df = build_clean_dataset()
-    print(df.head())
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the cleaned Argo dataset")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only ingest profiles that are new or updated since the last run")
+    parser.add_argument("--mirror", action="append", help="Override GDAC mirror base URL (repeatable)")
+    parser.add_argument("--workers", type=int, default=None, help="Decoder processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=8, help="Files handed to a worker at a time")
+    parser.add_argument("--csv", action="store_true", help="Also export data/processed/argo_clean.csv")
+    parser.add_argument("--max-rows", type=int, default=500_000, help="Rows buffered before a flush to Parquet")
+    args = parser.parse_args()
+
+    summary = build_clean_dataset(incremental=args.incremental, mirrors=args.mirror,
+                                  workers=args.workers, chunksize=args.chunksize,
+                                  csv=args.csv, max_rows=args.max_rows)
+    print(summary)
+    print(read_store(summary["store"]).head())
@@ -0,0 +1,182 @@
+import glob
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Processed per-level data as a hive-partitioned Parquet dataset:
+#   argo_store/ocean=A/year=1997/part-<run>.parquet
+STORE_DIR = "../data/processed/argo_store"
+PARTITION_COLUMNS = ["ocean", "year"]
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+MEASUREMENT_COLUMNS = ["pressure", "temperature", "salinity"]
+# Biogeochemical variables; null for core-only profiles
+BGC_COLUMNS = ["doxy", "chla", "nitrate", "turbidity"]
+# float_file prefix of rows ingested from wide BGC exports (ingest_bgc.py)
+BGC_FILE_PREFIX = "bgc/"
+
+STORE_SCHEMA = pa.schema(
+    [
+        ("float_file", pa.string()),
+        ("date", pa.timestamp("ns", tz="UTC")),
+        ("lat", pa.float64()),
+        ("lon", pa.float64()),
+        ("profiler_type", pa.int32()),
+    ]
+    + [(name, pa.float32()) for name in MEASUREMENT_COLUMNS + BGC_COLUMNS]
+)
+# What readers see: file columns plus the hive partition keys
+READ_SCHEMA = STORE_SCHEMA.append(pa.field("ocean", pa.string())).append(pa.field("year", pa.int32()))
+
+
+def partition_path(ocean, year):
+    ocean = NULL_PARTITION if pd.isna(ocean) else ocean
+    year = NULL_PARTITION if pd.isna(year) else int(year)
+    return f"ocean={ocean}/year={year}"
+
+
+def _to_table(df):
+    """Cast a long-table chunk (as built by preprocess) to STORE_SCHEMA."""
+    columns = {
+        "float_file": np.asarray(df["float_file"], dtype=object),
+        "date": pd.to_datetime(df["date"], utc=True),
+        "lat": pd.to_numeric(df["lat"], errors="coerce"),
+        "lon": pd.to_numeric(df["lon"], errors="coerce"),
+        "profiler_type": pd.to_numeric(
+            pd.Series(np.asarray(df["profiler_type"], dtype=object)), errors="coerce"
+        ).astype("Int32").to_numpy(),
+    }
+    for name in MEASUREMENT_COLUMNS + BGC_COLUMNS:
+        if name in df:
+            columns[name] = np.asarray(df[name], dtype=np.float32)
+        else:
+            columns[name] = np.full(len(df), np.nan, dtype=np.float32)
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=STORE_SCHEMA, preserve_index=False)
+
+
+class StoreWriter:
+    """
+    Streams long-table chunks into the partitioned store with bounded memory.
+
+    Chunks are buffered until `max_rows` rows are held, then split by
+    (ocean, year) and appended as one row group per partition. Output goes to
+    a staging directory and only becomes visible on close(): replace=True
+    swaps it in for the whole store, otherwise the new parts are added to it
+    after rows for `drop_files` have been removed from `drop_partitions` and
+    from every partition this writer wrote to.
+    """
+
+    def __init__(self, root=STORE_DIR, max_rows=500_000, replace=True,
+                 drop_files=(), drop_partitions=()):
+        self.root = root
+        self.max_rows = max_rows
+        self.replace = replace
+        self.drop_files = set(drop_files)
+        self.drop_partitions = set(drop_partitions)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.staging = f"{root}.staging-{self.run_id}"
+        self.rows = 0
+        self._buffer = []
+        self._buffered = 0
+        self._writers = {}
+        self._written = set()
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        self._buffer.append(df)
+        self._buffered += len(df)
+        if self._buffered >= self.max_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        df = pd.concat(self._buffer, ignore_index=True) if len(self._buffer) > 1 else self._buffer[0]
+        self._buffer, self._buffered = [], 0
+
+        years = pd.to_datetime(df["date"], utc=True).dt.year
+        keys = pd.DataFrame({"ocean": np.asarray(df["ocean"], dtype=object), "year": years})
+        for (ocean, year), positions in keys.groupby(["ocean", "year"], dropna=False, sort=False).indices.items():
+            part = partition_path(ocean, year)
+            table = _to_table(df.iloc[positions])
+            writer = self._writers.get(part)
+            if writer is None:
+                os.makedirs(os.path.join(self.staging, part), exist_ok=True)
+                path = os.path.join(self.staging, part, f"part-{self.run_id}.parquet")
+                writer = self._writers[part] = pq.ParquetWriter(path, STORE_SCHEMA)
+                self._written.add(part)
+            writer.write_table(table)
+            self.rows += len(table)
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        os.makedirs(self.staging, exist_ok=True)
+
+        if self.replace:
+            previous = f"{self.root}.old-{self.run_id}"
+            if os.path.exists(self.root):
+                os.replace(self.root, previous)
+            os.replace(self.staging, self.root)
+            shutil.rmtree(previous, ignore_errors=True)
+            return
+
+        if self.drop_files:
+            for part in self.drop_partitions | set(self._written):
+                _drop_from_partition(os.path.join(self.root, part), self.drop_files)
+        for path in glob.glob(os.path.join(self.staging, "*", "*", "*.parquet")):
+            target = os.path.join(self.root, os.path.relpath(path, self.staging))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _drop_from_partition(part_dir, float_files):
+    """Rewrite one partition without the rows of `float_files`."""
+    paths = glob.glob(os.path.join(part_dir, "*.parquet"))
+    if not paths:
+        return
+    table = pq.read_table(paths, schema=STORE_SCHEMA)
+    keep = pc.invert(pc.is_in(table["float_file"], pa.array(list(float_files), pa.string())))
+    if pc.all(keep).as_py() is not False:
+        return  # nothing to drop here
+    table = table.filter(keep)
+    if len(table):
+        pq.write_table(table, os.path.join(part_dir, f"part-{uuid.uuid4().hex[:8]}.parquet.tmp"))
+    for path in paths:
+        os.remove(path)
+    for tmp in glob.glob(os.path.join(part_dir, "*.parquet.tmp")):
+        os.replace(tmp, tmp[:-len(".tmp")])
+    if not os.listdir(part_dir):
+        os.rmdir(part_dir)
+
+
+def read_store(root=STORE_DIR, columns=None, filters=None):
+    """
+    Read the partitioned store with column projection and optional
+    partition/row-group filters, e.g. filters=[("ocean", "=", "A")].
+    """
+    return pd.read_parquet(root, columns=columns, filters=filters, schema=READ_SCHEMA)
@@ -1,10 +1,17 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from processed_store import read_store
 
-def plot_temp_salinity_by_float(csv_path="data/processed/argo_clean.csv"):
-    # Load dataset
-    df = pd.read_csv(csv_path)
+PLOT_COLUMNS = ["float_file", "pressure", "temperature", "salinity"]
+
+def plot_temp_salinity_by_float(store_path="data/processed/argo_store"):
+    # Load only the columns we plot; a CSV export still works
+    if store_path.endswith(".csv"):
+        df = pd.read_csv(store_path, usecols=PLOT_COLUMNS)
+    else:
+        df = read_store(store_path, columns=PLOT_COLUMNS)
+        df['float_file'] = df['float_file'].astype(object)
 
     # Convert to numeric, coerce errors
     df['salinity'] = pd.to_numeric(df['salinity'], errors='coerce')
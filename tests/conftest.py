@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The pipeline and backend modules import their siblings by bare name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("src", "backend"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from ingest_bgc import select_variable, transform_chunk
+
+
+def _rows(**columns):
+    base = {
+        "platform_number": ["1900001"], "cycle_number": [1.0], "direction": ["A"],
+        "data_mode": ["D"], "wmo_inst_type": [846.0], "time": ["2023-01-01T00:00:00Z"],
+        "latitude": [10.0], "longitude": [-150.0],
+        "pres": [5.0], "pres_qc": [1.0], "pres_adjusted": [5.1], "pres_adjusted_qc": [1.0],
+    }
+    base.update(columns)
+    return pd.DataFrame(base)
+
+
+def test_delayed_mode_uses_adjusted_value():
+    chunk = _rows(temp=[20.0], temp_qc=[1.0], temp_adjusted=[20.5], temp_adjusted_qc=[1.0])
+    out = select_variable(chunk, "temp", chunk["data_mode"].isin(["D"]).to_numpy())
+    assert out[0] == np.float32(20.5)
+
+
+def test_delayed_mode_missing_adjusted_value_is_dropped():
+    chunk = _rows(temp=[20.0], temp_qc=[1.0], temp_adjusted=[np.nan], temp_adjusted_qc=[4.0])
+    out = select_variable(chunk, "temp", np.array([True]))
+    assert np.isnan(out[0])
+
+
+def test_delayed_mode_without_adjusted_columns_keeps_raw_bgc_value():
+    chunk = _rows(doxy=[250.0], doxy_qc=[1.0])
+    df = transform_chunk(chunk)
+    assert df["doxy"].iloc[0] == np.float32(250.0)
+    assert df["pressure"].iloc[0] == np.float32(5.1)
+
+
+def test_raw_bgc_value_still_filtered_by_qc():
+    chunk = _rows(doxy=[250.0], doxy_qc=[4.0])
+    assert np.isnan(transform_chunk(chunk)["doxy"].iloc[0])
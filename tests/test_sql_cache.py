@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from sql_cache import SQLCache
+
+
+def _same_embedding(texts):
+    # Every question looks identical to the semantic tier; only the literal check can tell them apart
+    return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+@pytest.fixture
+def cache():
+    return SQLCache(embed=_same_embedding)
+
+
+def test_paraphrase_reuses_sql(cache):
+    cache.put("profiles in the pacific in 2023", "SELECT 1")
+    assert cache.get("show me profiles in the Pacific in 2023") == "SELECT 1"
+
+
+def test_synonymous_comparisons_reuse_sql(cache):
+    cache.put("surface temperature over 28", "SELECT 1")
+    assert cache.get("surface temperature more than 28") == "SELECT 1"
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("profiles in the pacific in 2023", "how many profiles in the pacific in 2023"),
+    ("surface temperature greater than 28", "surface temperature less than 28"),
+    ("surface temperature over 28", "surface temperature under 28"),
+    ("profiles with oxygen in the atlantic", "profiles without oxygen in the atlantic"),
+    ("average salinity in the indian ocean", "maximum salinity in the indian ocean"),
+    ("profiles deeper than 2000", "profiles at least 2000 deep"),
+])
+def test_different_operators_miss(cache, cached, asked):
+    cache.put(cached, "SELECT 1")
+    assert cache.get(asked) is None